@@ -29,12 +29,17 @@ INSTALLED_APPS = [
     "django.contrib.sessions",
     "django.contrib.messages",
     "django.contrib.staticfiles",
+    "django.contrib.postgres",
     "graphene_django",
     "prose",
 ]
 
 MIDDLEWARE = [
+    # the first one, so it measures checkouts of all middlewares
+    "jiri_one.db_pool.db_checkout_middleware",
     "django.middleware.security.SecurityMiddleware",
+    # before middlewares, which change content (it compresses the final one)
+    "jiri_one.compression.CompressionMiddleware",
     "django.contrib.sessions.middleware.SessionMiddleware",
     "django.middleware.common.CommonMiddleware",
     "django.middleware.csrf.CsrfViewMiddleware",
@@ -52,8 +57,10 @@ TEMPLATES = [
             BASE_DIR / "templates",
         ],
         "APP_DIRS": True,
+        # without "loaders" Django uses the cached loader (templates are compiled only
+        # once per process) and "debug" is DEBUG, so production doesn't collect debug
+        # info for every node
         "OPTIONS": {
-            "debug": True,
             "context_processors": [
                 "django.template.context_processors.debug",
                 "django.template.context_processors.request",
@@ -86,6 +93,13 @@ if SYSTEM_ENV == "PRODUCTION":  # settings for production server
     CSRF_COOKIE_SECURE = True
     SECURE_HSTS_PRELOAD = True
     STATIC_ROOT = "/srv/http/virtual/jiri.one/static"
+    # hashed names and .br/.gz siblings, see jiri_one/static_storage.py
+    STORAGES = {
+        "default": {"BACKEND": "django.core.files.storage.FileSystemStorage"},
+        "staticfiles": {
+            "BACKEND": "jiri_one.static_storage.PrecompressedManifestStaticFilesStorage"
+        },
+    }
     STATICFILES_DIRS = [
         "/srv/http/virtual/jiri.one/.venv/lib/python3.10/site-packages/django/contrib/admin/static",
     ]
@@ -134,6 +148,31 @@ else:  # settings for local development
     MEDIA_ROOT = os.getenv("MEDIA_ROOT", BASE_DIR / "files")
     MEDIA_URL = os.getenv("MEDIA_URL", "/files/")
 
+# Connections are taken from pool (psycopg 3), so requests don't wait for connection
+# setup, and their checkouts are measured, see jiri_one/db_pool.py (pool needs
+# CONN_MAX_AGE 0, connections are returned to pool after every request).
+DB_POOL_OPTIONS = {
+    "min_size": int(os.environ.get("DB_POOL_MIN_SIZE", 2)),
+    "max_size": int(os.environ.get("DB_POOL_MAX_SIZE", 10)),
+    "timeout": float(os.environ.get("DB_POOL_TIMEOUT", 10)),  # wait for free connection
+    "max_idle": 60 * 10,  # idle connections over min_size are closed after it
+}
+for database in DATABASES.values():
+    database["ENGINE"] = "jiri_one.db"  # postgresql, which measures checkouts
+    database["CONN_HEALTH_CHECKS"] = True  # pool checks connections before checkout
+    database["OPTIONS"] = {**database.get("OPTIONS", {}), "pool": DB_POOL_OPTIONS}
+# async views run their hot queries on connections from async pool (in the event loop,
+# without thread for sync ORM), every worker's loop has its own pool
+DB_ASYNC_QUERIES = os.environ.get(
+    "DB_ASYNC_QUERIES", "1" if SYSTEM_ENV == "PRODUCTION" else "0"
+) in ("1", "true", "True")
+DB_ASYNC_POOL_OPTIONS = {
+    "min_size": int(os.environ.get("DB_ASYNC_POOL_MIN_SIZE", 1)),
+    "max_size": int(os.environ.get("DB_ASYNC_POOL_MAX_SIZE", 5)),
+    "timeout": DB_POOL_OPTIONS["timeout"],
+    "max_idle": DB_POOL_OPTIONS["max_idle"],
+}
+
 
 # Password validation
 # https://docs.djangoproject.com/en/4.1/ref/settings/#auth-password-validators
@@ -172,6 +211,11 @@ DATE_FORMAT = "j. E, Y"
 # https://docs.djangoproject.com/en/4.1/howto/static-files/
 
 STATIC_URL = "static/"
+# hashed static files never change, files without hash are cached only for a while
+STATIC_IMMUTABLE_MAX_AGE = 60 * 60 * 24 * 365
+STATIC_MAX_AGE = 60 * 60
+# CSS of base.html smaller than this is inlined in <style> (see critical_css tag)
+STATIC_INLINE_CSS_MAX_SIZE = 8 * 1024
 
 # Default primary key field type
 # https://docs.djangoproject.com/en/4.1/ref/settings/#default-auto-field
@@ -180,8 +224,59 @@ DEFAULT_AUTO_FIELD = "django.db.models.BigAutoField"
 
 # nr of entries/posts on one page
 POSTS_ON_PAGE = 10
+# nr of words of post excerpt in listings
+EXCERPT_WORDS = 80
+# stages of rendering of post contents on save (see jiri_one/rendering.py), Markdown
+# is optional ("jiri_one.rendering.markdown_to_html" as the first stage), after
+# change of stages run render_posts command
+CONTENT_RENDER_STAGES = [
+    "jiri_one.rendering.rewrite_links",
+    "jiri_one.rendering.lazy_load_media",
+    "jiri_one.rendering.minify_whitespace",
+]
+# absolute links to these hosts are rewritten to relative ones
+RENDER_SITE_HOSTS = ("jiri.one", "www.jiri.one")
+
+# PostgreSQL text search configuration for posts (created in jiri_one migration 0004)
+SEARCH_CONFIG = "jiri_one_cze"
+# rendered pages (index, tags, search, posts) are cached until objects in them change
+# (0 disables the cache)
+PAGE_CACHE_TIMEOUT = 60 * 60 * 6
+# responses are compressed (gzip or brotli) only once, compressed bodies are cached
+# by hash of body, see jiri_one/compression.py (smaller bodies are not compressed)
+COMPRESSION_MIN_SIZE = 1024
+COMPRESSION_CACHE_TIMEOUT = 60 * 60 * 6
+COMPRESSION_GZIP_LEVEL = 9
+COMPRESSION_BROTLI_QUALITY = 9
+# rate limits (nr of requests, period in seconds) of token buckets, see jiri_one/rate_limit.py
+# comments are limited per IP and nick of author and per post
+COMMENT_RATE_LIMIT = (12, 60 * 60)
+POST_COMMENT_RATE_LIMIT = (60, 60 * 60)
+# searches (HTML and GraphQL) per IP
+SEARCH_RATE_LIMIT = (30, 60)
 
 GRAPHENE = {"SCHEMA": "jiri_one.schema.schema"}
+# nr of parsed and validated GraphQL documents cached in every process
+GRAPHQL_DOCUMENT_CACHE_SIZE = 256
+# registered persisted queries (sha256 hash -> query), see persist_graphql_queries command
+GRAPHQL_PERSISTED_QUERIES_FILE = BASE_DIR / "persisted_queries.json"
+# accept only queries from GRAPHQL_PERSISTED_QUERIES_FILE
+GRAPHQL_ALLOW_LIST_ONLY = os.environ.get("GRAPHQL_ALLOW_LIST_ONLY") == "1"
+# max-age for successful GraphQL GET responses (for HTTP cache in front of /graphql)
+GRAPHQL_GET_MAX_AGE = 60
+# GraphQL query responses are cached until objects in them change (0 disables the cache)
+GRAPHQL_RESPONSE_CACHE_TIMEOUT = 60 * 60 * 6
+# limits of GraphQL operations checked before execution (see jiri_one/query_cost.py),
+# fields in lists are paid POSTS_ON_PAGE times
+GRAPHQL_MAX_DEPTH = 6
+GRAPHQL_MAX_COST = 500
+# costs of fields which are more expensive than the default one (1 for object, 0 for scalar)
+GRAPHQL_FIELD_COSTS = {
+    "Query.postsBySearch": 10,
+    "Query.postsByTagsUrl": 2,
+    "PostType.commentsCount": 1,
+    "Mutation.createComment": 10,
+}
 
 LOGGING = {
     "version": 1,
@@ -223,14 +318,69 @@ LOGGING = {
     },
 }
 
+# IP ranges of GitHub webhooks (DeployApiView) are refreshed after GITHUB_META_TTL seconds
+# and kept in GITHUB_META_FILE for restarts
+GITHUB_META_URL = "https://api.github.com/meta"
+GITHUB_META_TTL = 60 * 60 * 24
+GITHUB_META_FILE = BASE_DIR / "github_meta.json"
+# X-Forwarded-For is trusted only from these proxies (its last entry is the address
+# of the client, which the proxy appended)
+TRUSTED_PROXIES = os.environ.get("TRUSTED_PROXIES", "127.0.0.1,::1").split(",")
+
+# releases of redeploy command (see jiri_one/releases.py), commands are run in src
+# directory of new release and the web server should serve DEPLOY_ROOT/current
+DEPLOY_ROOT = Path(os.environ.get("DEPLOY_ROOT", "/srv/http/virtual/jiri.one"))
+DEPLOY_REPOSITORY = DEPLOY_ROOT / "repository"
+DEPLOY_REMOTE = "R"
+# files from DEPLOY_ROOT/shared linked to every release
+DEPLOY_SHARED_FILES = [
+    "secret_key.txt",
+    "secret_github_key.txt",
+    "src/.easyblog_pgpass",
+]
+# build doesn't change the shared database, the current release is still serving
+DEPLOY_BUILD_COMMANDS = [
+    "poetry install --no-root --with production",
+    "poetry run python manage.py makemigrations --check --dry-run",
+    "poetry run python manage.py collectstatic --no-input",
+]
+# run right before the switch of releases (only after successful build)
+DEPLOY_MIGRATE_COMMANDS = ["poetry run python manage.py migrate --no-input"]
+# graceful reload of workers (HUP), they load code of the new release
+DEPLOY_RELOAD_COMMAND = "systemctl --user reload gunicorn_jiri_one.service"
+# posts are rendered by stages of the new release (only changed ones)
+DEPLOY_POST_RELOAD_COMMANDS = ["poetry run python manage.py render_posts"]
+DEPLOY_KEEP_RELEASES = 5
+
 # Flutter API keys
 FLUTTER_API_KEY = os.environ.get("FLUTTER_API_KEY")
 FLUTTER_API_SECRET = os.environ.get("FLUTTER_API_SECRET")
 
 # Cache configuration
+# default cache is small LRU in memory of every process in front of shared cache
 CACHES = {
     "default": {
+        "BACKEND": "jiri_one.cache_backends.TwoTierCache",
+        "LOCATION": "shared",
+        "OPTIONS": {
+            "L1_MAX_SIZE": 32 * 1024 * 1024,  # bytes
+            "L1_TIMEOUT": 60,
+            # stamps of L1 values are checked in L2 with every read, with N > 0 they
+            # are checked once per N seconds and reads can be up to N seconds stale
+            "L1_CHECK_INTERVAL": 0,
+        },
+    },
+    "shared": {
+        # FileBasedCache with atomic add/incr (lock file), culled once per 10 s
+        "BACKEND": "jiri_one.cache_backends.SharedFileCache",
+        "LOCATION": os.environ.get("CACHE_DIR", BASE_DIR / "cache"),
+        "OPTIONS": {"MAX_ENTRIES": 20000},
+    },
+    # {% cache %} fragments of base.html (navigation, footer), their keys are versioned
+    # by tags version, so they can be in memory of every process
+    "template_fragments": {
         "BACKEND": "django.core.cache.backends.locmem.LocMemCache",
-        "LOCATION": "unique-snowflake",
-    }
+        "LOCATION": "template_fragments",
+        "OPTIONS": {"MAX_ENTRIES": 100},
+    },
 }
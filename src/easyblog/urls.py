@@ -1,13 +1,24 @@
 from django.conf import settings
 from django.conf.urls.static import static
 from django.contrib import admin
-from django.urls import include, path
+from django.urls import include, path, re_path
 from django.views.decorators.csrf import csrf_exempt
-from graphene_django.views import GraphQLView
+
+from jiri_one.graphql_view import AsyncGraphQLView
+from jiri_one.views import StaticFileView
 
 urlpatterns = [
     path('admin/', admin.site.urls),
     path('', include('jiri_one.urls')),
     path("prose/", include("prose.urls")),
-    path("graphql", csrf_exempt(GraphQLView.as_view(graphiql=True))),
+    path("graphql", csrf_exempt(AsyncGraphQLView.as_view(graphiql=True))),
 ] + static(settings.MEDIA_URL, document_root=settings.MEDIA_ROOT)
+
+if not settings.DEBUG:  # runserver serves static files in debug mode
+    urlpatterns.insert(
+        0,
+        re_path(
+            rf"^{settings.STATIC_URL.lstrip('/')}(?P<path>.+)$",
+            StaticFileView.as_view(),
+        ),
+    )
@@ -1,6 +1,6 @@
 from django.contrib import admin
 
-from .models import Author, Comment, Post, Tag
+from .models import Author, Comment, DeployJob, Post, Tag
 
-for model in [Post, Author, Comment, Tag]:
+for model in [Post, Author, Comment, Tag, DeployJob]:
     admin.site.register(model)
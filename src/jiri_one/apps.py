@@ -4,3 +4,6 @@ from django.apps import AppConfig
 class JiriOneConfig(AppConfig):
     default_auto_field = "django.db.models.BigAutoField"
     name = "jiri_one"
+
+    def ready(self):
+        from jiri_one import signals  # noqa: F401 (it connects signal receivers)
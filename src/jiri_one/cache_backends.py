@@ -0,0 +1,372 @@
+import os
+import sys
+from collections import Counter, OrderedDict
+from collections.abc import Iterator
+from contextlib import contextmanager
+from threading import Lock
+from time import monotonic
+from typing import Any, NamedTuple
+from uuid import uuid4
+
+from django.core.cache import caches
+from django.core.cache.backends.base import DEFAULT_TIMEOUT, BaseCache
+from django.core.cache.backends.filebased import FileBasedCache
+from django.core.files import locks
+
+# Every value in the shared cache (L2) has a stamp (under its own small key), which
+# is changed with every write of the value. Value in process memory (L1) is used only
+# if its stamp is the same as the stamp in L2. Stamps of L1 values are loaded in the
+# same get_many like values missing in L1, so every read is one round trip to L2 and
+# L1 saves only reading and unpickling of values. With L1_CHECK_INTERVAL > 0 stamps
+# are checked at most once per the interval instead and L1 can return a value changed
+# or deleted by other process up to L1_CHECK_INTERVAL seconds (writes and deletes of
+# this process change its L1 at once). Values without stamp (counters from add and
+# incr) are always read from L2, so they are never stale.
+STAMP_SUFFIX = ":stamp"
+# L1 stats are added to shared counters after this nr of seconds
+STATS_FLUSH_INTERVAL = 60
+STATS_PREFIX = "two_tier_stats"
+STATS = ("l1_hits", "l1_misses", "l2_hits", "l2_misses")
+# containers in values are walked only to this depth, when their size is estimated
+SIZE_DEPTH = 5
+# L2 on disk (SharedFileCache): add and incr of all keys are serialized by one lock
+# file (across processes) and culling lists the whole directory, so every process
+# culls at most once per CULL_INTERVAL seconds (not with every set)
+CULL_INTERVAL = 10
+LOCK_FILE_NAME = "add_incr.lock"
+
+
+class L1Entry(NamedTuple):
+    value: Any
+    stamp: str
+    size: int  # bytes (estimate)
+    expires: float  # monotonic time
+    checked: float  # monotonic time of the last check of stamp in L2
+
+
+def value_size(value: Any, depth: int = SIZE_DEPTH) -> int:
+    """Estimate of memory used by value (without pickling it again)."""
+    size = sys.getsizeof(value)
+    if depth == 0 or isinstance(value, (str, bytes, int, float)):
+        return size
+    if isinstance(value, dict):
+        size += sum(
+            value_size(key, depth - 1) + value_size(item, depth - 1)
+            for key, item in value.items()
+        )
+    elif isinstance(value, (list, tuple, set, frozenset)):
+        size += sum(value_size(item, depth - 1) for item in value)
+    elif hasattr(value, "__dict__"):  # dataclasses like GzipTemplate
+        size += value_size(vars(value), depth - 1)
+    return size
+
+
+class L1Cache:
+    """LRU bounded by size (bytes) with TTL, it is shared by all threads of the process."""
+
+    def __init__(self, max_size: int, timeout: float, check_interval: float):
+        self.max_size = max_size
+        self.timeout = timeout
+        self.check_interval = check_interval
+        self.entries = OrderedDict[str, L1Entry]()
+        self.size = 0
+        self.stats = Counter[str]()
+        self.stats_flushed = monotonic()
+        self.lock = Lock()
+
+    def get(self, key: str) -> L1Entry | None:
+        with self.lock:
+            entry = self.entries.get(key)
+            if entry is None:
+                return None
+            if entry.expires < monotonic():
+                self._remove(key)
+                return None
+            self.entries.move_to_end(key)
+            return entry
+
+    def is_checked(self, entry: L1Entry) -> bool:
+        """Stamp of entry was checked in L2 recently, so it doesn't need check."""
+        return monotonic() - entry.checked < self.check_interval
+
+    def mark_checked(self, key: str, entry: L1Entry) -> None:
+        with self.lock:
+            if self.entries.get(key) is entry:  # it wasn't changed meanwhile
+                self.entries[key] = entry._replace(checked=monotonic())
+
+    def set(self, key: str, value: Any, stamp: str, timeout: float | None) -> None:
+        size = value_size(value)
+        if (timeout is not None and timeout <= 0) or size > self.max_size:
+            self.delete(key)
+            return
+        ttl = self.timeout if timeout is None else min(self.timeout, timeout)
+        now = monotonic()
+        with self.lock:
+            self._remove(key)
+            self.entries[key] = L1Entry(value, stamp, size, now + ttl, now)
+            self.size += size
+            while self.size > self.max_size:  # the least recently used
+                self._remove(next(iter(self.entries)))
+
+    def _remove(self, key: str) -> None:
+        """Remove entry, the lock has to be held."""
+        entry = self.entries.pop(key, None)
+        if entry is not None:
+            self.size -= entry.size
+
+    def delete(self, key: str) -> None:
+        with self.lock:
+            self._remove(key)
+
+    def clear(self) -> None:
+        with self.lock:
+            self.entries.clear()
+            self.size = 0
+
+
+# L1 caches of the process by name of cache (backend instances are per thread)
+_l1_caches: dict[str, L1Cache] = {}
+_l1_caches_lock = Lock()
+
+
+def new_stamp() -> str:
+    return uuid4().hex
+
+
+def hit_ratio(hits: int, misses: int) -> float:
+    total = hits + misses
+    return hits / total if total else 0.0
+
+
+class TwoTierCache(BaseCache):
+    """In-process LRU (L1) in front of shared cache (L2) with alias in LOCATION.
+
+    OPTIONS: L1_MAX_SIZE in bytes (default 32 MB), L1_TIMEOUT in seconds (default 60)
+    and L1_CHECK_INTERVAL in seconds (default 0, stamps are checked with every read).
+    """
+
+    def __init__(self, location: str, params: dict):
+        super().__init__(params)
+        options = params.get("OPTIONS", {})
+        self.l2_alias = location
+        with _l1_caches_lock:
+            self.l1 = _l1_caches.setdefault(
+                location,
+                L1Cache(
+                    max_size=options.get("L1_MAX_SIZE", 32 * 1024 * 1024),
+                    timeout=options.get("L1_TIMEOUT", 60),
+                    check_interval=options.get("L1_CHECK_INTERVAL", 0),
+                ),
+            )
+
+    @property
+    def l2(self) -> BaseCache:
+        return caches[self.l2_alias]
+
+    def l1_key(self, key, version) -> str:
+        return self.make_and_validate_key(key, version=version)
+
+    def l2_timeout(self, timeout) -> float | None:
+        """Timeout in seconds (None is forever) like L2 will use it."""
+        if timeout is DEFAULT_TIMEOUT:
+            timeout = self.l2.default_timeout
+        return timeout
+
+    def count(self, stat: str, nr: int = 1) -> None:
+        self.l1.stats[stat] += nr
+        if monotonic() - self.l1.stats_flushed > STATS_FLUSH_INTERVAL:
+            self.flush_stats()
+
+    def store(self, key, value, stamp, timeout, version) -> None:
+        self.l1.set(self.l1_key(key, version), value, stamp, self.l2_timeout(timeout))
+
+    def add(self, key, value, timeout=DEFAULT_TIMEOUT, version=None):
+        """Values from add (counters, initial versions) have no stamp like after incr."""
+        if not self.l2.add(key, value, timeout, version):
+            return False
+        self.l2.delete(f"{key}{STAMP_SUFFIX}", version)  # stamp of evicted value
+        return True
+
+    def get(self, key, default=None, version=None):
+        sentinel = object()
+        value = self.get_many([key], version=version).get(key, sentinel)
+        return default if value is sentinel else value
+
+    def get_many(self, keys, version=None):
+        keys = list(keys)
+        found = {}
+        # values in L1 are valid only with the same stamp like in L2, stamps of
+        # recently checked entries (L1_CHECK_INTERVAL) are not loaded again
+        unchecked = {}
+        for key in keys:
+            entry = self.l1.get(self.l1_key(key, version))
+            if entry is None:
+                continue
+            if self.l1.is_checked(entry):
+                found[key] = entry.value
+            else:
+                unchecked[key] = entry
+        missing = [key for key in keys if key not in found and key not in unchecked]
+        l2_values = {}
+        if unchecked or missing:
+            # one round trip for stamps of L1 values and for missing values
+            l2_values = self.l2.get_many(
+                [f"{key}{STAMP_SUFFIX}" for key in [*unchecked, *missing]] + missing,
+                version=version,
+            )
+        changed = []  # by other process
+        for key, entry in unchecked.items():
+            if l2_values.get(f"{key}{STAMP_SUFFIX}") == entry.stamp:
+                found[key] = entry.value
+                self.l1.mark_checked(self.l1_key(key, version), entry)
+            else:
+                self.l1.delete(self.l1_key(key, version))
+                changed.append(key)
+        self.count("l1_hits", len(found))
+        self.count("l1_misses", len(keys) - len(found))
+
+        if changed:
+            l2_values |= self.l2.get_many(
+                changed + [f"{key}{STAMP_SUFFIX}" for key in changed], version=version
+            )
+            missing += changed
+        if missing:
+            for key in missing:
+                if key not in l2_values:
+                    continue
+                found[key] = l2_values[key]
+                stamp = l2_values.get(f"{key}{STAMP_SUFFIX}")
+                if stamp is not None:
+                    # we don't know the rest of L2 timeout, so only L1_TIMEOUT
+                    self.l1.set(self.l1_key(key, version), l2_values[key], stamp, None)
+            l2_hits = sum(1 for key in missing if key in found)
+            self.count("l2_hits", l2_hits)
+            self.count("l2_misses", len(missing) - l2_hits)
+        return found
+
+    def set(self, key, value, timeout=DEFAULT_TIMEOUT, version=None):
+        self.set_many({key: value}, timeout, version)
+
+    def set_many(self, data, timeout=DEFAULT_TIMEOUT, version=None):
+        stamps = {key: new_stamp() for key in data}
+        failed_keys = self.l2.set_many(
+            {
+                **data,
+                **{f"{key}{STAMP_SUFFIX}": stamp for key, stamp in stamps.items()},
+            },
+            timeout,
+            version,
+        )
+        for key, value in data.items():
+            if key in failed_keys:
+                self.l1.delete(self.l1_key(key, version))
+            else:
+                self.store(key, value, stamps[key], timeout, version)
+        return [key for key in failed_keys if key in data]
+
+    def touch(self, key, timeout=DEFAULT_TIMEOUT, version=None):
+        self.l2.touch(f"{key}{STAMP_SUFFIX}", timeout, version)
+        return self.l2.touch(key, timeout, version)
+
+    def delete(self, key, version=None):
+        self.l1.delete(self.l1_key(key, version))
+        deleted = self.l2.delete(key, version)
+        self.l2.delete(f"{key}{STAMP_SUFFIX}", version)
+        return deleted
+
+    def delete_many(self, keys, version=None):
+        keys = list(keys)
+        for key in keys:
+            self.l1.delete(self.l1_key(key, version))
+        self.l2.delete_many(
+            keys + [f"{key}{STAMP_SUFFIX}" for key in keys], version=version
+        )
+
+    def has_key(self, key, version=None):
+        return self.l2.has_key(key, version)
+
+    def incr(self, key, delta=1, version=None):
+        """Counters are changed in L2 only, without stamp they are never in L1."""
+        self.l1.delete(self.l1_key(key, version))
+        self.l2.delete(f"{key}{STAMP_SUFFIX}", version)
+        return self.l2.incr(key, delta, version)
+
+    def decr(self, key, delta=1, version=None):
+        return self.incr(key, -delta, version)
+
+    def clear(self):
+        self.l1.clear()
+        self.l2.clear()
+
+    def close(self, **kwargs):
+        self.l2.close(**kwargs)
+
+    def get_stats(self) -> dict[str, float]:
+        """Hits, misses and hit ratios of both tiers in this process."""
+        stats = self.l1.stats
+        return {
+            **{stat: stats[stat] for stat in STATS},
+            "l1_hit_ratio": hit_ratio(stats["l1_hits"], stats["l1_misses"]),
+            "l2_hit_ratio": hit_ratio(stats["l2_hits"], stats["l2_misses"]),
+        }
+
+    def flush_stats(self) -> None:
+        """Add stats of this process to shared counters (see cache_stats command)."""
+        with self.l1.lock:
+            stats = dict(self.l1.stats)
+            self.l1.stats.clear()
+            self.l1.stats_flushed = monotonic()
+        for stat, nr in stats.items():
+            if nr:
+                self.l2.add(f"{STATS_PREFIX}:{stat}", 0, None)
+                self.l2.incr(f"{STATS_PREFIX}:{stat}", nr)
+
+    def get_shared_stats(self) -> dict[str, float]:
+        """Stats of all processes flushed to L2."""
+        values = self.l2.get_many([f"{STATS_PREFIX}:{name}" for name in STATS])
+        stats = {name: values.get(f"{STATS_PREFIX}:{name}", 0) for name in STATS}
+        return {
+            **stats,
+            "l1_hit_ratio": hit_ratio(stats["l1_hits"], stats["l1_misses"]),
+            "l2_hit_ratio": hit_ratio(stats["l2_hits"], stats["l2_misses"]),
+        }
+
+    def reset_stats(self) -> None:
+        with self.l1.lock:
+            self.l1.stats.clear()
+        self.l2.delete_many([f"{STATS_PREFIX}:{name}" for name in STATS])
+
+
+# the last culling of cache directories in this process (monotonic time)
+_culled: dict[str, float] = {}
+_culled_lock = Lock()
+
+
+class SharedFileCache(FileBasedCache):
+    """FileBasedCache with atomic add and incr for all processes on the machine."""
+
+    @contextmanager
+    def locked(self) -> Iterator[None]:
+        self._createdir()
+        with open(os.path.join(self._dir, LOCK_FILE_NAME), "ab") as lock_file:
+            locks.lock(lock_file, locks.LOCK_EX)
+            try:
+                yield
+            finally:
+                locks.unlock(lock_file)
+
+    def add(self, key, value, timeout=DEFAULT_TIMEOUT, version=None):
+        with self.locked():
+            return super().add(key, value, timeout, version)
+
+    def incr(self, key, delta=1, version=None):
+        with self.locked():
+            return super().incr(key, delta, version)
+
+    def _cull(self):
+        with _culled_lock:
+            last_culled = _culled.get(self._dir)
+            if last_culled is not None and monotonic() - last_culled < CULL_INTERVAL:
+                return
+            _culled[self._dir] = monotonic()
+        super()._cull()
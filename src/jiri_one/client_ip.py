@@ -0,0 +1,16 @@
+from django.conf import settings
+from django.http import HttpRequest
+
+
+def get_request_ip(request: HttpRequest) -> str:
+    """Address of client, which can't be spoofed by the client.
+
+    The client can send its own X-Forwarded-For and the proxy appends the address of
+    the client to it, so only the last entry is reliable and only from our proxy
+    (TRUSTED_PROXIES). Without trusted proxy it is the address of the peer.
+    """
+    remote_addr = request.META.get("REMOTE_ADDR", "")
+    forwarded_for = request.META.get("HTTP_X_FORWARDED_FOR")
+    if forwarded_for and remote_addr in settings.TRUSTED_PROXIES:
+        return forwarded_for.rsplit(",", 1)[-1].strip()
+    return remote_addr or "unknown"
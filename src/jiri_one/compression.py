@@ -0,0 +1,215 @@
+import gzip
+import struct
+import zlib
+from collections import Counter
+from collections.abc import Callable
+from dataclasses import dataclass
+from hashlib import sha256
+from threading import Lock
+from time import monotonic, thread_time_ns
+
+import brotli
+from django.conf import settings
+from django.core.cache import cache
+from django.http import HttpRequest, HttpResponse
+from django.utils.cache import patch_vary_headers
+from django.utils.deprecation import MiddlewareMixin
+
+# Responses are compressed by encoding from Accept-Encoding (brotli is preferred) and
+# compressed bodies are cached by hash of the body, so the same response (GraphQL,
+# pages without CSRF token) is compressed only once. Pages from page cache differ
+# only by CSRF token, so their gzip is saved with the page as deflated segments around
+# the token and only the token is compressed, when the page is served.
+ENCODINGS = ("br", "gzip")  # preferred first
+COMPRESSIBLE_TYPES = ("text/", "application/json", "application/javascript", "+xml")
+COMPRESSED_KEY_PREFIX = "compressed"
+# gzip header without name and time, trailer is CRC32 and size of uncompressed body
+GZIP_HEADER = b"\x1f\x8b\x08\x00\x00\x00\x00\x00\x02\xff"
+DEFLATE_FINAL_BLOCK = b"\x03\x00"  # empty last block
+# stats are added to shared counters after this nr of seconds
+STATS_FLUSH_INTERVAL = 60
+STATS_PREFIX = "compression_stats"
+STATS = (
+    "responses",  # compressed responses
+    "precompressed",  # pages with gzip from page cache
+    "cache_hits",
+    "cache_misses",
+    "too_small",
+    "bytes_in",
+    "bytes_out",
+    "cpu_ns",  # CPU time of compression (and lookups of compressed bodies)
+)
+
+_stats = Counter[str]()
+_stats_lock = Lock()
+_stats_flushed = monotonic()
+
+
+def count(**stats: int) -> None:
+    with _stats_lock:
+        _stats.update(stats)
+        if monotonic() - _stats_flushed <= STATS_FLUSH_INTERVAL:
+            return
+    flush_stats()
+
+
+def flush_stats() -> None:
+    """Add stats of this process to shared counters (see compression_stats command)."""
+    global _stats_flushed
+    with _stats_lock:
+        stats = dict(_stats)
+        _stats.clear()
+        _stats_flushed = monotonic()
+    for stat, nr in stats.items():
+        if nr:
+            cache.add(f"{STATS_PREFIX}:{stat}", 0, None)
+            cache.incr(f"{STATS_PREFIX}:{stat}", nr)
+
+
+def get_shared_stats() -> dict[str, float]:
+    """Stats of all processes flushed to cache with compression ratio."""
+    values = cache.get_many([f"{STATS_PREFIX}:{name}" for name in STATS])
+    stats: dict[str, float] = {
+        name: values.get(f"{STATS_PREFIX}:{name}", 0) for name in STATS
+    }
+    stats["ratio"] = stats["bytes_out"] / stats["bytes_in"] if stats["bytes_in"] else 0
+    return stats
+
+
+def reset_stats() -> None:
+    with _stats_lock:
+        _stats.clear()
+    cache.delete_many([f"{STATS_PREFIX}:{name}" for name in STATS])
+
+
+def accepted_encodings(accept_encoding: str) -> list[str]:
+    """Supported encodings accepted by client, the preferred one first."""
+    qualities = {}
+    for item in accept_encoding.split(","):
+        name, *params = item.split(";")
+        quality = 1.0
+        for param in params:
+            key, _, value = param.strip().partition("=")
+            if key.lower() == "q":
+                try:
+                    quality = float(value)
+                except ValueError:
+                    quality = 0.0
+        qualities[name.strip().lower()] = quality
+    default = qualities.get("*", 0.0)
+    # sort is stable, so the order of ENCODINGS decides between the same qualities
+    return sorted(
+        (encoding for encoding in ENCODINGS if qualities.get(encoding, default) > 0),
+        key=lambda encoding: -qualities.get(encoding, default),
+    )
+
+
+def compress(body: bytes, encoding: str) -> bytes:
+    if encoding == "br":
+        return brotli.compress(body, quality=settings.COMPRESSION_BROTLI_QUALITY)
+    return gzip.compress(body, compresslevel=settings.COMPRESSION_GZIP_LEVEL, mtime=0)
+
+
+def get_compressed(body: bytes, encoding: str) -> bytes:
+    """Compressed body from cache (by hash of body) or compressed now and cached."""
+    key = f"{COMPRESSED_KEY_PREFIX}:{encoding}:{sha256(body).hexdigest()}"
+    compressed = cache.get(key)
+    if compressed is not None:
+        count(cache_hits=1)
+        return compressed
+    compressed = compress(body, encoding)
+    cache.set(key, compressed, settings.COMPRESSION_CACHE_TIMEOUT)
+    count(cache_misses=1)
+    return compressed
+
+
+def deflate_segment(data: bytes) -> bytes:
+    """Raw deflate blocks which end on byte boundary, so segments can be joined."""
+    compressor = zlib.compressobj(
+        settings.COMPRESSION_GZIP_LEVEL, zlib.DEFLATED, -zlib.MAX_WBITS
+    )
+    return compressor.compress(data) + compressor.flush(zlib.Z_SYNC_FLUSH)
+
+
+@dataclass(frozen=True)
+class GzipTemplate:
+    """Gzip of text with placeholders, which are replaced when it is served."""
+
+    segments: tuple[bytes, ...]  # deflated parts of text between placeholders
+
+    @classmethod
+    def from_text(cls, text: str, placeholder: str) -> "GzipTemplate":
+        return cls(
+            tuple(deflate_segment(part.encode()) for part in text.split(placeholder))
+        )
+
+    def render(self, value: str, body: bytes) -> bytes:
+        """Gzip of body, which is the text with value instead of placeholders."""
+        return b"".join(
+            (
+                GZIP_HEADER,
+                deflate_segment(value.encode()).join(self.segments),
+                DEFLATE_FINAL_BLOCK,
+                struct.pack("<II", zlib.crc32(body), len(body) & 0xFFFFFFFF),
+            )
+        )
+
+
+def set_precompressed(
+    response: HttpResponse, encoding: str, make: Callable[[], bytes]
+) -> None:
+    """Body of response in encoding can be made without compression of whole body."""
+    if not hasattr(response, "precompressed"):
+        response.precompressed = {}  # type: ignore[attr-defined]
+    response.precompressed[encoding] = make  # type: ignore[attr-defined]
+
+
+def is_compressible(response: HttpResponse) -> bool:
+    content_type = response.get("Content-Type", "")
+    return (
+        not response.streaming
+        and response.status_code == 200
+        and not response.has_header("Content-Encoding")
+        and any(type_ in content_type for type_ in COMPRESSIBLE_TYPES)
+    )
+
+
+class CompressionMiddleware(MiddlewareMixin):
+    """GZipMiddleware with brotli, cache of compressed bodies and precompressed pages."""
+
+    def process_response(
+        self, request: HttpRequest, response: HttpResponse
+    ) -> HttpResponse:
+        if not is_compressible(response):
+            return response
+        patch_vary_headers(response, ("Accept-Encoding",))
+        encodings = accepted_encodings(request.META.get("HTTP_ACCEPT_ENCODING", ""))
+        if not encodings:
+            return response
+        body = response.content
+        if len(body) < settings.COMPRESSION_MIN_SIZE:
+            count(too_small=1)  # compression would save nothing
+            return response
+        start_time = thread_time_ns()
+        precompressed = getattr(response, "precompressed", {})
+        encoding = next((enc for enc in encodings if enc in precompressed), None)
+        if encoding is not None:
+            compressed = precompressed[encoding]()
+            count(precompressed=1)
+        else:
+            encoding = encodings[0]
+            compressed = get_compressed(body, encoding)
+        count(
+            responses=1,
+            bytes_in=len(body),
+            bytes_out=len(compressed),
+            cpu_ns=thread_time_ns() - start_time,
+        )
+        response.content = compressed
+        response["Content-Length"] = str(len(compressed))
+        response["Content-Encoding"] = encoding
+        # ETag of uncompressed body is not strong validator of compressed one
+        etag = response.get("ETag")
+        if etag and etag.startswith('"'):
+            response["ETag"] = f"W/{etag}"
+        return response
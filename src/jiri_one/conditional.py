@@ -0,0 +1,109 @@
+from dataclasses import dataclass
+from datetime import datetime
+from hashlib import md5
+
+from django.conf import settings
+from django.db.models import Max
+from django.http import HttpRequest, HttpResponse
+from django.utils.cache import get_conditional_response, patch_cache_control
+from django.utils.http import http_date, quote_etag
+
+# internal imports
+from jiri_one.db_pool import afetch
+from jiri_one.dependencies import aget_dependency_versions, list_dependency
+from jiri_one.models import Comment, Post, Tag
+from jiri_one.tags import aget_tags_version
+
+# Validators (ETag and Last-Modified) of pages are computed from versions of the data
+# without rendering, so browsers, crawlers and clients can get 304 Not Modified.
+# the query of aget_post_validators for async pool (DB_ASYNC_QUERIES)
+POST_VERSIONS = """
+SELECT post.id, post.mod_time, post.comment_count, MAX(comment.pub_time)
+FROM jiri_one_post AS post
+LEFT JOIN jiri_one_comment AS comment ON comment.post_id = post.id
+WHERE post.url_cze = %s
+GROUP BY post.id
+"""
+
+
+def ns_to_timestamp(version: int) -> int:
+    return version // 1_000_000_000
+
+
+@dataclass(frozen=True)
+class Validators:
+    etag: str  # quoted
+    last_modified: int | None  # timestamp
+
+    @classmethod
+    def from_versions(cls, *versions, last_modified: int | None = None) -> "Validators":
+        etag = md5(":".join(str(version) for version in versions).encode()).hexdigest()
+        return cls(etag=quote_etag(etag), last_modified=last_modified)
+
+    def not_modified_response(self, request: HttpRequest) -> HttpResponse | None:
+        """304 (or 412) response, if the client has the same version of page."""
+        response = get_conditional_response(
+            request, etag=self.etag, last_modified=self.last_modified
+        )
+        if response is not None:
+            self.set_headers(response)
+        return response
+
+    def set_headers(self, response: HttpResponse) -> HttpResponse:
+        response.headers["ETag"] = self.etag
+        if self.last_modified is not None:
+            response.headers["Last-Modified"] = http_date(self.last_modified)
+        return response
+
+
+def set_page_validators(response: HttpResponse, validators: Validators) -> HttpResponse:
+    """HTML pages can be stored, but the client has to check (cheaply), if they are current."""
+    patch_cache_control(response, no_cache=True)
+    return validators.set_headers(response)
+
+
+async def aget_listing_validators(request: HttpRequest) -> Validators:
+    """Listings (index, tags, search) change with any post, tag or comment (counts).
+
+    The versions are cached values maintained by signals.
+    """
+    versions = await aget_dependency_versions(
+        [list_dependency(Post), list_dependency(Tag), list_dependency(Comment)]
+    )
+    return Validators.from_versions(
+        request.get_full_path(), *versions, last_modified=ns_to_timestamp(max(versions))
+    )
+
+
+async def aget_post_validators(request: HttpRequest, url_cze: str) -> Validators | None:
+    """Post page is given by the post, its comments and tags (in navigation too).
+
+    It is one query using unique index of url_cze and index of Comment.post
+    (nr of comments is there, because deleted comment doesn't change the times).
+    """
+    if settings.DB_ASYNC_QUERIES:
+        rows = await afetch(POST_VERSIONS, [url_cze])
+        post_versions = rows[0] if rows else None
+    else:
+        post_versions = (
+            await Post.objects.filter(url_cze=url_cze)
+            .values_list("id", "mod_time", "comment_count")
+            .annotate(last_comment=Max("comments__pub_time"))
+            .afirst()
+        )
+    if post_versions is None:
+        return None
+    _, mod_time, _, last_comment = post_versions
+    tags_version = await aget_tags_version()
+    times: list[datetime] = (
+        [mod_time] if last_comment is None else [mod_time, last_comment]
+    )
+    last_modified = max(
+        max(int(time.timestamp()) for time in times), ns_to_timestamp(tags_version)
+    )
+    return Validators.from_versions(
+        request.get_full_path(),
+        *post_versions,
+        tags_version,
+        last_modified=last_modified,
+    )
@@ -0,0 +1,140 @@
+from collections.abc import Callable, Iterable, Iterator
+from concurrent.futures import Future, ProcessPoolExecutor
+from dataclasses import dataclass, field
+from difflib import SequenceMatcher
+from itertools import islice
+from time import perf_counter
+
+from bs4 import BeautifulSoup
+
+# Rewrite of post contents by rule sets. Rules are plain functions of HTML (so they can
+# run in other processes), rule set is used only for contents which contain its needle,
+# so the most of posts are never parsed. Only changed contents are returned.
+CONTENT_FIELDS = ("content_cze", "content_eng")
+URL_ATTRIBUTES = ("src", "href", "poster")
+
+
+def soubory_to_files_in_attributes(content: str) -> str:
+    """URLs of old blog files (.../soubory/x.png) are /files/x.png now."""
+    soup = BeautifulSoup(content, "html.parser")
+    changed = False
+    for tag in soup.find_all():
+        for attribute in URL_ATTRIBUTES:
+            value = tag.attrs.get(attribute)
+            if isinstance(value, str) and "soubory" in value:
+                index = value.index("soubory") + 7  # end of soubory
+                tag[attribute] = f"/files{value[index:]}"
+                changed = True
+    # without change the original HTML is kept (BeautifulSoup changes formatting)
+    return str(soup) if changed else content
+
+
+def soubory_to_files_in_text(content: str) -> str:
+    return content.replace("soubory/", "files/")
+
+
+@dataclass(frozen=True)
+class RuleSet:
+    rules: tuple[Callable[[str], str], ...]
+    needle: str  # content without it is not changed by rules
+
+    def rewrite(self, content: str | None) -> str | None:
+        if not content or self.needle not in content:
+            return content
+        for rule in self.rules:
+            content = rule(content)
+        return content
+
+
+RULE_SETS = {
+    "files_urls": RuleSet(
+        (soubory_to_files_in_attributes, soubory_to_files_in_text), needle="soubory"
+    ),
+}
+
+# (id, content_cze, content_eng)
+Row = tuple[int, str | None, str | None]
+
+
+def rewrite_rows(rule_set_name: str, rows: list[Row]) -> list[tuple[Row, tuple]]:
+    """Changed rows with nr of changes in every content (it runs in worker process)."""
+    rule_set = RULE_SETS[rule_set_name]
+    changed = []
+    for row in rows:
+        post_id, *contents = row
+        new_row = (post_id, *(rule_set.rewrite(content) for content in contents))
+        if new_row != row:
+            changes = tuple(map(count_changes, row[1:], new_row[1:]))
+            changed.append((new_row, changes))
+    return changed
+
+
+def count_changes(old: str | None, new: str | None) -> int:
+    """Nr of changed places between contents (for diff summary)."""
+    matcher = SequenceMatcher(None, old or "", new or "", autojunk=False)
+    return sum(1 for opcode, *_ in matcher.get_opcodes() if opcode != "equal")
+
+
+@dataclass
+class RewriteStats:
+    read: float = 0.0
+    rewrite: float = 0.0
+    write: float = 0.0
+    batches: int = 0
+    rows: int = 0
+    # ids of changed posts with nr of changes in every content (diff summary)
+    changes: list[tuple[int, tuple]] = field(default_factory=list)
+
+
+class ContentRewriter:
+    """Rows are read in batches, rewritten in process pool and changed ones are written."""
+
+    def __init__(self, rule_set_name: str, workers: int = 1, batch_size: int = 200):
+        self.rule_set_name = rule_set_name
+        self.workers = workers
+        self.batch_size = batch_size
+        self.stats = RewriteStats()
+
+    def batches(self, rows: Iterable[Row]) -> Iterator[list[Row]]:
+        rows = iter(rows)
+        while True:
+            start_time = perf_counter()
+            batch = list(islice(rows, self.batch_size))
+            self.stats.read += perf_counter() - start_time
+            if not batch:
+                return
+            self.stats.batches += 1
+            self.stats.rows += len(batch)
+            yield batch
+
+    def handle_result(self, changed: list[tuple[Row, tuple]], write) -> None:
+        self.stats.changes.extend((row[0], changes) for row, changes in changed)
+        if changed and write is not None:
+            start_time = perf_counter()
+            write([row for row, _ in changed])
+            self.stats.write += perf_counter() - start_time
+
+    def run(self, rows: Iterable[Row], write=None) -> RewriteStats:
+        """Write gets changed rows of batch, it is not called for dry run (None)."""
+        if self.workers <= 1:
+            for batch in self.batches(rows):
+                start_time = perf_counter()
+                changed = rewrite_rows(self.rule_set_name, batch)
+                self.stats.rewrite += perf_counter() - start_time
+                self.handle_result(changed, write)
+            return self.stats
+        with ProcessPoolExecutor(self.workers) as executor:
+            pending: list[Future] = []
+            for batch in self.batches(rows):
+                pending.append(executor.submit(rewrite_rows, self.rule_set_name, batch))
+                if len(pending) >= self.workers * 2:  # bounded nr of batches in memory
+                    self.wait_for(pending.pop(0), write)
+            for future in pending:
+                self.wait_for(future, write)
+        return self.stats
+
+    def wait_for(self, future: Future, write) -> None:
+        start_time = perf_counter()
+        changed = future.result()
+        self.stats.rewrite += perf_counter() - start_time
+        self.handle_result(changed, write)
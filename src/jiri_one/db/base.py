@@ -0,0 +1,16 @@
+from time import perf_counter_ns
+
+from django.db.backends.postgresql import base
+
+# internal imports
+from jiri_one.db_pool import record_checkout
+
+
+class DatabaseWrapper(base.DatabaseWrapper):
+    """PostgreSQL backend, which measures checkouts of connections from pool."""
+
+    def get_new_connection(self, conn_params):
+        start = perf_counter_ns()
+        connection = super().get_new_connection(conn_params)
+        record_checkout(perf_counter_ns() - start)
+        return connection
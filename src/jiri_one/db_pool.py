@@ -0,0 +1,220 @@
+from asyncio import AbstractEventLoop, get_running_loop
+from collections import Counter
+from collections.abc import Sequence
+from contextvars import ContextVar
+from threading import Lock
+from time import monotonic, perf_counter_ns
+from typing import LiteralString
+from weakref import WeakKeyDictionary
+
+from asgiref.sync import iscoroutinefunction, sync_to_async
+from django.conf import settings
+from django.core.cache import cache
+from django.db import DEFAULT_DB_ALIAS, connections
+from django.http import HttpRequest, HttpResponse
+from django.utils.decorators import sync_and_async_middleware
+from psycopg import AsyncClientCursor
+from psycopg_pool import AsyncConnectionPool
+
+# Connections of the ORM are taken from psycopg pool (DB_POOL_OPTIONS in settings) and
+# returned after every request, so requests don't pay for connection setup (TCP, auth,
+# session settings). Checkouts are measured by the backend (jiri_one/db/base.py) for
+# every request (Server-Timing header) and for all processes (db_pool_stats command).
+# Sync ORM runs in thread in async views, so async views can run their hot queries on
+# async pool of their event loop instead (DB_ASYNC_QUERIES), without any thread.
+STATS_FLUSH_INTERVAL = 60
+STATS_PREFIX = "db_pool_stats"
+# counters of psycopg pools (pop_stats)
+POOL_STATS = (
+    "connections_num",  # new connections to PostgreSQL
+    "connections_ms",  # time of connection setups (outside of requests)
+    "connections_errors",
+    "connections_lost",  # broken connections found by health checks
+    "requests_queued",  # checkouts which waited for free connection
+    "requests_wait_ms",
+    "requests_errors",  # timeouts of checkouts
+)
+STATS = (
+    "requests",
+    "requests_with_checkout",
+    "checkouts",  # checkouts of ORM connections
+    "checkout_ns",
+    "async_checkouts",  # checkouts from async pools
+    "async_checkout_ns",
+    *POOL_STATS,
+)
+
+# checkout times (ns) of the current request, sync ORM gets it in thread too
+_request_checkouts: ContextVar[list[int] | None] = ContextVar(
+    "request_checkouts", default=None
+)
+_stats = Counter[str]()
+_stats_lock = Lock()
+_stats_flushed = monotonic()
+_async_pools: "WeakKeyDictionary[AbstractEventLoop, AsyncConnectionPool]" = (
+    WeakKeyDictionary()
+)
+
+
+def count(**stats: int) -> bool:
+    """Count stats of this process, True if they should be flushed."""
+    with _stats_lock:
+        _stats.update(stats)
+        return monotonic() - _stats_flushed > STATS_FLUSH_INTERVAL
+
+
+def record_checkout(duration_ns: int, is_async: bool = False) -> None:
+    checkouts = _request_checkouts.get()
+    if checkouts is not None:
+        checkouts.append(duration_ns)
+    with _stats_lock:
+        if is_async:
+            _stats.update(async_checkouts=1, async_checkout_ns=duration_ns)
+        else:
+            _stats.update(checkouts=1, checkout_ns=duration_ns)
+
+
+def pop_pool_stats() -> Counter[str]:
+    """Stats of pools of this process (psycopg resets them)."""
+    pool_stats = Counter[str]()
+    pools = [connections[alias].pool for alias in connections]
+    pools += list(_async_pools.values())
+    for pool in pools:
+        if pool is not None:
+            pool_stats.update(
+                {
+                    name: value
+                    for name, value in pool.pop_stats().items()
+                    if name in POOL_STATS
+                }
+            )
+    return pool_stats
+
+
+def flush_stats() -> None:
+    """Add stats of this process to shared counters (see db_pool_stats command)."""
+    global _stats_flushed
+    pool_stats = pop_pool_stats()
+    with _stats_lock:
+        stats = _stats + pool_stats
+        _stats.clear()
+        _stats_flushed = monotonic()
+    for stat, nr in stats.items():
+        if nr:
+            cache.add(f"{STATS_PREFIX}:{stat}", 0, None)
+            cache.incr(f"{STATS_PREFIX}:{stat}", nr)
+
+
+def get_shared_stats() -> dict[str, float]:
+    """Stats of all processes flushed to cache with average times of checkouts."""
+    values = cache.get_many([f"{STATS_PREFIX}:{name}" for name in STATS])
+    stats: dict[str, float] = {
+        name: values.get(f"{STATS_PREFIX}:{name}", 0) for name in STATS
+    }
+    for prefix in ("", "async_"):
+        nr = stats[f"{prefix}checkouts"]
+        stats[f"{prefix}checkout_avg_ms"] = (
+            stats[f"{prefix}checkout_ns"] / nr / 1e6 if nr else 0
+        )
+    return stats
+
+
+def reset_stats() -> None:
+    pop_pool_stats()
+    with _stats_lock:
+        _stats.clear()
+    cache.delete_many([f"{STATS_PREFIX}:{name}" for name in STATS])
+
+
+def set_server_timing(response: HttpResponse, checkouts: Sequence[int]) -> None:
+    """Checkouts of the request for developer tools of browsers."""
+    count(
+        requests=1,
+        requests_with_checkout=1 if checkouts else 0,
+    )
+    if checkouts:
+        duration = f"{sum(checkouts) / 1e6:.3f}"
+        timing = f'db-checkout;dur={duration};desc="{len(checkouts)} checkouts"'
+        if response.has_header("Server-Timing"):
+            timing = f"{response['Server-Timing']}, {timing}"
+        response["Server-Timing"] = timing
+
+
+@sync_and_async_middleware
+def db_checkout_middleware(get_response):
+    """Checkouts of connections are measured for every request."""
+    if iscoroutinefunction(get_response):
+
+        async def async_middleware(request: HttpRequest) -> HttpResponse:
+            checkouts: list[int] = []
+            token = _request_checkouts.set(checkouts)
+            try:
+                response = await get_response(request)
+            finally:
+                _request_checkouts.reset(token)
+            set_server_timing(response, checkouts)
+            if count():
+                await sync_to_async(flush_stats)()  # cache is sync
+            return response
+
+        return async_middleware
+
+    def sync_middleware(request: HttpRequest) -> HttpResponse:
+        checkouts: list[int] = []
+        token = _request_checkouts.set(checkouts)
+        try:
+            response = get_response(request)
+        finally:
+            _request_checkouts.reset(token)
+        set_server_timing(response, checkouts)
+        if count():
+            flush_stats()
+        return response
+
+    return sync_middleware
+
+
+def get_async_pool_kwargs(alias: str = DEFAULT_DB_ALIAS) -> dict:
+    """Connection parameters of the ORM for async connections."""
+    kwargs = connections[alias].get_connection_params()
+    # Django's cursor is sync, but queries have the same client side binding
+    kwargs["cursor_factory"] = AsyncClientCursor
+    kwargs["autocommit"] = True  # every query is transaction
+    return kwargs
+
+
+async def aget_async_pool() -> AsyncConnectionPool:
+    """Async pool of the running event loop (connections can't move between loops)."""
+    loop = get_running_loop()
+    pool = _async_pools.get(loop)
+    if pool is None:
+        pool = _async_pools.setdefault(
+            loop,
+            AsyncConnectionPool(
+                kwargs=get_async_pool_kwargs(),
+                open=False,
+                check=AsyncConnectionPool.check_connection,
+                **settings.DB_ASYNC_POOL_OPTIONS,
+            ),
+        )
+    if pool.closed:  # the first query in the loop (open of open pool does nothing)
+        await pool.open()
+    return pool
+
+
+async def aclose_async_pool() -> None:
+    pool = _async_pools.pop(get_running_loop(), None)
+    if pool is not None:
+        await pool.close()
+
+
+async def afetch(
+    query: LiteralString, params: dict | Sequence | None = None
+) -> list[tuple]:
+    """Rows of query from connection of async pool."""
+    pool = await aget_async_pool()
+    start = perf_counter_ns()
+    async with pool.connection() as conn:
+        record_checkout(perf_counter_ns() - start, is_async=True)
+        cursor = await conn.execute(query, params)
+        return await cursor.fetchall() if cursor.description else []
@@ -0,0 +1,63 @@
+from collections.abc import Iterable
+from time import time_ns
+
+from django.core.cache import cache
+from django.db.models import Model
+
+# Cached responses (GraphQL responses, whole pages) are stored together with their
+# dependencies - keys of objects (and lists of objects) which were used for them.
+# Every dependency has version (time of the last change) and the response is valid
+# only when it is newer than versions of all its dependencies. Signals change
+# versions, see signals.py.
+DEPENDENCY_PREFIX = "dependency_version"
+
+
+def instance_dependency(instance: Model) -> str:
+    return f"{instance._meta.label_lower}:{instance.pk}"
+
+
+def list_dependency(model: type[Model]) -> str:
+    """Every list of objects (posts on page, search results) depends on all of them."""
+    return model._meta.label_lower
+
+
+def comments_dependency(post_id: int) -> str:
+    return f"comments:{post_id}"
+
+
+async def adependencies_are_valid(dependencies: Iterable[str], created: int) -> bool:
+    dependency_keys = [
+        f"{DEPENDENCY_PREFIX}:{dependency}" for dependency in dependencies
+    ]
+    versions = await cache.aget_many(dependency_keys)
+    # missing version means that we don't know, when the object changed
+    return all(key in versions and versions[key] <= created for key in dependency_keys)
+
+
+async def aregister_dependencies(dependencies: Iterable[str], created: int) -> None:
+    """Created is time before the data were loaded, so changes since then invalidate them."""
+    for dependency in dependencies:
+        # unknown versions are set to the time, when we know the data
+        await cache.aadd(f"{DEPENDENCY_PREFIX}:{dependency}", created, None)
+
+
+def invalidate_dependencies(*dependencies: str) -> None:
+    """Cached responses with any of dependencies won't be used anymore."""
+    version = time_ns()
+    cache.set_many(
+        {f"{DEPENDENCY_PREFIX}:{dependency}": version for dependency in dependencies},
+        None,
+    )
+
+
+async def aget_dependency_versions(dependencies: list[str]) -> list[int]:
+    """Versions (times in ns) of dependencies, unknown versions are set to now."""
+    dependency_keys = [
+        f"{DEPENDENCY_PREFIX}:{dependency}" for dependency in dependencies
+    ]
+    versions = await cache.aget_many(dependency_keys)
+    for key in dependency_keys:
+        if key not in versions:
+            await cache.aadd(key, time_ns(), None)
+            versions[key] = await cache.aget(key)
+    return [versions[key] for key in dependency_keys]
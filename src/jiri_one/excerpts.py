@@ -0,0 +1,21 @@
+from django.conf import settings
+from django.utils.text import Truncator
+
+# Listings show only the beginning of posts, it is computed on save (Post.save),
+# so listing queries don't need to load whole contents (see defer in views and schema).
+READ_MORE = "…"
+# big columns which are not needed for listings
+LISTING_DEFERRED_FIELDS = (
+    "content_cze",
+    "content_eng",
+    "rendered_html_cze",
+    "rendered_html_eng",
+    "search_vector",
+)
+
+
+def make_excerpt(content: str, words: int | None = None) -> tuple[str, bool]:
+    """First words of HTML content with closed tags and if something was cut off."""
+    words = words or settings.EXCERPT_WORDS
+    excerpt = Truncator(content).words(words, html=True, truncate=READ_MORE)
+    return excerpt, excerpt != content
@@ -0,0 +1,160 @@
+import json
+import os
+from dataclasses import dataclass, field
+from ipaddress import IPv4Address, IPv4Network, IPv6Address, IPv6Network, ip_network
+from logging import getLogger
+from threading import Lock, Thread
+from time import time
+
+import httpx
+from django.conf import settings
+
+logger = getLogger("jiri_one")
+
+# IP ranges of GitHub webhooks (hooks from GITHUB_META_URL) are kept in memory of the
+# process and in GITHUB_META_FILE (for restarts). Fresh ranges are used directly, stale
+# ones are used too, but new ranges are fetched in background thread, so only the very
+# first webhook (without file) waits for GitHub.
+FETCH_TIMEOUT = 10
+# errors of unexpected JSON (or of invalid networks in it)
+BROKEN_DATA = (ValueError, KeyError, TypeError)
+
+
+class PrefixTrie:
+    """Binary trie of networks, membership walks at most prefix length bits of address."""
+
+    END = "end"  # key of node, where some network ends
+
+    def __init__(self, networks=()):
+        self.roots: dict[int, dict] = {4: {}, 6: {}}
+        for network in networks:
+            self.add(network)
+
+    def add(self, network: IPv4Network | IPv6Network) -> None:
+        node = self.roots[network.version]
+        address = int(network.network_address)
+        for bit_nr in range(network.prefixlen):
+            bit = (address >> (network.max_prefixlen - 1 - bit_nr)) & 1
+            node = node.setdefault(bit, {})
+        node[self.END] = True
+
+    def __contains__(self, address: IPv4Address | IPv6Address) -> bool:
+        node = self.roots[address.version]
+        bits = int(address)
+        for bit_nr in range(address.max_prefixlen):
+            if self.END in node:
+                return True
+            node = node.get((bits >> (address.max_prefixlen - 1 - bit_nr)) & 1)
+            if node is None:
+                return False
+        return self.END in node
+
+
+@dataclass
+class HookNetworks:
+    networks: list[str]
+    fetched: float  # unix time
+    etag: str | None = None
+    trie: PrefixTrie = field(init=False, repr=False)
+
+    def __post_init__(self):
+        self.trie = PrefixTrie(ip_network(network) for network in self.networks)
+
+    def is_fresh(self) -> bool:
+        return time() - self.fetched < settings.GITHUB_META_TTL
+
+    def save(self) -> None:
+        """Write to GITHUB_META_FILE (other process can read it at the same time)."""
+        path = settings.GITHUB_META_FILE
+        tmp_path = f"{path}.{os.getpid()}.tmp"
+        try:
+            with open(tmp_path, "w") as file:
+                json.dump(
+                    {
+                        "hooks": self.networks,
+                        "fetched": self.fetched,
+                        "etag": self.etag,
+                    },
+                    file,
+                )
+            os.replace(tmp_path, path)
+        except OSError as e:  # networks in memory are still usable
+            logger.error(f"GitHub hooks IP ranges can't be saved to {path}: {e}")
+
+    @classmethod
+    def load(cls) -> "HookNetworks | None":
+        try:
+            with open(settings.GITHUB_META_FILE) as file:
+                data = json.load(file)
+            return cls(data["hooks"], data["fetched"], data.get("etag"))
+        except FileNotFoundError:
+            return None
+        except BROKEN_DATA as e:
+            logger.error(f"File with GitHub hooks IP ranges is broken: {e}")
+            return None
+
+
+# hook networks of this process and lock for their refresh in background
+_hook_networks: HookNetworks | None = None
+_refresh_lock = Lock()
+
+
+def process_response(
+    response: httpx.Response, old: HookNetworks | None
+) -> HookNetworks:
+    if response.status_code == 304 and old is not None:  # ranges are the same
+        new = HookNetworks(old.networks, time(), old.etag)
+    else:
+        response.raise_for_status()
+        new = HookNetworks(
+            response.json()["hooks"], time(), response.headers.get("etag")
+        )
+    new.save()
+    return new
+
+
+def request_headers(old: HookNetworks | None) -> dict[str, str]:
+    if old is not None and old.etag:
+        return {"If-None-Match": old.etag}
+    return {}
+
+
+def refresh_hook_networks() -> None:
+    """Fetch hook networks (in background thread), old ones are kept on error."""
+    global _hook_networks
+    if not _refresh_lock.acquire(blocking=False):
+        return  # other thread is already fetching
+    try:
+        from_file = HookNetworks.load()  # other process could refresh them already
+        if from_file is not None and from_file.is_fresh():
+            _hook_networks = from_file
+            return
+        old = _hook_networks
+        response = httpx.get(
+            settings.GITHUB_META_URL,
+            headers=request_headers(old),
+            timeout=FETCH_TIMEOUT,
+        )
+        _hook_networks = process_response(response, old)
+    except (httpx.HTTPError, *BROKEN_DATA) as e:
+        logger.error(f"Refresh of GitHub hooks IP ranges failed: {e}")
+    finally:
+        _refresh_lock.release()
+
+
+async def aget_hook_networks() -> HookNetworks | None:
+    """Networks of GitHub webhooks, None only if they were never fetched successfully."""
+    global _hook_networks
+    if _hook_networks is None:
+        _hook_networks = HookNetworks.load()
+    if _hook_networks is None:  # nothing to use, we have to wait
+        try:
+            async with httpx.AsyncClient(timeout=FETCH_TIMEOUT) as client:
+                response = await client.get(settings.GITHUB_META_URL)
+            _hook_networks = process_response(response, None)
+        except (httpx.HTTPError, *BROKEN_DATA) as e:
+            logger.error(f"Fetch of GitHub hooks IP ranges failed: {e}")
+            return None
+    elif not _hook_networks.is_fresh():
+        Thread(target=refresh_hook_networks, daemon=True).start()
+    return _hook_networks
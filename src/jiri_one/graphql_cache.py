@@ -0,0 +1,123 @@
+import json
+from collections.abc import Iterable
+from contextlib import suppress
+from functools import lru_cache
+from hashlib import sha256
+from inspect import isawaitable
+
+from django.conf import settings
+from django.core.cache import cache
+from django.db.models import Model
+from graphql import get_named_type, is_leaf_type, parse, print_ast
+
+# internal imports
+from jiri_one.dependencies import (
+    adependencies_are_valid,
+    aregister_dependencies,
+    comments_dependency,
+    instance_dependency,
+    list_dependency,
+)
+
+# Responses of GraphQL queries are cached together with their dependencies (objects
+# which were resolved), see dependencies.py.
+HITS_KEY = "graphql_cache_hits"
+MISSES_KEY = "graphql_cache_misses"
+
+# fields which depend on comments of the post (root)
+COMMENT_FIELDS = {("PostType", "commentsCount"), ("PostType", "comments")}
+
+
+@lru_cache(maxsize=settings.GRAPHQL_DOCUMENT_CACHE_SIZE)
+def normalized_query_hash(query: str) -> str:
+    """The same query with other formatting (whitespace, comments) has the same hash."""
+    return sha256(print_ast(parse(query)).encode()).hexdigest()
+
+
+def response_cache_key(
+    query: str, operation_name: str | None, variables: dict | None
+) -> str:
+    variables_hash = sha256(
+        json.dumps(variables or {}, sort_keys=True, default=str).encode()
+    ).hexdigest()
+    return f"graphql_response:{normalized_query_hash(query)}:{operation_name}:{variables_hash}"
+
+
+class DependencyMiddleware:
+    """GraphQL middleware which collects dependencies of resolved fields."""
+
+    def __init__(self):
+        self.dependencies = set[str]()
+
+    def resolve(self, next, root, info, **kwargs):
+        field = (info.parent_type.name, info.field_name)
+        if field in COMMENT_FIELDS:
+            self.dependencies.add(comments_dependency(root.pk))
+        named_type = get_named_type(info.return_type)
+        if is_leaf_type(named_type):  # scalar fields of objects are nothing new
+            return next(root, info, **kwargs)
+        result = next(root, info, **kwargs)
+        if isawaitable(result):
+            return self.acollect(result, info, named_type)
+        self.collect(result, info, named_type)
+        return result
+
+    async def acollect(self, awaitable_result, info, named_type):
+        result = await awaitable_result
+        self.collect(result, info, named_type)
+        return result
+
+    def collect(self, result, info, named_type) -> None:
+        if isinstance(result, Model):
+            self.dependencies.add(instance_dependency(result))
+            return
+        if isinstance(result, Iterable):
+            self.dependencies.update(
+                instance_dependency(item) for item in result if isinstance(item, Model)
+            )
+        # list in root (or object which was not found) can change with any new object
+        model = getattr(getattr(named_type, "graphene_type", None), "_meta", None)
+        model = getattr(model, "model", None)
+        if info.parent_type.name == "Query" and model is not None:
+            self.dependencies.add(list_dependency(model))
+
+
+async def aincr(key: str) -> None:
+    await cache.aadd(key, 0, None)
+    with suppress(ValueError):  # the key was deleted meanwhile
+        await cache.aincr(key)
+
+
+async def aget_cached_response(cache_key: str) -> dict | None:
+    """Valid cache entry with data of response and time, when they were created."""
+    entry = await cache.aget(cache_key)
+    if entry is not None and await adependencies_are_valid(
+        entry["dependencies"], entry["created"]
+    ):
+        await aincr(HITS_KEY)
+        return entry
+    await aincr(MISSES_KEY)
+    return None
+
+
+async def acache_response(
+    cache_key: str, data: dict, dependencies: set[str], created: int
+) -> None:
+    """Created is time before the execution, so changes during execution invalidate it."""
+    await aregister_dependencies(dependencies, created)
+    await cache.aset(
+        cache_key,
+        {"data": data, "dependencies": sorted(dependencies), "created": created},
+        settings.GRAPHQL_RESPONSE_CACHE_TIMEOUT,
+    )
+
+
+def get_stats() -> dict[str, int | float]:
+    hits = cache.get(HITS_KEY, 0)
+    misses = cache.get(MISSES_KEY, 0)
+    total = hits + misses
+    return {"hits": hits, "misses": misses, "hit_ratio": hits / total if total else 0.0}
+
+
+def reset_stats() -> None:
+    cache.delete_many([HITS_KEY, MISSES_KEY])
@@ -0,0 +1,233 @@
+import json
+from functools import lru_cache
+from inspect import isawaitable
+from time import time_ns
+
+from django.conf import settings
+from django.http import HttpResponse, HttpResponseBadRequest, HttpResponseNotAllowed
+from django.utils.cache import get_conditional_response, patch_cache_control
+from django.views import View
+from graphene_django.views import GraphQLView, HttpError
+from graphql import (
+    DocumentNode,
+    ExecutionResult,
+    GraphQLError,
+    GraphQLSchema,
+    OperationType,
+    execute,
+    parse,
+    validate,
+    validate_schema,
+)
+from graphql.utilities import get_operation_ast
+
+# internal imports
+from jiri_one.conditional import Validators, ns_to_timestamp
+from jiri_one.graphql_cache import (
+    DependencyMiddleware,
+    acache_response,
+    aget_cached_response,
+    response_cache_key,
+)
+from jiri_one.persisted_queries import PersistedQueryError, aresolve_query
+from jiri_one.query_cost import VALIDATION_RULES
+
+
+@lru_cache(maxsize=settings.GRAPHQL_DOCUMENT_CACHE_SIZE)
+def get_validated_document(
+    schema: GraphQLSchema, query: str, validation_rules: tuple | None
+) -> tuple[DocumentNode | None, list[GraphQLError]]:
+    """Parse and validate query - clients send the same few queries, so it is cached.
+
+    Document is None only if query can't be parsed, otherwise errors are validation errors.
+    """
+    schema_validation_errors = validate_schema(schema)
+    if schema_validation_errors:
+        return None, list(schema_validation_errors)
+    try:
+        document = parse(query)
+    except GraphQLError as e:
+        return None, [e]
+    validation_errors = validate(
+        schema, document, list(validation_rules) if validation_rules else None
+    )
+    return document, validation_errors
+
+
+class AsyncGraphQLView(GraphQLView):
+    """GraphQLView which executes queries in event loop (under Daphne/ASGI).
+
+    Resolvers can be coroutines which use async ORM and independent root fields
+    of query are resolved concurrently. Only GraphiQL page is rendered by GraphQLView.
+    """
+
+    validation_rules = VALIDATION_RULES
+
+    def dispatch(self, request, *args, **kwargs):
+        # GraphQLView.dispatch is sync, View.dispatch calls our async get/post
+        return View.dispatch(self, request, *args, **kwargs)
+
+    async def get(self, request, *args, **kwargs):
+        try:
+            data = self.parse_body(request)
+            if self.graphiql and self.can_display_graphiql(request, data):
+                return GraphQLView.dispatch(self, request, *args, **kwargs)
+            result, status_code, cacheable = await self.get_async_response(
+                request, data
+            )
+            response = HttpResponse(
+                status=status_code, content=result, content_type="application/json"
+            )
+            if (
+                cacheable
+            ):  # GET requests (with persisted query) can be cached by HTTP cache
+                patch_cache_control(
+                    response, public=True, max_age=settings.GRAPHQL_GET_MAX_AGE
+                )
+                validators = self.get_validators(request, result)
+                validators.set_headers(response)
+                response = get_conditional_response(
+                    request,
+                    etag=validators.etag,
+                    last_modified=validators.last_modified,
+                    response=response,
+                )
+            if cache_status := getattr(request, "graphql_cache_status", None):
+                response["X-GraphQL-Cache"] = cache_status
+            return response
+        except HttpError as e:
+            response = e.response
+            response["Content-Type"] = "application/json"
+            response.content = self.json_encode(
+                request, {"errors": [self.format_error(e)]}
+            )
+            return response
+
+    post = get
+
+    @staticmethod
+    def get_validators(request, result: str) -> Validators:
+        """Version of cached response is known without encoding, otherwise result is hashed."""
+        version = getattr(request, "graphql_response_version", None)
+        if version is None:
+            return Validators.from_versions(request.get_full_path(), result)
+        return Validators.from_versions(
+            request.get_full_path(), version, last_modified=ns_to_timestamp(version)
+        )
+
+    @staticmethod
+    def get_extensions(request, data) -> dict | None:
+        extensions = request.GET.get("extensions") or data.get("extensions")
+        if extensions and isinstance(extensions, str):
+            try:
+                extensions = json.loads(extensions)
+            except ValueError as e:
+                raise HttpError(
+                    HttpResponseBadRequest("Extensions are invalid JSON.")
+                ) from e
+        return extensions
+
+    async def get_async_response(self, request, data) -> tuple[str, int, bool]:
+        query, variables, operation_name, _ = self.get_graphql_params(request, data)
+        try:
+            query = await aresolve_query(query, self.get_extensions(request, data))
+        except PersistedQueryError as e:
+            # PersistedQueryNotFound is not real error, client sends whole query again
+            status_code = 200 if e.code == "PERSISTED_QUERY_NOT_FOUND" else 400
+            return (
+                self.json_encode(request, {"errors": [e.formatted]}),
+                status_code,
+                False,
+            )
+        execution_result = await self.aexecute_graphql_request(
+            request, query, variables, operation_name
+        )
+        status_code = 200
+        response = {}
+        if execution_result.errors:
+            response["errors"] = [self.format_error(e) for e in execution_result.errors]
+        if execution_result.errors and any(
+            not getattr(e, "path", None) for e in execution_result.errors
+        ):
+            status_code = 400
+        else:
+            response["data"] = execution_result.data
+        cacheable = request.method == "GET" and not execution_result.errors
+        return self.json_encode(request, response), status_code, cacheable
+
+    def get_document(self, request, query: str, operation_name: str | None):
+        """Parse and validate query, returns document or ExecutionResult with errors."""
+        document, errors = get_validated_document(
+            self.schema.graphql_schema,
+            query,
+            tuple(self.validation_rules) if self.validation_rules else None,
+        )
+        if document is None:
+            return ExecutionResult(errors=errors)
+
+        operation_ast = get_operation_ast(document, operation_name)
+        if (
+            request.method.lower() == "get"
+            and operation_ast is not None
+            and operation_ast.operation != OperationType.QUERY
+        ):
+            raise HttpError(
+                HttpResponseNotAllowed(
+                    ["POST"],
+                    f"Can only perform a {operation_ast.operation.value} operation from a POST request.",
+                )
+            )
+        if errors:
+            return ExecutionResult(data=None, errors=errors)
+        return document
+
+    async def aexecute_graphql_request(
+        self, request, query, variables, operation_name
+    ) -> ExecutionResult:
+        if not query:
+            raise HttpError(HttpResponseBadRequest("Must provide query string."))
+        document = self.get_document(request, query, operation_name)
+        if isinstance(document, ExecutionResult):
+            return document
+
+        middleware = self.get_middleware(request)
+        operation_ast = get_operation_ast(document, operation_name)
+        # only queries are cached, mutations are always executed
+        cache_key = ""
+        dependency_middleware: DependencyMiddleware | None = None
+        created = 0
+        if (
+            settings.GRAPHQL_RESPONSE_CACHE_TIMEOUT
+            and operation_ast is not None
+            and operation_ast.operation == OperationType.QUERY
+        ):
+            cache_key = response_cache_key(query, operation_name, variables)
+            entry = await aget_cached_response(cache_key)
+            request.graphql_cache_status = "HIT" if entry is not None else "MISS"
+            if entry is not None:
+                request.graphql_response_version = entry["created"]
+                return ExecutionResult(data=entry["data"])
+            dependency_middleware = DependencyMiddleware()
+            middleware = [*(middleware or []), dependency_middleware]
+            created = time_ns()
+
+        try:
+            result = execute(
+                self.schema.graphql_schema,
+                document,
+                root_value=self.get_root_value(request),
+                context_value=self.get_context(request),
+                variable_values=variables,
+                operation_name=operation_name,
+                middleware=middleware,
+            )
+            if isawaitable(result):
+                result = await result
+        except Exception as e:
+            return ExecutionResult(errors=[e])
+        if dependency_middleware and not result.errors and result.data is not None:
+            await acache_response(
+                cache_key, result.data, dependency_middleware.dependencies, created
+            )
+            request.graphql_response_version = created
+        return result
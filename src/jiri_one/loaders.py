@@ -0,0 +1,43 @@
+from collections import defaultdict
+
+from graphene.utils.dataloader import DataLoader
+
+# internal imports
+from jiri_one.models import Post
+from jiri_one.tags import aget_tag_registry
+
+# Every loader collects keys requested by resolvers in one tick of event loop and loads
+# all of them in one query, so a page of posts needs the same nr of queries for every size.
+
+
+class TagsLoader(DataLoader):
+    async def batch_load_fn(self, post_ids):
+        """Only ids are loaded from DB, tags itself are taken from tag registry."""
+        tag_registry = await aget_tag_registry()
+        order = {tag.pk: index for index, tag in enumerate(tag_registry.tags)}
+        tags_by_pk = {tag.pk: tag for tag in tag_registry.tags}
+        tags = defaultdict(list)
+        async for post_id, tag_id in Post.tags.through.objects.filter(
+            post_id__in=post_ids
+        ).values_list("post_id", "tag_id"):
+            tags[post_id].append(tags_by_pk[tag_id])
+        return [
+            sorted(tags[post_id], key=lambda tag: order[tag.pk]) for post_id in post_ids
+        ]
+
+
+class Loaders:
+    """All loaders for one GraphQL request."""
+
+    def __init__(self):
+        self.tags = TagsLoader()
+
+
+def get_loaders(info) -> Loaders:
+    """Loaders are stored in request (GraphQL context), so they live only for one request."""
+    request = info.context
+    loaders = getattr(request, "loaders", None)
+    if loaders is None:
+        loaders = Loaders()
+        request.loaders = loaders
+    return loaders
@@ -0,0 +1,120 @@
+import asyncio
+import re
+from statistics import median, quantiles
+from time import perf_counter
+
+import httpx
+from django.core.asgi import get_asgi_application
+from django.core.management.base import BaseCommand, CommandError
+from django.db import DEFAULT_DB_ALIAS, connections
+from django.test import override_settings
+
+# internal imports
+from jiri_one.db_pool import aclose_async_pool, pop_pool_stats
+from jiri_one.models import Post
+
+SERVER_TIMING_RE = re.compile(r"db-checkout;dur=([\d.]+)")
+MODES = {  # name: (pool, async queries)
+    "no pool": (False, False),
+    "pool": (True, False),
+    "pool+async": (True, True),
+}
+
+
+def p95(values: list[float]) -> float:
+    return quantiles(values, n=20)[-1] if len(values) > 1 else values[0]
+
+
+class Command(BaseCommand):
+    help = "Load test of page through ASGI with new connection per request, pool and async pool"
+
+    def add_arguments(self, parser):
+        parser.add_argument("--path", help="Default is page of the newest post.")
+        parser.add_argument("--requests", type=int, default=500)
+        parser.add_argument("--concurrency", type=int, default=8)
+        parser.add_argument(
+            "--no-page-cache",
+            action="store_true",
+            help="Render every page (more queries per request).",
+        )
+
+    def set_pool(self, enabled: bool) -> None:
+        """Pool of ORM on or off (connections of threads are created from settings)."""
+        connections[DEFAULT_DB_ALIAS].close_pool()
+        database = connections.settings[DEFAULT_DB_ALIAS]
+        if enabled:
+            database["OPTIONS"]["pool"] = self.pool_options
+        else:
+            database["OPTIONS"].pop("pool", None)
+
+    async def measure(self, client, path: str, nr_of_requests: int, concurrency: int):
+        latencies: list[float] = []
+        checkouts: list[float] = []
+        requests = iter(range(nr_of_requests))
+
+        async def worker():
+            for _ in requests:
+                start = perf_counter()
+                response = await client.get(path)
+                latencies.append((perf_counter() - start) * 1000)
+                if response.status_code != 200:
+                    raise CommandError(f"{path} returned {response.status_code}")
+                timing = SERVER_TIMING_RE.search(response.headers.get("Server-Timing", ""))
+                checkouts.append(float(timing[1]) if timing else 0.0)
+
+        await asyncio.gather(*(worker() for _ in range(concurrency)))
+        return latencies, checkouts
+
+    async def run(self, path: str, options) -> dict:
+        results = {}
+        transport = httpx.ASGITransport(app=get_asgi_application())
+        async with httpx.AsyncClient(
+            transport=transport, base_url="http://127.0.0.1"
+        ) as client:
+            for name, (pool, async_queries) in MODES.items():
+                self.set_pool(pool)
+                with override_settings(DB_ASYNC_QUERIES=async_queries):
+                    # warm up (pools are filled, page is cached), it is not measured
+                    await self.measure(client, path, options["concurrency"] * 2, options["concurrency"])
+                    pop_pool_stats()
+                    latencies, checkouts = await self.measure(
+                        client, path, options["requests"], options["concurrency"]
+                    )
+                    pool_stats = pop_pool_stats()
+                    await aclose_async_pool()
+                connects = pool_stats["connections_num"] if pool else sum(1 for checkout in checkouts if checkout)
+                results[name] = (latencies, checkouts, connects)
+        return results
+
+    def report(self, name: str, latencies, checkouts, connects: int) -> None:
+        self.stdout.write(
+            f"{name:<11} latency median {median(latencies):7.2f} ms  p95 {p95(latencies):7.2f} ms"
+            f"   checkout median {median(checkouts):6.3f} ms  p95 {p95(checkouts):6.3f} ms"
+            f"   new connections {connects}"
+        )
+
+    def handle(self, *args, **options):
+        path = options["path"]
+        if path is None:
+            post = Post.objects.order_by("-pub_time").only("url_cze").first()
+            if post is None:
+                raise CommandError("There is no post, use --path.")
+            path = f"/{post.url_cze}/"
+        self.pool_options = connections.settings[DEFAULT_DB_ALIAS]["OPTIONS"].get("pool")
+        if not self.pool_options:
+            raise CommandError("Pool is not enabled in DATABASES (OPTIONS['pool']).")
+        connections.close_all()
+        overrides = {"PAGE_CACHE_TIMEOUT": 0} if options["no_page_cache"] else {}
+        try:
+            with override_settings(**overrides):
+                results = asyncio.run(self.run(path, options))
+        finally:
+            self.set_pool(True)
+        for name, result in results.items():
+            self.report(name, *result)
+        no_pool, pool = median(results["no pool"][0]), median(results["pool"][0])
+        self.stdout.write(
+            self.style.SUCCESS(
+                f"Successfully load tested {path}, median latency with pool is {no_pool - pool:.2f} ms lower ({no_pool / pool:.2f}x)."
+            )
+        )
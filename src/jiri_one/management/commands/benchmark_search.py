@@ -0,0 +1,85 @@
+import random
+from statistics import median, quantiles
+from time import perf_counter
+
+from django.conf import settings
+from django.core.management.base import BaseCommand
+from django.db import connection, transaction
+from django.db.models import Max
+from jiri_one.models import Author, Post
+from jiri_one.search import fulltext_search, substring_search, update_search_vectors
+
+SYLLABLES = ["ko", "ča", "py", "ton", "li", "nux", "hra", "ří", "še", "mo", "du", "lá"]
+
+
+class Rollback(Exception):
+    """Raised at the end of benchmark to throw away seeded posts."""
+
+
+def random_word(rnd: random.Random) -> str:
+    return "".join(rnd.choices(SYLLABLES, k=rnd.randint(2, 4)))
+
+
+class Command(BaseCommand):
+    help = "Compare latency of full-text and substring search on seeded archive (everything is rolled back)"
+
+    def add_arguments(self, parser):
+        parser.add_argument("--posts", type=int, default=20000)
+        parser.add_argument("--words", type=int, default=400, help="Words per post.")
+        parser.add_argument("--repeat", type=int, default=20)
+        parser.add_argument("--seed", type=int, default=42)
+
+    def seed_posts(self, nr_of_posts: int, nr_of_words: int, rnd: random.Random):
+        author, _ = Author.objects.get_or_create(
+            nick="Benchmark",
+            defaults={"first_name": "Bench", "last_name": "Mark"},
+        )
+        first_id = (Post.objects.aggregate(Max("id"))["id__max"] or 0) + 1
+        vocabulary = [random_word(rnd) for _ in range(5000)]
+        posts = [
+            Post(
+                id=first_id + index,
+                title_cze=f"Benchmark {index} {' '.join(rnd.choices(vocabulary, k=4))}",
+                url_cze=f"benchmark-{index}",
+                content_cze="<p>"
+                + " ".join(rnd.choices(vocabulary, k=nr_of_words))
+                + "</p>",
+                author=author,
+            )
+            for index in range(nr_of_posts)
+        ]
+        Post.objects.bulk_create(posts, batch_size=1000)
+        update_search_vectors(Post.objects.filter(id__gte=first_id))
+        with connection.cursor() as cursor:
+            cursor.execute("ANALYZE jiri_one_post")
+        return vocabulary
+
+    def measure(self, queryset_factory, words: list[str]) -> list[float]:
+        timings = []
+        for word in words:
+            start = perf_counter()
+            list(queryset_factory(Post.objects.all(), word)[: settings.POSTS_ON_PAGE])
+            timings.append((perf_counter() - start) * 1000)
+        return timings
+
+    def report(self, name: str, timings: list[float]):
+        p95 = quantiles(timings, n=20)[-1] if len(timings) > 1 else timings[0]
+        self.stdout.write(
+            f"{name:<12} median {median(timings):8.2f} ms   p95 {p95:8.2f} ms"
+        )
+
+    def handle(self, *args, **options):
+        rnd = random.Random(options["seed"])
+        try:
+            with transaction.atomic():
+                start = perf_counter()
+                vocabulary = self.seed_posts(options["posts"], options["words"], rnd)
+                self.stdout.write(
+                    f"Seeded {options['posts']} posts in {perf_counter() - start:.1f} s"
+                )
+                words = rnd.choices(vocabulary, k=options["repeat"])
+                self.report("substring", self.measure(substring_search, words))
+                self.report("fulltext", self.measure(fulltext_search, words))
+                raise Rollback
+        except Rollback:
+            self.stdout.write(self.style.SUCCESS("Benchmark done, seeded posts removed."))
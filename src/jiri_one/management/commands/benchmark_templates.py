@@ -0,0 +1,112 @@
+from copy import deepcopy
+from datetime import timedelta
+from statistics import median, quantiles
+from time import perf_counter
+
+from django.conf import settings
+from django.contrib.auth.models import AnonymousUser
+from django.core.management.base import BaseCommand
+from django.core.paginator import Paginator
+from django.template.loader import render_to_string
+from django.test import RequestFactory, override_settings
+from django.utils import timezone
+from jiri_one.models import Author, Post, Tag
+from jiri_one.page_cache import CSRF_TOKEN_PLACEHOLDER
+from jiri_one.tags import build_registry
+from jiri_one.views import get_post_html_tags
+
+DUMMY_CACHE = {"BACKEND": "django.core.cache.backends.dummy.DummyCache"}
+
+
+def templates_settings(debug: bool) -> list[dict]:
+    templates = deepcopy(settings.TEMPLATES)
+    templates[0]["OPTIONS"]["debug"] = debug
+    return templates
+
+
+class Command(BaseCommand):
+    help = "Compare render time of index.html before (debug templates, no fragment cache) and after (nothing is saved)"
+
+    def add_arguments(self, parser):
+        parser.add_argument("--repeat", type=int, default=500)
+        parser.add_argument("--tags", type=int, default=30)
+        parser.add_argument(
+            "--posts",
+            type=int,
+            default=settings.POSTS_ON_PAGE,
+            help="Posts on page (0 measures only navigation and footer).",
+        )
+
+    def make_context(self, nr_of_tags: int, nr_of_posts: int) -> dict:
+        """Context like in IndexView, objects are only in memory (no queries)."""
+        tags = [
+            Tag(id=nr, name_cze=f"Tag {nr}", url_cze=f"tag-{nr}", order=nr)
+            for nr in range(1, nr_of_tags + 1)
+        ]
+        for tag in tags:
+            tag.posts_count = 10  # type: ignore[attr-defined]
+        registry = build_registry(1, tags)
+        author = Author(nick="Benchmark", first_name="Bench", last_name="Mark")
+        now = timezone.now()
+        posts = []
+        for nr in range(nr_of_posts):
+            post = Post(
+                id=nr + 1,
+                title_cze=f"Příspěvek {nr}",
+                url_cze=f"prispevek-{nr}",
+                excerpt_cze="<p>" + "slovo " * settings.EXCERPT_WORDS + "…</p>",
+                has_more_cze=True,
+                pub_time=now - timedelta(days=nr),
+                author=author,
+            )
+            post.html_tags = get_post_html_tags(tags[nr % len(tags) :][:3])
+            posts.append(post)
+        return {
+            "page_obj": Paginator(posts * 3, settings.POSTS_ON_PAGE).page(1)
+            if posts
+            else None,
+            "posts": posts,
+            "all_tags": registry.html,
+            "tags_version": registry.version,
+            "tag": None,
+            "searched_word": None,
+            "csrf_token": CSRF_TOKEN_PLACEHOLDER,
+        }
+
+    def measure(self, context: dict, repeat: int) -> list[float]:
+        request = RequestFactory().get("/")
+        request.user = AnonymousUser()
+        render_to_string("index.html", context, request)  # compiling, cache of fragments
+        timings = []
+        for _ in range(repeat):
+            start = perf_counter()
+            render_to_string("index.html", context, request)
+            timings.append((perf_counter() - start) * 1000)
+        return timings
+
+    def report(self, name: str, timings: list[float]) -> None:
+        p95 = quantiles(timings, n=20)[-1] if len(timings) > 1 else timings[0]
+        self.stdout.write(
+            f"{name:<8} median {median(timings):8.3f} ms   p95 {p95:8.3f} ms"
+        )
+
+    def handle(self, *args, **options):
+        context = self.make_context(options["tags"], options["posts"])
+        caches = settings.CACHES
+        with override_settings(
+            TEMPLATES=templates_settings(debug=True),
+            CACHES={**caches, "template_fragments": DUMMY_CACHE},
+        ):
+            before = self.measure(context, options["repeat"])
+        with override_settings(
+            TEMPLATES=templates_settings(debug=False),
+            CACHES=caches,
+        ):
+            after = self.measure(context, options["repeat"])
+        self.report("before", before)
+        self.report("after", after)
+        self.stdout.write(
+            self.style.SUCCESS(
+                f"Successfully benchmarked rendering of index.html, after is {median(before) / median(after):.2f}x faster."
+            )
+        )
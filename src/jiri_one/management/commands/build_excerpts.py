@@ -0,0 +1,48 @@
+from datetime import datetime
+
+from django.core.management.base import BaseCommand
+from jiri_one.dependencies import invalidate_dependencies, list_dependency
+from jiri_one.excerpts import make_excerpt
+from jiri_one.models import Post
+from jiri_one.pagination import bump_listing_version
+
+
+class Command(BaseCommand):
+    help = "Backfill/rebuild excerpts of posts for listings"
+
+    def add_arguments(self, parser):
+        parser.add_argument("--batch-size", type=int, default=500)
+
+    def handle(self, *args, **options):
+        start_time = datetime.now()
+        batch_size = options["batch_size"]
+        # posts are streamed from server side cursor, so whole archive is never in memory
+        posts = (
+            Post.objects.only("id", "rendered_html_cze")
+            .order_by("id")
+            .iterator(chunk_size=batch_size)
+        )
+        batch = list[Post]()
+        updated = 0
+        for post in posts:
+            post.excerpt_cze, post.has_more_cze = make_excerpt(post.rendered_html_cze)
+            batch.append(post)
+            if len(batch) == batch_size:
+                updated += self.save_batch(batch)
+                batch = []
+        updated += self.save_batch(batch)
+        # bulk_update doesn't send signals (and doesn't change mod_time)
+        invalidate_dependencies(list_dependency(Post))
+        bump_listing_version()
+        time = datetime.now() - start_time
+        self.stdout.write(
+            self.style.SUCCESS(
+                f"Successfully built excerpts of {updated} posts and it takes {time.seconds//60} minutes and {time.seconds%60} seconds."
+            )
+        )
+
+    @staticmethod
+    def save_batch(batch: list[Post]) -> int:
+        if not batch:
+            return 0
+        return Post.objects.bulk_update(batch, ["excerpt_cze", "has_more_cze"])
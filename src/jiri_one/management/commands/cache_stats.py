@@ -0,0 +1,29 @@
+from django.core.cache import caches
+from django.core.management.base import BaseCommand, CommandError
+
+# internal imports
+from jiri_one.cache_backends import TwoTierCache
+
+
+class Command(BaseCommand):
+    help = "Show hits and misses of both tiers of default cache (all processes)"
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--reset", action="store_true", help="Set counters to zero after showing."
+        )
+
+    def handle(self, *args, **options):
+        cache = caches["default"]
+        if not isinstance(cache, TwoTierCache):
+            raise CommandError("Default cache is not TwoTierCache.")
+        cache.flush_stats()  # stats of this process are not in shared counters yet
+        stats = cache.get_shared_stats()
+        for tier in ("l1", "l2"):
+            self.stdout.write(
+                self.style.SUCCESS(
+                    f"{tier.upper()} hits: {stats[f'{tier}_hits']}, misses: {stats[f'{tier}_misses']}, hit ratio: {stats[f'{tier}_hit_ratio']:.1%}"
+                )
+            )
+        if options["reset"]:
+            cache.reset_stats()
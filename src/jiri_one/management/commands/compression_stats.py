@@ -0,0 +1,29 @@
+from django.core.management.base import BaseCommand
+
+# internal imports
+from jiri_one.compression import flush_stats, get_shared_stats, reset_stats
+
+
+class Command(BaseCommand):
+    help = "Show compression ratio and CPU time of response compression (all processes)"
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--reset", action="store_true", help="Set counters to zero after showing."
+        )
+
+    def handle(self, *args, **options):
+        flush_stats()  # stats of this process are not in shared counters yet
+        stats = get_shared_stats()
+        self.stdout.write(
+            self.style.SUCCESS(
+                f"Compressed responses: {stats['responses']} ({stats['precompressed']} precompressed pages), cache hits: {stats['cache_hits']}, misses: {stats['cache_misses']}, too small: {stats['too_small']}"
+            )
+        )
+        self.stdout.write(
+            self.style.SUCCESS(
+                f"Compressed {stats['bytes_in']} bytes to {stats['bytes_out']} bytes, ratio: {stats['ratio']:.1%}, CPU time: {stats['cpu_ns'] / 1e6:.1f} ms"
+            )
+        )
+        if options["reset"]:
+            reset_stats()
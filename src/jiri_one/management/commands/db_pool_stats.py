@@ -0,0 +1,29 @@
+from django.core.management.base import BaseCommand
+
+# internal imports
+from jiri_one.db_pool import flush_stats, get_shared_stats, reset_stats
+
+
+class Command(BaseCommand):
+    help = "Show checkouts of database connections and stats of connection pools (all processes)"
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--reset", action="store_true", help="Set counters to zero after showing."
+        )
+
+    def handle(self, *args, **options):
+        flush_stats()  # stats of this process are not in shared counters yet
+        stats = get_shared_stats()
+        self.stdout.write(
+            self.style.SUCCESS(
+                f"Requests: {stats['requests']} ({stats['requests_with_checkout']} with checkout), checkouts: {stats['checkouts']} (avg {stats['checkout_avg_ms']:.3f} ms), async checkouts: {stats['async_checkouts']} (avg {stats['async_checkout_avg_ms']:.3f} ms)"
+            )
+        )
+        self.stdout.write(
+            self.style.SUCCESS(
+                f"New connections: {stats['connections_num']} ({stats['connections_ms']} ms), errors: {stats['connections_errors']}, lost: {stats['connections_lost']}, waiting checkouts: {stats['requests_queued']} ({stats['requests_wait_ms']} ms), timeouts: {stats['requests_errors']}"
+            )
+        )
+        if options["reset"]:
+            reset_stats()
@@ -0,0 +1,21 @@
+from django.core.management.base import BaseCommand
+from jiri_one.graphql_cache import get_stats, reset_stats
+
+
+class Command(BaseCommand):
+    help = "Show hits and misses of GraphQL response cache"
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--reset", action="store_true", help="Set counters to zero after showing."
+        )
+
+    def handle(self, *args, **options):
+        stats = get_stats()
+        self.stdout.write(
+            self.style.SUCCESS(
+                f"Hits: {stats['hits']}, misses: {stats['misses']}, hit ratio: {stats['hit_ratio']:.1%}"
+            )
+        )
+        if options["reset"]:
+            reset_stats()
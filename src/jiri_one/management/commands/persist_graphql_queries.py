@@ -0,0 +1,33 @@
+import json
+from pathlib import Path
+
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+from jiri_one.persisted_queries import query_hash
+
+
+class Command(BaseCommand):
+    help = "Register GraphQL queries (files with one query) to allow list of persisted queries"
+
+    def add_arguments(self, parser):
+        parser.add_argument("files", nargs="+", type=Path)
+
+    def handle(self, *args, **options):
+        allow_list_path = Path(settings.GRAPHQL_PERSISTED_QUERIES_FILE)
+        allow_list = {}
+        if allow_list_path.exists():
+            allow_list = json.loads(allow_list_path.read_text())
+        for path in options["files"]:
+            if not path.exists():
+                raise CommandError(f"File {path} does not exist.")
+            # the hash has to be computed from exactly the same text, which client sends
+            query = path.read_text()
+            sha256_hash = query_hash(query)
+            allow_list[sha256_hash] = query
+            self.stdout.write(f"{sha256_hash} {path}")
+        allow_list_path.write_text(json.dumps(allow_list, indent=2))
+        self.stdout.write(
+            self.style.SUCCESS(
+                f"Successfully saved {len(allow_list)} queries to {allow_list_path}, restart server to load them."
+            )
+        )
@@ -0,0 +1,35 @@
+from django.core.management.base import BaseCommand
+from datetime import datetime
+from jiri_one.models import Post
+from jiri_one.search import update_search_vectors
+
+
+class Command(BaseCommand):
+    help = "Backfill/rebuild full-text search vectors of all posts"
+
+    def add_arguments(self, parser):
+        parser.add_argument("--batch-size", type=int, default=500)
+        parser.add_argument(
+            "--only-missing",
+            action="store_true",
+            help="Update only posts without search vector.",
+        )
+
+    def handle(self, *args, **options):
+        start_time = datetime.now()
+        batch_size = options["batch_size"]
+        queryset = Post.objects.order_by("id")
+        if options["only_missing"]:
+            queryset = queryset.filter(search_vector__isnull=True)
+        ids = list(queryset.values_list("id", flat=True))
+        updated = 0
+        # in batches, so we don't lock whole table in one long UPDATE
+        for index in range(0, len(ids), batch_size):
+            batch_ids = ids[index : index + batch_size]
+            updated += update_search_vectors(Post.objects.filter(id__in=batch_ids))
+        time = datetime.now() - start_time
+        self.stdout.write(
+            self.style.SUCCESS(
+                f"Successfully rebuilt search vectors of {updated} posts and it takes {time.seconds//60} minutes and {time.seconds%60} seconds."
+            )
+        )
@@ -0,0 +1,57 @@
+from datetime import datetime
+
+from django.core.management.base import BaseCommand
+from django.db.models import Count, F, OuterRef, Subquery
+from django.db.models.functions import Coalesce
+from jiri_one.dependencies import (
+    comments_dependency,
+    invalidate_dependencies,
+    list_dependency,
+)
+from jiri_one.models import Comment, Post
+
+
+class Command(BaseCommand):
+    help = "Repair denormalised Post.comment_count from real nr of comments"
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--dry-run",
+            action="store_true",
+            help="Only show posts with wrong count.",
+        )
+
+    def handle(self, *args, **options):
+        start_time = datetime.now()
+        real_count = Coalesce(
+            Subquery(
+                Comment.objects.filter(post=OuterRef("pk"))
+                .order_by()
+                .values("post")
+                .annotate(count=Count("id"))
+                .values("count")
+            ),
+            0,
+        )
+        drifted = list(
+            Post.objects.annotate(real_count=real_count)
+            .exclude(comment_count=F("real_count"))
+            .values_list("id", "comment_count", "real_count")
+        )
+        for post_id, comment_count, count in drifted:
+            self.stdout.write(f"Post {post_id}: {comment_count} -> {count}")
+        if drifted and not options["dry_run"]:
+            drifted_ids = [post_id for post_id, _, _ in drifted]
+            # counted again in the UPDATE, so comments added meanwhile are counted too
+            Post.objects.filter(id__in=drifted_ids).update(comment_count=real_count)
+            # update doesn't send signals
+            invalidate_dependencies(
+                list_dependency(Comment),
+                *(comments_dependency(post_id) for post_id in drifted_ids),
+            )
+        time = datetime.now() - start_time
+        self.stdout.write(
+            self.style.SUCCESS(
+                f"Successfully checked comment counts, {len(drifted)} posts were wrong and it takes {time.seconds//60} minutes and {time.seconds%60} seconds."
+            )
+        )
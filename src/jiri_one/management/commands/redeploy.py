@@ -1,49 +1,45 @@
-from django.core.management.base import BaseCommand, CommandError
-from subprocess import run, CalledProcessError
-from os import getcwd, chdir
 from datetime import datetime
-from textwrap import dedent
+
+from django.core.management.base import BaseCommand, CommandError
+
+# internal imports
+from jiri_one.models import DeployJob
+from jiri_one.releases import DeployError, enqueue_deploy, run_deploy_queue
 
 
 class Command(BaseCommand):
-    help = "Redeploy whole blog from GitHub code"
+    help = "Redeploy whole blog from GitHub code (build new release and switch to it)"
 
     def add_arguments(self, parser):
-        parser.add_argument("commit", type=str)
+        parser.add_argument("commit", type=str, nargs="?")
+        parser.add_argument(
+            "--worker",
+            action="store_true",
+            help="Only run queued deploy jobs (it is started by DeployApiView).",
+        )
 
     def handle(self, *args, **options):
+        start_time = datetime.now()
         commit = options["commit"]
-        if getcwd() != "/srv/http/virtual/jiri.one":
-            chdir("/srv/http/virtual/jiri.one")
-        try:
-            run(f"git fetch R {commit}", shell=True, check=True)
-            run(f"git reset --hard {commit}", shell=True, check=True)
-            run("poetry install --no-root --with production", shell=True, check=True)
-            run(
-                "poetry run python manage.py collectstatic --no-input",
-                shell=True,
-                check=True,
-            )
-            run(
-                "systemctl --user restart gunicorn_jiri_one.socket",
-                shell=True,
-                check=True,
+        if commit is None and not options["worker"]:
+            raise CommandError("Commit is required (or use --worker).")
+        if commit is not None:
+            try:
+                job = enqueue_deploy(commit)
+            except DeployError as e:
+                raise CommandError(e) from e
+            self.stdout.write(f"Deploy job {job.pk} of commit {job.commit} is queued.")
+        jobs = run_deploy_queue(log=self.stdout.write)
+        if not jobs:
+            self.stdout.write("Queue is empty or other deploy worker runs it.")
+        failed = [job for job in jobs if job.status == DeployJob.Status.FAILED]
+        time = datetime.now() - start_time
+        if failed:
+            raise CommandError(
+                f"Deploy of {', '.join(job.commit for job in failed)} failed, see log of deploy jobs."
             )
-        except CalledProcessError as e:
-            with open("logs/deploy_error.txt", "w+") as file:
-                file.write(
-                    dedent(
-                        f"""
-                    Log datetime: {datetime.now().isoformat()}
-                    Command that was used to spawn the child process: {e.cmd}
-                    Output of the child process {e.stdout}
-                    Stderr out {e.stderr}
-                    """
-                    )
-                )
-            self.stdout.write(
-                self.style.ERROR(
-                    "Something went wrong in subprocess call! check logs/deploy_error.txt"
-                )
+        self.stdout.write(
+            self.style.SUCCESS(
+                f"Successfully deployed {len(jobs)} releases and it takes {time.seconds//60} minutes and {time.seconds%60} seconds."
             )
-            raise CommandError(e)
+        )
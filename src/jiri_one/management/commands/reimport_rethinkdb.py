@@ -1,17 +1,15 @@
 from django.core.management.base import BaseCommand, CommandError
 from django.db.utils import OperationalError
 from datetime import datetime
-from zoneinfo import ZoneInfo
 from rethinkdb import RethinkDB
 from rethinkdb.errors import ReqlDriverError
-from jiri_one.models import Post, Tag, Author
+from jiri_one.rethinkdb_import import ImportStats, RethinkDBImporter
 
 
 class Command(BaseCommand):
     help = "Import/update new data from RethinkDB"
-    europe_prague = ZoneInfo("Europe/Prague")
 
-    def update_django_from_rethinkdb(self, options):
+    def update_django_from_rethinkdb(self, options) -> ImportStats:
         # create RethinkDB connection and settings
         rdb_ip = options["rdb_ip"]
         rdb_port = options["rdb_port"]
@@ -19,50 +17,42 @@ class Command(BaseCommand):
         r = RethinkDB()
         conn = r.connect(rdb_ip, rdb_port, db=db_name)
 
-        topics = r.table("topics")
+        # all topics are loaded once, posts are streamed from cursor (without order_by,
+        # which would load whole table in RethinkDB)
+        importer = RethinkDBImporter(
+            r.table("topics").run(conn), batch_size=options["batch_size"]
+        )
         posts = r.table("posts")
-        for post in posts.order_by(r.asc("when")).run(conn):
-            dict_row = {}
-            dict_row["title_cze"] = post["header"]["cze"]
-            dict_row["content_cze"] = post["content"]["cze"]
-            dict_row["pub_time"] = datetime.strptime(
-                post["when"], "%Y-%m-%d %H:%M:%S"
-            ).astimezone(self.europe_prague)
-            # dict_row["mod_time"] = ...
-            dict_row["author"], _ = Author.objects.get_or_create(
-                nick="Jiří",
-                defaults={"nick": "Jiří", "first_name": "Jiří", "last_name": "Němec"},
-            )
-            tags = []
-            for tag in post["topics"]["cze"].split(";")[:-1]:
-                topic = list(topics.filter(r.row["topic"]["cze"] == tag).run(conn))[0]
-                tag_to_add, _ = Tag.objects.get_or_create(
-                    name_cze=tag,
-                    defaults={
-                        "name_cze": tag,
-                        "desc_cze": topic["description"]["cze"],
-                        "order": topic["order"],
-                    },
-                )
-                tags.append(tag_to_add)
-            django_post, _ = Post.objects.update_or_create(
-                title_cze=dict_row["title_cze"], defaults={**dict_row}
-            )
-            django_post.save()
-            django_post.tags.add(*tags)
+        if options["since"]:
+            # >=, because more posts can have the same `when` as the watermark (posts
+            # at the watermark are imported again, which only updates them)
+            posts = posts.filter(r.row["when"] >= options["since"])
+        return importer.run(posts.run(conn))
 
     def add_arguments(self, parser):
         parser.add_argument("--rdb_ip", type=str, default="localhost")
         parser.add_argument("--rdb_port", type=int, default=28015)
+        parser.add_argument("--batch-size", type=int, default=500)
+        parser.add_argument(
+            "--since",
+            type=str,
+            default=None,
+            help="Import only posts published at or after this watermark (YYYY-MM-DD HH:MM:SS), it is printed after every import. Posts have no modification time, so edits of older posts are imported only without --since.",
+        )
 
     def handle(self, *args, **options):
         try:
             start_time = datetime.now()
-            self.update_django_from_rethinkdb(options)
+            stats = self.update_django_from_rethinkdb(options)
             time = datetime.now() - start_time
+            self.stdout.write(
+                f"Posts created: {stats.posts_created}, updated: {stats.posts_updated}, unchanged: {stats.posts_unchanged}, tags created: {stats.tags_created}, batches: {stats.batches}, {stats.posts_per_second:.1f} posts/s."
+            )
+            if stats.watermark is not None:
+                self.stdout.write(f"Next import can use --since '{stats.watermark}'.")
             self.stdout.write(
                 self.style.SUCCESS(
-                    f"Successfully imported/updated RethinkDB to Django and it takes {time.seconds//60} minutes and {time.seconds%60} seconds."
+                    f"Successfully imported/updated RethinkDB to Django and it takes {time.seconds // 60} minutes and {time.seconds % 60} seconds."
                 )
             )
         except ReqlDriverError as e:
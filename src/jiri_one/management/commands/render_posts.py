@@ -0,0 +1,61 @@
+from datetime import datetime
+
+from django.core.management.base import BaseCommand
+from jiri_one.dependencies import (
+    instance_dependency,
+    invalidate_dependencies,
+    list_dependency,
+)
+from jiri_one.excerpts import make_excerpt
+from jiri_one.models import Post
+from jiri_one.pagination import bump_listing_version
+from jiri_one.rendering import RENDERED_FIELDS, render_post
+
+
+class Command(BaseCommand):
+    help = "Render contents of posts, which are not rendered by current stages yet"
+
+    def add_arguments(self, parser):
+        parser.add_argument("--batch-size", type=int, default=200)
+
+    def handle(self, *args, **options):
+        start_time = datetime.now()
+        batch_size = options["batch_size"]
+        # posts are streamed from server side cursor, so whole archive is never in memory
+        posts = (
+            Post.objects.only("id", "content_cze", "content_eng", *RENDERED_FIELDS)
+            .order_by("id")
+            .iterator(chunk_size=batch_size)
+        )
+        batch = list[Post]()
+        rendered = 0
+        for post in posts:
+            changed = render_post(post)  # only contents with different hash
+            if not changed:
+                continue
+            post.excerpt_cze, post.has_more_cze = make_excerpt(post.rendered_html_cze)
+            batch.append(post)
+            if len(batch) == batch_size:
+                rendered += self.save_batch(batch)
+                batch = []
+        rendered += self.save_batch(batch)
+        if rendered:
+            invalidate_dependencies(list_dependency(Post))
+            bump_listing_version()
+        time = datetime.now() - start_time
+        self.stdout.write(
+            self.style.SUCCESS(
+                f"Successfully rendered {rendered} posts and it takes {time.seconds//60} minutes and {time.seconds%60} seconds."
+            )
+        )
+
+    @staticmethod
+    def save_batch(batch: list[Post]) -> int:
+        if not batch:
+            return 0
+        # bulk_update doesn't send signals (and doesn't change mod_time)
+        updated = Post.objects.bulk_update(
+            batch, [*RENDERED_FIELDS, "excerpt_cze", "has_more_cze"]
+        )
+        invalidate_dependencies(*(instance_dependency(post) for post in batch))
+        return updated
@@ -0,0 +1,88 @@
+import os
+from datetime import datetime
+
+from django.core.management.base import BaseCommand
+from django.db import transaction
+from jiri_one.content_rewrite import CONTENT_FIELDS, RULE_SETS, ContentRewriter, Row
+from jiri_one.dependencies import (
+    instance_dependency,
+    invalidate_dependencies,
+    list_dependency,
+)
+from jiri_one.excerpts import make_excerpt
+from jiri_one.models import Post
+from jiri_one.pagination import bump_listing_version
+from jiri_one.rendering import RENDERED_FIELDS, render_post
+from jiri_one.search import update_search_vectors
+
+
+def write_rows(rows: list[Row]) -> None:
+    """Save changed contents (with excerpts and search vectors), mod_time is kept."""
+    posts = []
+    for post_id, *contents in rows:
+        post = Post(id=post_id, **dict(zip(CONTENT_FIELDS, contents, strict=True)))
+        render_post(post)  # new instance has no hashes, so both contents are rendered
+        post.excerpt_cze, post.has_more_cze = make_excerpt(post.rendered_html_cze)
+        posts.append(post)
+    with transaction.atomic():
+        # bulk_update doesn't change auto_now mod_time (and doesn't send signals)
+        Post.objects.bulk_update(
+            posts, [*CONTENT_FIELDS, *RENDERED_FIELDS, "excerpt_cze", "has_more_cze"]
+        )
+        update_search_vectors(Post.objects.filter(pk__in=[post.pk for post in posts]))
+    invalidate_dependencies(*(instance_dependency(post) for post in posts))
+
+
+class Command(BaseCommand):
+    help = "Rewrite contents of posts by rule set (only changed posts are saved)"
+
+    def add_arguments(self, parser):
+        parser.add_argument("rule_set", choices=sorted(RULE_SETS))
+        parser.add_argument("--batch-size", type=int, default=200)
+        parser.add_argument(
+            "--workers",
+            type=int,
+            default=os.cpu_count() or 1,
+            help="Nr of processes for rewriting (1 rewrites in this process).",
+        )
+        parser.add_argument(
+            "--dry-run",
+            action="store_true",
+            help="Only show summary of changes, nothing is saved.",
+        )
+
+    def handle(self, *args, **options):
+        start_time = datetime.now()
+        dry_run = options["dry_run"]
+        # posts are streamed from server side cursor, so whole archive is never in memory
+        rows = (
+            Post.objects.order_by("id")
+            .values_list("id", *CONTENT_FIELDS)
+            .iterator(chunk_size=options["batch_size"])
+        )
+        rewriter = ContentRewriter(
+            options["rule_set"],
+            workers=options["workers"],
+            batch_size=options["batch_size"],
+        )
+        stats = rewriter.run(rows, write=None if dry_run else write_rows)
+        for post_id, changes in stats.changes:
+            summary = ", ".join(
+                f"{field}: {nr} changes"
+                for field, nr in zip(CONTENT_FIELDS, changes, strict=True)
+                if nr
+            )
+            self.stdout.write(f"Post {post_id}: {summary}")
+        if stats.changes and not dry_run:
+            invalidate_dependencies(list_dependency(Post))  # excerpts and search
+            bump_listing_version()
+        self.stdout.write(
+            f"Read {stats.rows} posts in {stats.batches} batches: read {stats.read:.2f} s, rewrite {stats.rewrite:.2f} s, write {stats.write:.2f} s."
+        )
+        time = datetime.now() - start_time
+        action = "would change" if dry_run else "changed"
+        self.stdout.write(
+            self.style.SUCCESS(
+                f"Successfully rewrote contents by {options['rule_set']}, {len(stats.changes)} posts {action} and it takes {time.seconds//60} minutes and {time.seconds%60} seconds."
+            )
+        )
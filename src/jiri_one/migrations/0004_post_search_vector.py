@@ -0,0 +1,55 @@
+import django.contrib.postgres.indexes
+import django.contrib.postgres.search
+from django.db import migrations
+
+# Czech has no stemmer in PostgreSQL, so the configuration is copy of "simple"
+# and if it is possible, it removes accents with unaccent extension (so "cesky" finds "česky")
+CREATE_SEARCH_CONFIG = """
+DO $$
+BEGIN
+    IF NOT EXISTS (SELECT 1 FROM pg_ts_config WHERE cfgname = 'jiri_one_cze') THEN
+        CREATE TEXT SEARCH CONFIGURATION jiri_one_cze (COPY = simple);
+        IF EXISTS (SELECT 1 FROM pg_available_extensions WHERE name = 'unaccent') THEN
+            CREATE EXTENSION IF NOT EXISTS unaccent;
+            ALTER TEXT SEARCH CONFIGURATION jiri_one_cze
+                ALTER MAPPING FOR hword, hword_part, word WITH unaccent, simple;
+        END IF;
+    END IF;
+END
+$$;
+"""
+
+DROP_SEARCH_CONFIG = "DROP TEXT SEARCH CONFIGURATION IF EXISTS jiri_one_cze;"
+
+# vectors of existing posts, the same like post_search_vector() in search.py
+FILL_SEARCH_VECTORS = """
+UPDATE jiri_one_post SET search_vector =
+    setweight(to_tsvector('jiri_one_cze', COALESCE(title_cze, '')), 'A')
+    || setweight(to_tsvector('jiri_one_cze', COALESCE(title_eng, '')), 'A')
+    || setweight(to_tsvector('jiri_one_cze', COALESCE(content_cze, '')), 'B')
+    || setweight(to_tsvector('jiri_one_cze', COALESCE(content_eng, '')), 'B');
+"""
+
+
+class Migration(migrations.Migration):
+    dependencies = [
+        ("jiri_one", "0003_alter_post_content_cze_alter_post_content_eng"),
+    ]
+
+    operations = [
+        migrations.RunSQL(CREATE_SEARCH_CONFIG, DROP_SEARCH_CONFIG),
+        migrations.AddField(
+            model_name="post",
+            name="search_vector",
+            field=django.contrib.postgres.search.SearchVectorField(
+                editable=False, null=True
+            ),
+        ),
+        migrations.RunSQL(FILL_SEARCH_VECTORS, migrations.RunSQL.noop),
+        migrations.AddIndex(
+            model_name="post",
+            index=django.contrib.postgres.indexes.GinIndex(
+                fields=["search_vector"], name="post_search_vector_idx"
+            ),
+        ),
+    ]
@@ -0,0 +1,27 @@
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+    dependencies = [
+        ("jiri_one", "0004_post_search_vector"),
+    ]
+
+    # excerpts of existing posts are computed by build_excerpts command
+    operations = [
+        migrations.AddField(
+            model_name="post",
+            name="excerpt_cze",
+            field=models.TextField(
+                default="", editable=False, verbose_name="Post excerpt CZE"
+            ),
+        ),
+        migrations.AddField(
+            model_name="post",
+            name="has_more_cze",
+            field=models.BooleanField(
+                default=False,
+                editable=False,
+                verbose_name="Excerpt is not whole content",
+            ),
+        ),
+    ]
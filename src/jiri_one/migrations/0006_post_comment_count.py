@@ -0,0 +1,24 @@
+from django.db import migrations, models
+
+COUNT_COMMENTS = """
+UPDATE jiri_one_post SET comment_count = (
+    SELECT COUNT(*) FROM jiri_one_comment WHERE jiri_one_comment.post_id = jiri_one_post.id
+);
+"""
+
+
+class Migration(migrations.Migration):
+    dependencies = [
+        ("jiri_one", "0005_post_excerpt"),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name="post",
+            name="comment_count",
+            field=models.PositiveIntegerField(
+                default=0, editable=False, verbose_name="Number of comments"
+            ),
+        ),
+        migrations.RunSQL(COUNT_COMMENTS, migrations.RunSQL.noop),
+    ]
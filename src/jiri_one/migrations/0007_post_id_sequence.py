@@ -0,0 +1,35 @@
+from django.core.validators import MinValueValidator
+from django.db import migrations, models
+
+import jiri_one.models
+
+# sequence starts after the biggest id, so existing (public) ids stay the same
+CREATE_SEQUENCE = """
+CREATE SEQUENCE IF NOT EXISTS jiri_one_post_id_seq OWNED BY jiri_one_post.id;
+SELECT setval(
+    'jiri_one_post_id_seq', COALESCE((SELECT MAX(id) FROM jiri_one_post), 0) + 1, false
+);
+"""
+
+DROP_SEQUENCE = "DROP SEQUENCE IF EXISTS jiri_one_post_id_seq;"
+
+
+class Migration(migrations.Migration):
+    dependencies = [
+        ("jiri_one", "0006_post_comment_count"),
+    ]
+
+    operations = [
+        migrations.RunSQL(CREATE_SEQUENCE, DROP_SEQUENCE),
+        migrations.AlterField(
+            model_name="post",
+            name="id",
+            field=models.IntegerField(
+                db_default=jiri_one.models.NextVal("jiri_one_post_id_seq"),
+                editable=False,
+                primary_key=True,
+                serialize=False,
+                validators=[MinValueValidator(1)],
+            ),
+        ),
+    ]
@@ -0,0 +1,36 @@
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+    dependencies = [
+        ("jiri_one", "0007_post_id_sequence"),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name="RateLimitBucket",
+            fields=[
+                (
+                    "key",
+                    models.CharField(
+                        max_length=255,
+                        primary_key=True,
+                        serialize=False,
+                        verbose_name="Scope and key",
+                    ),
+                ),
+                (
+                    "tokens",
+                    models.FloatField(
+                        verbose_name="Tokens after the last allowed request"
+                    ),
+                ),
+                (
+                    "updated",
+                    models.DateTimeField(
+                        verbose_name="Time of the last allowed request"
+                    ),
+                ),
+            ],
+        ),
+    ]
@@ -0,0 +1,29 @@
+# Generated by Django 5.2.18 on 2026-10-18 09:18
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('jiri_one', '0008_ratelimitbucket'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='DeployJob',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('commit', models.CharField(max_length=40, verbose_name='Deployed commit')),
+                ('status', models.CharField(choices=[('queued', 'Queued'), ('running', 'Running'), ('succeeded', 'Succeeded'), ('failed', 'Failed')], default='queued', max_length=10, verbose_name='Status')),
+                ('requests', models.PositiveIntegerField(default=1, verbose_name='Nr of coalesced requests')),
+                ('created', models.DateTimeField(auto_now_add=True, verbose_name='Time of the first request')),
+                ('started', models.DateTimeField(blank=True, null=True, verbose_name='Start time')),
+                ('finished', models.DateTimeField(blank=True, null=True, verbose_name='Finish time')),
+                ('log', models.TextField(blank=True, verbose_name='Output of deploy steps')),
+            ],
+            options={
+                'constraints': [models.UniqueConstraint(condition=models.Q(('status', 'queued')), fields=('status',), name='one_queued_deploy_job')],
+            },
+        ),
+    ]
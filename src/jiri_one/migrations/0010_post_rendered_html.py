@@ -0,0 +1,75 @@
+from django.db import migrations, models
+
+# internal imports
+from jiri_one.excerpts import make_excerpt
+from jiri_one.rendering import RENDERED_FIELDS, render_post
+
+BATCH_SIZE = 200
+UPDATE_FIELDS = [*RENDERED_FIELDS, "excerpt_cze", "has_more_cze"]
+
+
+def render_existing_posts(apps, schema_editor):
+    """Existing posts are rendered like by render_posts command (views need it)."""
+    Post = apps.get_model("jiri_one", "Post")
+    posts = (
+        Post.objects.only("id", "content_cze", "content_eng", *RENDERED_FIELDS)
+        .order_by("id")
+        .iterator(chunk_size=BATCH_SIZE)
+    )
+    batch = []
+    for post in posts:
+        render_post(post)
+        post.excerpt_cze, post.has_more_cze = make_excerpt(post.rendered_html_cze)
+        batch.append(post)
+        if len(batch) == BATCH_SIZE:
+            Post.objects.bulk_update(batch, UPDATE_FIELDS)
+            batch = []
+    Post.objects.bulk_update(batch, UPDATE_FIELDS)
+
+
+class Migration(migrations.Migration):
+    dependencies = [
+        ("jiri_one", "0009_deployjob"),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name="post",
+            name="rendered_hash_cze",
+            field=models.CharField(
+                default="",
+                editable=False,
+                max_length=64,
+                verbose_name="Hash of rendered content CZE",
+            ),
+        ),
+        migrations.AddField(
+            model_name="post",
+            name="rendered_hash_eng",
+            field=models.CharField(
+                default="",
+                editable=False,
+                max_length=64,
+                verbose_name="Hash of rendered content ENG",
+            ),
+        ),
+        migrations.AddField(
+            model_name="post",
+            name="rendered_html_cze",
+            field=models.TextField(
+                default="", editable=False, verbose_name="Rendered content CZE"
+            ),
+        ),
+        migrations.AddField(
+            model_name="post",
+            name="rendered_html_eng",
+            field=models.TextField(
+                blank=True,
+                default=None,
+                editable=False,
+                null=True,
+                verbose_name="Rendered content ENG",
+            ),
+        ),
+        migrations.RunPython(render_existing_posts, migrations.RunPython.noop),
+    ]
@@ -1,24 +1,49 @@
+from django.contrib.postgres.indexes import GinIndex
+from django.contrib.postgres.search import SearchVectorField
 from django.core.validators import MinValueValidator
-from django.db import models
+from django.db import connection, models, transaction
+from django.db.models import F, Func, Value
 from django.utils import timezone
 from django.utils.text import slugify
 from prose.fields import RichTextField
 
+from jiri_one.excerpts import make_excerpt
+from jiri_one.rendering import LANGUAGES, render_post
+from jiri_one.search import SEARCHED_FIELDS, post_search_vector
+
+POST_ID_SEQUENCE = "jiri_one_post_id_seq"
+
+
+class NextVal(Func):
+    """Next value of PostgreSQL sequence (it is used as database default)."""
+
+    function = "nextval"
+    output_field = models.IntegerField()
+
+    def __init__(self, sequence: str, **extra):
+        super().__init__(Value(sequence), **extra)
+
 
 class Post(models.Model):
     def __init__(self, *args, **kwargs):
         super().__init__(*args, **kwargs)
         self.html_tags = ""
+        self.search_snippet: str | None = None
 
     @staticmethod
     def get_next_id():
-        return Post.objects.count() + 1
+        """Allocate new id (ids are given by database now, old migrations need it)."""
+        with connection.cursor() as cursor:
+            cursor.execute("SELECT nextval(%s)", [POST_ID_SEQUENCE])
+            return cursor.fetchone()[0]
 
+    # ids are public (GraphQL), they are given by sequence, so concurrent inserts
+    # never get the same id and no counting is needed
     id = models.IntegerField(
         primary_key=True,
         validators=[MinValueValidator(1)],
         editable=False,
-        default=get_next_id,
+        db_default=NextVal(POST_ID_SEQUENCE),
     )
     title_cze = models.CharField("Post title CZE", unique=True, max_length=100)
     title_eng = models.CharField(
@@ -50,18 +75,74 @@ class Post(models.Model):
     mod_time = models.DateTimeField("Last modification time", auto_now=True)
     author = models.ForeignKey("Author", on_delete=models.PROTECT)
     tags = models.ManyToManyField("Tag")
+    # nr of comments for listings, it is changed together with comments (Comment.save
+    # and signals), reconcile_comment_counts command repairs it
+    comment_count = models.PositiveIntegerField(
+        "Number of comments", editable=False, default=0
+    )
+    # full-text search column, it is computed from titles and contents on every save
+    search_vector = SearchVectorField(null=True, editable=False)
+    # beginning of content for listings, it is computed from content on every save
+    excerpt_cze = models.TextField("Post excerpt CZE", editable=False, default="")
+    has_more_cze = models.BooleanField(
+        "Excerpt is not whole content", editable=False, default=False
+    )
+    # contents rendered on save (see rendering.py) with hashes of their sources
+    rendered_html_cze = models.TextField(
+        "Rendered content CZE", editable=False, default=""
+    )
+    rendered_html_eng = models.TextField(
+        "Rendered content ENG", editable=False, blank=True, null=True, default=None
+    )
+    rendered_hash_cze = models.CharField(
+        "Hash of rendered content CZE", max_length=64, editable=False, default=""
+    )
+    rendered_hash_eng = models.CharField(
+        "Hash of rendered content ENG", max_length=64, editable=False, default=""
+    )
 
     def save(self, *args, **kwargs):
         self.url_cze = slugify(self.title_cze)
         if self.title_eng is not None:
             self.url_eng = slugify(self.title_eng)
-        super().save(*args, **kwargs)
+        update_fields = kwargs.get("update_fields")
+        changed = render_post(
+            self,
+            [
+                language
+                for language in LANGUAGES
+                if update_fields is None or f"content_{language}" in update_fields
+            ],
+        )
+        if "rendered_html_cze" in changed:
+            self.excerpt_cze, self.has_more_cze = make_excerpt(self.rendered_html_cze)
+            changed += ["excerpt_cze", "has_more_cze"]
+        if update_fields is not None:
+            kwargs["update_fields"] = {*update_fields, *changed}
+        if kwargs.get("update_fields") is None and not self._state.adding:
+            # columns which are changed only by UPDATE, this instance can have old values
+            deferred_fields = self.get_deferred_fields()
+            kwargs["update_fields"] = [
+                field.name
+                for field in self._meta.concrete_fields
+                if not field.primary_key
+                and field.name not in ("comment_count", "search_vector")
+                and field.attname not in deferred_fields
+            ]
+        # the vector is computed by PostgreSQL from saved row, in the same transaction
+        with transaction.atomic():
+            super().save(*args, **kwargs)
+            if update_fields is None or not SEARCHED_FIELDS.isdisjoint(update_fields):
+                Post.objects.filter(pk=self.pk).update(
+                    search_vector=post_search_vector()
+                )
 
     def __str__(self):
         return self.title_cze
 
     class Meta:
         ordering = ["-pub_time"]
+        indexes = [GinIndex(fields=["search_vector"], name="post_search_vector_idx")]
 
 
 class Author(models.Model):
@@ -80,6 +161,16 @@ class Comment(models.Model):
     pub_time = models.DateTimeField("Comment time", auto_now_add=True)
     post = models.ForeignKey(Post, related_name="comments", on_delete=models.CASCADE)
 
+    def save(self, *args, **kwargs):
+        adding = self._state.adding
+        # comment and the counter are saved together or not at all
+        with transaction.atomic():
+            super().save(*args, **kwargs)
+            if adding:
+                Post.objects.filter(pk=self.post_id).update(  # type: ignore[attr-defined]
+                    comment_count=F("comment_count") + 1
+                )
+
     def __str__(self):
         return f"{self.title} - {self.nick}"
 
@@ -121,3 +212,47 @@ class Tag(models.Model):
 
     class Meta:
         ordering = ["order"]
+
+
+class RateLimitBucket(models.Model):
+    """Token bucket of one rate limited key (IP, nick, post), see rate_limit.py."""
+
+    key = models.CharField("Scope and key", max_length=255, primary_key=True)
+    tokens = models.FloatField("Tokens after the last allowed request")
+    updated = models.DateTimeField("Time of the last allowed request")
+
+    def __str__(self):
+        return self.key
+
+
+class DeployJob(models.Model):
+    """Redeploy of one commit, deploy requests are coalesced to one queued job."""
+
+    class Status(models.TextChoices):
+        QUEUED = "queued"
+        RUNNING = "running"
+        SUCCEEDED = "succeeded"
+        FAILED = "failed"
+
+    commit = models.CharField("Deployed commit", max_length=40)
+    status = models.CharField(
+        "Status", max_length=10, choices=Status.choices, default=Status.QUEUED
+    )
+    requests = models.PositiveIntegerField("Nr of coalesced requests", default=1)
+    created = models.DateTimeField("Time of the first request", auto_now_add=True)
+    started = models.DateTimeField("Start time", null=True, blank=True)
+    finished = models.DateTimeField("Finish time", null=True, blank=True)
+    log = models.TextField("Output of deploy steps", blank=True)
+
+    def __str__(self):
+        return f"{self.commit} - {self.status}"
+
+    class Meta:
+        constraints = [
+            # the only one job waits, newer requests change its commit
+            models.UniqueConstraint(
+                fields=["status"],
+                condition=models.Q(status="queued"),
+                name="one_queued_deploy_job",
+            )
+        ]
@@ -0,0 +1,100 @@
+from hashlib import md5
+from time import thread_time_ns
+
+from django.conf import settings
+from django.core.cache import cache
+from django.http import HttpRequest, HttpResponse
+from django.middleware.csrf import get_token
+from django.template.loader import render_to_string
+
+# internal imports
+from jiri_one.compression import GzipTemplate, count, set_precompressed
+from jiri_one.dependencies import adependencies_are_valid, aregister_dependencies
+
+# Whole pages (HTML) are cached with dependencies like GraphQL responses. Pages are
+# the same for all visitors except CSRF token, so pages are rendered with placeholder
+# and the token of visitor is put in its place, when the page is served. Gzip of page
+# is saved with it, only the token is compressed then (see compression.py).
+CSRF_TOKEN_PLACEHOLDER = "__CSRF_TOKEN_PLACEHOLDER__"
+
+
+def page_cache_key(request: HttpRequest) -> str:
+    """Page is given only by path (tag, search and page are in path).
+
+    Views don't read query string, so it is not part of the key, otherwise anybody
+    could fill the cache with the same page (/?x=1, /?x=2, ...).
+    """
+    return f"page:{md5(request.path.encode()).hexdigest()}"
+
+
+def page_response(
+    request: HttpRequest,
+    content: str,
+    cache_status: str,
+    gzip_template: GzipTemplate | None = None,
+) -> HttpResponse:
+    # get_token sets CSRF cookie too, if the visitor doesn't have it
+    token = get_token(request)
+    response = HttpResponse(content.replace(CSRF_TOKEN_PLACEHOLDER, token))
+    response["X-Page-Cache"] = cache_status
+    if gzip_template is not None:
+        set_precompressed(
+            response, "gzip", lambda: gzip_template.render(token, response.content)
+        )
+    return response
+
+
+def make_gzip_template(content: str) -> GzipTemplate | None:
+    if len(content) < settings.COMPRESSION_MIN_SIZE:
+        return None
+    start_time = thread_time_ns()
+    gzip_template = GzipTemplate.from_text(content, CSRF_TOKEN_PLACEHOLDER)
+    count(cpu_ns=thread_time_ns() - start_time)
+    return gzip_template
+
+
+async def aget_cached_page(request: HttpRequest) -> HttpResponse | None:
+    if not settings.PAGE_CACHE_TIMEOUT or request.method != "GET":
+        return None
+    entry = await cache.aget(page_cache_key(request))
+    if entry is not None and await adependencies_are_valid(
+        entry["dependencies"], entry["created"]
+    ):
+        return page_response(
+            request, entry["content"], "HIT", entry.get("gzip_template")
+        )
+    return None
+
+
+async def arender_cached_page(
+    request: HttpRequest,
+    template_name: str,
+    context: dict,
+    dependencies: set[str],
+    created: int,
+    cacheable: bool = True,
+) -> HttpResponse:
+    """Render the page (like render shortcut) and save it to cache, if it is cacheable.
+
+    Created is time before the data of page were loaded, changes since then invalidate it.
+    Views don't cache pages of paths, which anybody can make up (unknown tags, empty
+    searches...), otherwise random paths could evict valid pages from the cache.
+    """
+    content = render_to_string(
+        template_name, context | {"csrf_token": CSRF_TOKEN_PLACEHOLDER}, request
+    )
+    if not settings.PAGE_CACHE_TIMEOUT or request.method != "GET" or not cacheable:
+        return page_response(request, content, "MISS")
+    gzip_template = make_gzip_template(content)
+    await aregister_dependencies(dependencies, created)
+    await cache.aset(
+        page_cache_key(request),
+        {
+            "content": content,
+            "gzip_template": gzip_template,
+            "dependencies": sorted(dependencies),
+            "created": created,
+        },
+        settings.PAGE_CACHE_TIMEOUT,
+    )
+    return page_response(request, content, "MISS", gzip_template)
@@ -0,0 +1,161 @@
+from collections.abc import Sequence
+from hashlib import md5
+from time import time_ns
+from typing import Any
+
+from django.conf import settings
+from django.core.cache import cache
+from django.db.models import F, Q, QuerySet, Window
+from django.db.models.functions import Mod, RowNumber
+
+# version of all post listings, it is changed (by signals) when posts or their tags change
+LISTING_VERSION_KEY = "post_listing_version"
+# page index is not needed to be exact for ever, so it expires anyway
+PAGE_INDEX_TIMEOUT = 60 * 60 * 24
+
+
+async def aget_listing_version() -> int:
+    version = await cache.aget(LISTING_VERSION_KEY)
+    if version is None:
+        version = time_ns()
+        await cache.aset(LISTING_VERSION_KEY, version, None)
+    return version
+
+
+def bump_listing_version() -> None:
+    """Invalidate all cached page indexes."""
+    cache.set(LISTING_VERSION_KEY, time_ns(), None)
+
+
+def seek_filter(ordering: Sequence[str], cursor: Sequence[Any]) -> Q:
+    """Q object for rows which are on the cursor position or after it in ordering."""
+    condition: Q | None = None
+    for field, value in reversed(list(zip(ordering, cursor, strict=True))):
+        name = field.removeprefix("-")
+        lookup = "lt" if field.startswith("-") else "gt"
+        if condition is None:  # the last (unique) key is inclusive
+            condition = Q(**{f"{name}__{lookup}e": value})
+        else:
+            condition = Q(**{f"{name}__{lookup}": value}) | (
+                Q(**{name: value}) & condition
+            )
+    assert condition is not None
+    return condition
+
+
+class KeysetPaginator:
+    """Paginator which seeks to the start of page instead of OFFSET or list of all ids.
+
+    The keys of the first row of every page (page index) are computed in one query
+    and cached, so page numbers in URLs still work and every page costs the same.
+    Ordering is taken from queryset and the last key has to be unique (id). Keys have
+    to be loaded exactly, so they can be compared in seek filter (float4 is not).
+    Listing is the cache key of page index, without it the index is not cached.
+    """
+
+    def __init__(
+        self, queryset: QuerySet, listing: str | None, per_page: int | None = None
+    ):
+        self.queryset = queryset
+        self.ordering: tuple[str, ...] = tuple(queryset.query.order_by) or ("-id",)
+        if self.ordering[-1].removeprefix("-") not in ("id", "pk"):
+            raise ValueError("The last key of ordering has to be unique id.")
+        self.listing = listing
+        self.per_page: int = per_page or settings.POSTS_ON_PAGE
+        self.page_starts: list[tuple] = []
+
+    @property
+    def num_pages(self) -> int:
+        return max(len(self.page_starts), 1)
+
+    @property
+    def page_range(self) -> range:
+        return range(1, self.num_pages + 1)
+
+    def validate_number(self, number: int) -> int:
+        """Like Paginator.get_page, bad page number gives first or last page."""
+        if number < 1:
+            return 1
+        return min(number, self.num_pages)
+
+    async def aget_page_starts(self) -> list[tuple]:
+        cache_key = None
+        if self.listing is not None:
+            version = await aget_listing_version()
+            listing_hash = md5(self.listing.encode()).hexdigest()
+            cache_key = f"page_index:{version}:{self.per_page}:{listing_hash}"
+            page_starts = await cache.aget(cache_key)
+            if page_starts is not None:
+                return page_starts
+        keys = [field.removeprefix("-") for field in self.ordering]
+        page_starts_query = (
+            self.queryset.annotate(
+                row_nr=Window(RowNumber(), order_by=list(self.ordering))
+            )
+            .annotate(page_position=Mod(F("row_nr") - 1, self.per_page))
+            .filter(page_position=0)
+            .values_list(*keys)
+        )
+        page_starts = [row async for row in page_starts_query]
+        # empty listings (searches without results) are not cached under fresh keys
+        if cache_key is not None and page_starts:
+            await cache.aset(cache_key, page_starts, PAGE_INDEX_TIMEOUT)
+        return page_starts
+
+    async def aget_page(
+        self, number: int, queryset: QuerySet | None = None
+    ) -> "KeysetPage":
+        """Get page with number, rows are taken from queryset (with same filters) if it is given."""
+        self.page_starts = await self.aget_page_starts()
+        number = self.validate_number(number)
+        if not self.page_starts:
+            return KeysetPage([], number, self, has_next=False)
+        if queryset is None:
+            queryset = self.queryset
+        cursor = self.page_starts[number - 1]
+        rows = [
+            row
+            async for row in queryset.filter(seek_filter(self.ordering, cursor))[
+                : self.per_page + 1
+            ]
+        ]
+        return KeysetPage(
+            rows[: self.per_page], number, self, has_next=len(rows) > self.per_page
+        )
+
+
+class KeysetPage(Sequence):
+    """Page with the same interface (for templates) like django.core.paginator.Page."""
+
+    def __init__(
+        self,
+        object_list: list,
+        number: int,
+        paginator: KeysetPaginator,
+        has_next: bool,
+    ):
+        self.object_list = object_list
+        self.number = number
+        self.paginator = paginator
+        self._has_next = has_next
+
+    def __repr__(self):
+        return f"<Page {self.number} of {self.paginator.num_pages}>"
+
+    def __len__(self):
+        return len(self.object_list)
+
+    def __getitem__(self, index):
+        return self.object_list[index]
+
+    def has_next(self) -> bool:
+        return self._has_next
+
+    def has_previous(self) -> bool:
+        return self.number > 1
+
+    def next_page_number(self) -> int:
+        return self.number + 1
+
+    def previous_page_number(self) -> int:
+        return self.number - 1
@@ -0,0 +1,85 @@
+import json
+from functools import lru_cache
+from hashlib import sha256
+from logging import getLogger
+
+from django.conf import settings
+from django.core.cache import cache
+from graphql import GraphQLError
+
+logger = getLogger("jiri_one")
+
+# Persisted queries use the same protocol like Apollo (and graphql_flutter) clients:
+# extensions={"persistedQuery": {"version": 1, "sha256Hash": "<hash of query>"}}
+PERSISTED_QUERY_TIMEOUT = 60 * 60 * 24 * 30
+
+
+class PersistedQueryError(GraphQLError):
+    """Error for client, code in extensions tells the client what to do."""
+
+    def __init__(self, message: str, code: str):
+        super().__init__(message, extensions={"code": code})
+        self.code = code
+
+
+def query_hash(query: str) -> str:
+    return sha256(query.encode()).hexdigest()
+
+
+@lru_cache(maxsize=1)
+def get_allow_list() -> dict[str, str]:
+    """Registered queries (hash -> query) from GRAPHQL_PERSISTED_QUERIES_FILE."""
+    path = settings.GRAPHQL_PERSISTED_QUERIES_FILE
+    try:
+        with open(path) as file:
+            return json.load(file)
+    except FileNotFoundError:
+        if settings.GRAPHQL_ALLOW_LIST_ONLY:
+            logger.error(f"Allow list of GraphQL queries {path} does not exist.")
+        return {}
+
+
+def get_persisted_query_hash(extensions: dict | None) -> str | None:
+    if not isinstance(extensions, dict):
+        return None
+    persisted_query = extensions.get("persistedQuery")
+    if not isinstance(persisted_query, dict) or persisted_query.get("version") != 1:
+        return None
+    return persisted_query.get("sha256Hash")
+
+
+async def aresolve_query(query: str | None, extensions: dict | None) -> str | None:
+    """Get query text for request, it can be given directly or by hash of persisted query."""
+    sha256_hash = get_persisted_query_hash(extensions)
+    allow_list = get_allow_list()
+    if sha256_hash is None:  # ordinary request with full query
+        if (
+            query
+            and settings.GRAPHQL_ALLOW_LIST_ONLY
+            and query_hash(query) not in allow_list
+        ):
+            raise PersistedQueryError("Query is not allowed.", "QUERY_NOT_ALLOWED")
+        return query
+
+    if query:  # client sends query with its hash, so we can register it
+        if query_hash(query) != sha256_hash:
+            raise PersistedQueryError(
+                "Provided sha256Hash does not match query.", "INVALID_SHA256_HASH"
+            )
+        if sha256_hash in allow_list:
+            return query
+        if settings.GRAPHQL_ALLOW_LIST_ONLY:
+            raise PersistedQueryError("Query is not allowed.", "QUERY_NOT_ALLOWED")
+        await cache.aset(
+            f"persisted_query:{sha256_hash}", query, PERSISTED_QUERY_TIMEOUT
+        )
+        return query
+
+    # only hash was sent
+    query = allow_list.get(sha256_hash)
+    if query is None and not settings.GRAPHQL_ALLOW_LIST_ONLY:
+        query = await cache.aget(f"persisted_query:{sha256_hash}")
+    if query is None:
+        # client will send the query again together with hash
+        raise PersistedQueryError("PersistedQueryNotFound", "PERSISTED_QUERY_NOT_FOUND")
+    return query
@@ -0,0 +1,133 @@
+from dataclasses import dataclass
+
+from django.conf import settings
+from graphql import (
+    FieldNode,
+    FragmentSpreadNode,
+    GraphQLError,
+    GraphQLList,
+    GraphQLNonNull,
+    GraphQLOutputType,
+    InlineFragmentNode,
+    OperationDefinitionNode,
+    SelectionSetNode,
+    ValidationRule,
+    get_named_type,
+    is_composite_type,
+    specified_rules,
+)
+
+# Static analysis of query before execution. Every field costs its weight (objects 1,
+# scalars 0 or GRAPHQL_FIELD_COSTS["Type.field"]) and fields in lists are paid for
+# every item, lists have POSTS_ON_PAGE items at most (pagination), so it is an estimate
+# of the worst case. Introspection fields (__schema, __type) are free.
+
+
+@dataclass
+class QueryCost:
+    depth: int = 0
+    cost: int = 0
+
+
+class QueryCostRule(ValidationRule):
+    """Reject too deep or too expensive operations (limits are in settings)."""
+
+    def enter_operation_definition(self, node: OperationDefinitionNode, *_args):
+        schema = self.context.schema
+        root_type = schema.get_root_type(node.operation)
+        if root_type is None:
+            return
+        query_cost = self.selection_set_cost(node.selection_set, root_type, set())
+        name = node.name.value if node.name else "anonymous"
+        if query_cost.depth > settings.GRAPHQL_MAX_DEPTH:
+            self.report_error(
+                GraphQLError(
+                    f"Operation '{name}' is too deep: {query_cost.depth} levels, maximum is {settings.GRAPHQL_MAX_DEPTH}.",
+                    node,
+                    extensions={
+                        "code": "QUERY_TOO_DEEP",
+                        "depth": query_cost.depth,
+                        "maxDepth": settings.GRAPHQL_MAX_DEPTH,
+                    },
+                )
+            )
+        if query_cost.cost > settings.GRAPHQL_MAX_COST:
+            self.report_error(
+                GraphQLError(
+                    f"Operation '{name}' is too expensive: cost {query_cost.cost}, maximum is {settings.GRAPHQL_MAX_COST}.",
+                    node,
+                    extensions={
+                        "code": "QUERY_TOO_EXPENSIVE",
+                        "cost": query_cost.cost,
+                        "maxCost": settings.GRAPHQL_MAX_COST,
+                    },
+                )
+            )
+
+    def selection_set_cost(
+        self,
+        selection_set: SelectionSetNode | None,
+        parent_type,
+        fragments: set[str],
+    ) -> QueryCost:
+        """Cost of selections, fragments are the names of fragments we are in (cycles)."""
+        total = QueryCost()
+        if selection_set is None:
+            return total
+        for selection in selection_set.selections:
+            if isinstance(selection, FieldNode):
+                selection_cost = self.field_cost(selection, parent_type, fragments)
+            elif isinstance(selection, InlineFragmentNode):
+                type_condition = selection.type_condition
+                fragment_type = (
+                    self.context.schema.get_type(type_condition.name.value)
+                    if type_condition
+                    else parent_type
+                )
+                selection_cost = self.selection_set_cost(
+                    selection.selection_set, fragment_type, fragments
+                )
+            elif isinstance(selection, FragmentSpreadNode):
+                fragment_name = selection.name.value
+                fragment = self.context.get_fragment(fragment_name)
+                if fragment is None or fragment_name in fragments:
+                    continue  # reported by other validation rules
+                fragment_type = self.context.schema.get_type(
+                    fragment.type_condition.name.value
+                )
+                selection_cost = self.selection_set_cost(
+                    fragment.selection_set, fragment_type, fragments | {fragment_name}
+                )
+            else:
+                continue
+            total.depth = max(total.depth, selection_cost.depth)
+            total.cost += selection_cost.cost
+        return total
+
+    def field_cost(
+        self, node: FieldNode, parent_type, fragments: set[str]
+    ) -> QueryCost:
+        field_name = node.name.value
+        fields = getattr(parent_type, "fields", None)
+        if field_name.startswith("__") or not fields or field_name not in fields:
+            return QueryCost()  # introspection or unknown field (other rules)
+        return_type: GraphQLOutputType = fields[field_name].type
+        named_type = get_named_type(return_type)
+        weight = settings.GRAPHQL_FIELD_COSTS.get(
+            f"{parent_type.name}.{field_name}", int(is_composite_type(named_type))
+        )
+        children = self.selection_set_cost(node.selection_set, named_type, fragments)
+        multiplier = settings.POSTS_ON_PAGE if is_list(return_type) else 1
+        return QueryCost(
+            depth=children.depth + 1, cost=weight + multiplier * children.cost
+        )
+
+
+def is_list(type_: GraphQLOutputType) -> bool:
+    if isinstance(type_, GraphQLNonNull):
+        type_ = type_.of_type
+    return isinstance(type_, GraphQLList)
+
+
+# rules for GraphQL view, validation_rules replace the default rules
+VALIDATION_RULES = (*specified_rules, QueryCostRule)
@@ -0,0 +1,110 @@
+from dataclasses import dataclass
+from time import monotonic
+
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.db import connection
+
+# internal imports
+from jiri_one.db_pool import afetch
+
+# Rate limits are token buckets in PostgreSQL (one row per key, so constant memory).
+# Bucket of the key has `capacity` tokens and it is refilled with `capacity` tokens per
+# `period` seconds, every request takes one token. Refill is computed from the time of
+# the last allowed request and the whole check is one INSERT ... ON CONFLICT UPDATE,
+# so concurrent requests from all processes can't take more tokens than there are.
+# Request is allowed, if its statement changed `updated` of the bucket (denied requests
+# don't change the bucket at all).
+TAKE_TOKENS = """
+INSERT INTO jiri_one_ratelimitbucket AS bucket (key, tokens, updated)
+SELECT key, %(capacity)s - 1, statement_timestamp() FROM unnest(%(keys)s::varchar[]) AS key
+ON CONFLICT (key) DO UPDATE SET
+    tokens = CASE WHEN {refilled} >= 1 THEN {refilled} - 1 ELSE bucket.tokens END,
+    updated = CASE WHEN {refilled} >= 1 THEN statement_timestamp() ELSE bucket.updated END
+RETURNING key, updated = statement_timestamp()
+""".format(
+    refilled="LEAST(%(capacity)s, bucket.tokens + "
+    "EXTRACT(EPOCH FROM statement_timestamp() - bucket.updated) * %(rate)s)"
+)
+# full buckets are the same like no buckets
+DELETE_FULL_BUCKETS = """
+DELETE FROM jiri_one_ratelimitbucket
+WHERE key LIKE %(prefix)s AND updated < statement_timestamp() - make_interval(secs => %(period)s)
+"""
+# every process deletes full (stale) buckets of the scope with its first check and then
+# at most once per PRUNE_INTERVAL seconds, so spoofed or one-off keys don't pile up
+PRUNE_INTERVAL = 60 * 10
+MAX_KEY_LENGTH = 255
+# monotonic time of the last pruning of scope in this process
+_pruned: dict[str, float] = {}
+
+
+@dataclass(frozen=True)
+class RateLimit:
+    """Token bucket limit, setting is the name of (capacity, period) in settings."""
+
+    scope: str
+    setting: str
+
+    def bucket_key(self, name: str, value) -> str:
+        return f"{self.scope}:{name}:{value}"[:MAX_KEY_LENGTH]
+
+    def take_tokens_params(self, keys: list[str]) -> dict:
+        capacity, period = getattr(settings, self.setting)
+        return {"keys": keys, "capacity": capacity, "rate": capacity / period}
+
+    def prune_params(self) -> dict | None:
+        """Parameters of DELETE_FULL_BUCKETS, if it is time to prune the scope."""
+        last_pruned = _pruned.get(self.scope)
+        # the first check of the process prunes too (workers can live shorter)
+        if last_pruned is not None and monotonic() - last_pruned <= PRUNE_INTERVAL:
+            return None
+        _pruned[self.scope] = monotonic()
+        _, period = getattr(settings, self.setting)
+        return {"prefix": f"{self.scope}:%", "period": period}
+
+    def take_tokens(self, keys: list[str]) -> bool:
+        with connection.cursor() as cursor:
+            cursor.execute(TAKE_TOKENS, self.take_tokens_params(keys))
+            allowed = all(row[1] for row in cursor.fetchall())
+            if prune_params := self.prune_params():
+                cursor.execute(DELETE_FULL_BUCKETS, prune_params)
+        return allowed
+
+    async def atake_tokens(self, keys: list[str]) -> bool:
+        """take_tokens on connection from async pool (DB_ASYNC_QUERIES)."""
+        rows = await afetch(TAKE_TOKENS, self.take_tokens_params(keys))
+        allowed = all(row[1] for row in rows)
+        if prune_params := self.prune_params():
+            await afetch(DELETE_FULL_BUCKETS, prune_params)
+        return allowed
+
+    async def aallow(self, **keys) -> bool:
+        """Take token from buckets of all keys, False if any of them is empty.
+
+        Buckets which are not empty lose their token even if the request is denied.
+        """
+        bucket_keys = (
+            sorted(  # sorted, so concurrent statements lock rows in the same order
+                {self.bucket_key(name, value) for name, value in keys.items()}
+            )
+        )
+        if settings.DB_ASYNC_QUERIES:
+            return await self.atake_tokens(bucket_keys)
+        return await sync_to_async(self.take_tokens)(bucket_keys)
+
+
+COMMENT_LIMIT = RateLimit("comment", "COMMENT_RATE_LIMIT")
+POST_COMMENT_LIMIT = RateLimit("post_comment", "POST_COMMENT_RATE_LIMIT")
+SEARCH_LIMIT = RateLimit("search", "SEARCH_RATE_LIMIT")
+
+
+async def aallow_comment(ip_address: str, nick: str, post_id: int) -> bool:
+    """Comments from one IP or nick and comments of one post are limited."""
+    return await COMMENT_LIMIT.aallow(
+        ip=ip_address, nick=nick.strip().lower()
+    ) and await POST_COMMENT_LIMIT.aallow(post=post_id)
+
+
+async def aallow_search(ip_address: str) -> bool:
+    return await SEARCH_LIMIT.aallow(ip=ip_address)
@@ -0,0 +1,216 @@
+import os
+import re
+import sys
+import tarfile
+from io import BytesIO
+from pathlib import Path
+from shutil import rmtree
+from subprocess import DEVNULL, CalledProcessError, Popen, run
+from threading import Thread
+
+from django.conf import settings
+from django.db import IntegrityError, connection, transaction
+from django.db.models import F
+from django.utils import timezone
+
+# internal imports
+from jiri_one.models import DeployJob
+
+# Every commit is built in its own directory DEPLOY_ROOT/releases/<commit> (files from
+# git, shared files, dependencies, static files and check of migrations), while the
+# current release is still serving. The build doesn't change the shared database, so
+# failed build leaves everything like it was. The database is migrated right before
+# the symlink DEPLOY_ROOT/current is atomically switched to the new release (so
+# migrations have to work with the old code for this moment), then workers are reloaded
+# and the rest (render_posts) runs with the new code. Already built release (rollback)
+# is only migrated (nothing to do) and switched. Jobs run one after another in one worker process (PostgreSQL advisory
+# lock), and requests, which come while a job is waiting, only change its commit.
+# The lock is released with the session of killed worker, so running jobs found by
+# the next worker (which holds the lock) have no worker anymore and they failed.
+COMMIT_RE = re.compile(r"^[0-9a-f]{7,40}$")
+BUILT_MARKER = ".built"
+DEPLOY_LOCK_ID = 4_101_017  # key of advisory lock of deploy worker
+
+
+class DeployError(Exception):
+    pass
+
+
+def enqueue_deploy(commit: str) -> DeployJob:
+    """Create queued job, or change commit of the waiting one (coalescing)."""
+    if not COMMIT_RE.match(commit):
+        raise DeployError(f"Invalid commit {commit!r}.")
+    for _ in range(3):  # unique constraint: other request created queued job meanwhile
+        with transaction.atomic():
+            job = (
+                DeployJob.objects.select_for_update()
+                .filter(status=DeployJob.Status.QUEUED)
+                .first()
+            )
+            if job is not None:
+                job.commit = commit
+                job.requests = F("requests") + 1
+                job.save(update_fields=["commit", "requests"])
+                job.refresh_from_db()
+                return job
+            try:
+                with transaction.atomic():
+                    return DeployJob.objects.create(commit=commit)
+            except IntegrityError:
+                continue
+    raise DeployError("Deploy job can't be queued.")
+
+
+def start_deploy_worker() -> None:
+    """Run deploy worker in its own process (it ends, when there are no queued jobs)."""
+    process = Popen(
+        [sys.executable, "manage.py", "redeploy", "--worker"],
+        cwd=settings.BASE_DIR / "src",
+        stdout=DEVNULL,
+        stderr=DEVNULL,
+        start_new_session=True,  # reload of workers doesn't kill it
+    )
+    # the finished worker has to be reaped, otherwise it stays like zombie (after
+    # reload of web worker it is reaped by init)
+    Thread(target=process.wait, daemon=True).start()
+
+
+def fail_interrupted_jobs(log) -> None:
+    """Running jobs, whose worker ended (OOM, kill, reboot), can't finish anymore.
+
+    It has to be called with the advisory lock, so no other worker runs them.
+    """
+    for job in DeployJob.objects.filter(status=DeployJob.Status.RUNNING):
+        message = f"Deploy of {job.commit} was interrupted, its worker ended."
+        log(message)
+        job.status = DeployJob.Status.FAILED
+        job.finished = timezone.now()
+        job.log = f"{job.log}\n{message}" if job.log else message
+        job.save(update_fields=["status", "finished", "log"])
+
+
+def take_job() -> DeployJob | None:
+    with transaction.atomic():
+        job = (
+            DeployJob.objects.select_for_update(skip_locked=True)
+            .filter(status=DeployJob.Status.QUEUED)
+            .order_by("id")
+            .first()
+        )
+        if job is not None:
+            job.status = DeployJob.Status.RUNNING
+            job.started = timezone.now()
+            job.save(update_fields=["status", "started"])
+        return job
+
+
+def run_deploy_queue(log=print) -> list[DeployJob]:
+    """Run all queued jobs, if no other worker is running them, returns finished jobs."""
+    finished = []
+    while True:
+        with connection.cursor() as cursor:
+            cursor.execute("SELECT pg_try_advisory_lock(%s)", [DEPLOY_LOCK_ID])
+            if not cursor.fetchone()[0]:
+                return finished  # other worker runs the queue
+            try:
+                fail_interrupted_jobs(log)
+                while (job := take_job()) is not None:
+                    finished.append(run_job(job, log))
+            finally:
+                cursor.execute("SELECT pg_advisory_unlock(%s)", [DEPLOY_LOCK_ID])
+        # job queued after the last take_job, but before unlock, has no worker
+        if not DeployJob.objects.filter(status=DeployJob.Status.QUEUED).exists():
+            return finished
+
+
+def run_job(job: DeployJob, log=print) -> DeployJob:
+    output = list[str]()
+
+    def step_log(message: str) -> None:
+        output.append(message)
+        log(message)
+
+    try:
+        release = build_release(job.commit, step_log)
+        for command in settings.DEPLOY_MIGRATE_COMMANDS:
+            run_step(command, release / "src", step_log)
+        activate_release(release)
+        step_log(f"Release {release.name} is current.")
+        run_step(settings.DEPLOY_RELOAD_COMMAND, settings.DEPLOY_ROOT, step_log)
+        for command in settings.DEPLOY_POST_RELOAD_COMMANDS:
+            run_step(command, release / "src", step_log)
+        prune_releases(step_log)
+        job.status = DeployJob.Status.SUCCEEDED
+    except CalledProcessError as e:
+        step_log(f"Command {e.cmd!r} failed with exit code {e.returncode}.")
+        job.status = DeployJob.Status.FAILED
+    except (DeployError, OSError, tarfile.TarError) as e:
+        step_log(f"Deploy failed: {e}")
+        job.status = DeployJob.Status.FAILED
+    job.finished = timezone.now()
+    job.log = "\n".join(output)
+    job.save(update_fields=["status", "finished", "log"])
+    return job
+
+
+def run_step(command: str, cwd: Path, log) -> None:
+    log(f"$ {command}")
+    result = run(command, shell=True, cwd=cwd, capture_output=True, text=True)
+    if result.stdout or result.stderr:
+        log((result.stdout + result.stderr).rstrip())
+    result.check_returncode()
+
+
+def build_release(commit: str, log) -> Path:
+    release = Path(settings.DEPLOY_ROOT) / "releases" / commit
+    if (release / BUILT_MARKER).exists():
+        log(f"Release {commit} is already built.")
+        (release / BUILT_MARKER).touch()  # it is the newest one for pruning
+        return release
+    if release.exists():  # unfinished build
+        rmtree(release)
+    release.mkdir(parents=True)
+    repository = settings.DEPLOY_REPOSITORY
+    run_step(f"git fetch {settings.DEPLOY_REMOTE} {commit}", repository, log)
+    archive = run(
+        ["git", "archive", "--format=tar", commit],
+        cwd=repository,
+        capture_output=True,
+        check=True,
+    )
+    with tarfile.open(fileobj=BytesIO(archive.stdout)) as tar:
+        tar.extractall(release, filter="data")
+    for name in settings.DEPLOY_SHARED_FILES:  # secrets and other files of server
+        shared = Path(settings.DEPLOY_ROOT) / "shared" / name
+        if not shared.exists():
+            raise DeployError(f"Shared file {shared} does not exist.")
+        (release / name).parent.mkdir(parents=True, exist_ok=True)
+        (release / name).symlink_to(shared)
+    for command in settings.DEPLOY_BUILD_COMMANDS:
+        run_step(command, release / "src", log)
+    (release / BUILT_MARKER).touch()
+    return release
+
+
+def activate_release(release: Path) -> None:
+    """Switch symlink `current` to release (rename of symlink is atomic)."""
+    current = Path(settings.DEPLOY_ROOT) / "current"
+    tmp_link = Path(settings.DEPLOY_ROOT) / f".current.{os.getpid()}"
+    tmp_link.unlink(missing_ok=True)
+    tmp_link.symlink_to(release.relative_to(settings.DEPLOY_ROOT))
+    os.replace(tmp_link, current)
+
+
+def prune_releases(log) -> None:
+    """Delete old releases, only DEPLOY_KEEP_RELEASES newest ones are kept."""
+    releases_dir = Path(settings.DEPLOY_ROOT) / "releases"
+    current = (Path(settings.DEPLOY_ROOT) / "current").resolve()
+    built = sorted(
+        (path for path in releases_dir.iterdir() if (path / BUILT_MARKER).exists()),
+        key=lambda path: (path / BUILT_MARKER).stat().st_mtime,
+        reverse=True,
+    )
+    for release in built[settings.DEPLOY_KEEP_RELEASES :]:
+        if release.resolve() != current:
+            rmtree(release)
+            log(f"Release {release.name} was deleted.")
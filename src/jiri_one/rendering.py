@@ -0,0 +1,126 @@
+import re
+from functools import cache
+from hashlib import sha256
+from pathlib import Path
+from urllib.parse import urlsplit
+
+import bleach
+from bs4 import BeautifulSoup
+from django.conf import settings
+from django.core.files.images import get_image_dimensions
+from django.utils.module_loading import import_string
+from prose.fields import ALLOWED_ATTRIBUTES, ALLOWED_TAGS
+
+# internal imports
+from jiri_one.content_rewrite import RULE_SETS
+
+try:
+    import PIL  # noqa: F401
+except ImportError:  # width/height hints need Pillow, without it they are skipped
+    PIL = None
+
+# Post contents are rendered on save (Post.save) by stages from CONTENT_RENDER_STAGES,
+# stages are plain functions of HTML like rules in content_rewrite.py. Rendered HTML
+# is saved with hash of sanitized content and stages, so unchanged content is never
+# rendered again (and changed stages render every post again, see render_posts).
+LANGUAGES = ("cze", "eng")
+RENDERED_FIELDS = [
+    f"{name}_{language}"
+    for language in LANGUAGES
+    for name in ("rendered_html", "rendered_hash")
+]
+PRE_RE = re.compile(r"(<(pre|textarea)\b.*?</\2>)", re.IGNORECASE | re.DOTALL)
+WHITESPACE_RE = re.compile(r"\s+")
+
+
+def markdown_to_html(content: str) -> str:
+    """Markdown (HTML in it is kept) to HTML, which is sanitized like prose field."""
+    from markdown import markdown  # it is needed only, when stage is enabled
+
+    return bleach.clean(
+        markdown(content), tags=ALLOWED_TAGS, attributes=ALLOWED_ATTRIBUTES
+    )
+
+
+def rewrite_links(content: str) -> str:
+    """Old /soubory/ URLs to /files/ and absolute URLs of this blog to relative ones."""
+    content = RULE_SETS["files_urls"].rewrite(content)
+    if not any(host in content for host in settings.RENDER_SITE_HOSTS):
+        return content
+    soup = BeautifulSoup(content, "html.parser")
+    for tag in soup.find_all(href=True):
+        url = urlsplit(tag["href"])
+        if url.scheme in ("http", "https") and url.netloc in settings.RENDER_SITE_HOSTS:
+            tag["href"] = url._replace(scheme="", netloc="").geturl() or "/"
+    return str(soup)
+
+
+def image_size(src: str) -> tuple[int, int] | tuple[None, None]:
+    """Size of image from MEDIA_ROOT (only local images can be measured)."""
+    if PIL is None or not src.startswith(settings.MEDIA_URL):
+        return None, None
+    path = Path(settings.MEDIA_ROOT) / src.removeprefix(settings.MEDIA_URL)
+    try:
+        return get_image_dimensions(path) or (None, None)
+    except OSError:
+        return None, None
+
+
+def lazy_load_media(content: str) -> str:
+    """Images are loaded lazily and with width/height, so page doesn't jump."""
+    if "<img" not in content:
+        return content
+    soup = BeautifulSoup(content, "html.parser")
+    for img in soup.find_all("img"):
+        img.attrs.setdefault("loading", "lazy")
+        img.attrs.setdefault("decoding", "async")
+        if "width" not in img.attrs and "height" not in img.attrs:
+            width, height = image_size(img.get("src", ""))
+            if width and height:
+                img["width"], img["height"] = width, height
+    return str(soup)
+
+
+def minify_whitespace(content: str) -> str:
+    """Runs of whitespace to one space, except preformatted text."""
+    parts = PRE_RE.split(content)
+    # split returns (text, pre block, tag name) triples
+    return "".join(
+        part if nr % 3 else WHITESPACE_RE.sub(" ", part)
+        for nr, part in enumerate(parts)
+        if nr % 3 != 2
+    ).strip()
+
+
+@cache
+def get_stages(names: tuple[str, ...]) -> tuple:
+    return tuple(import_string(name) for name in names)
+
+
+def render_content(content: str) -> str:
+    for stage in get_stages(tuple(settings.CONTENT_RENDER_STAGES)):
+        content = stage(content)
+    return content
+
+
+def content_hash(content: str) -> str:
+    """Hash of content and stages, rendered HTML is valid only for the same one."""
+    stages = "\n".join(settings.CONTENT_RENDER_STAGES)
+    return sha256(f"{stages}\0{content}".encode()).hexdigest()
+
+
+def render_post(post, languages=LANGUAGES) -> list[str]:
+    """Render changed contents of post, returns names of changed fields."""
+    changed = []
+    for language in languages:
+        # from sanitized HTML, which is really saved
+        content = post._meta.get_field(f"content_{language}").pre_save(
+            post, post._state.adding
+        )
+        digest = content_hash(content or "")
+        if digest == getattr(post, f"rendered_hash_{language}"):
+            continue
+        setattr(post, f"rendered_html_{language}", content and render_content(content))
+        setattr(post, f"rendered_hash_{language}", digest)
+        changed += [f"rendered_html_{language}", f"rendered_hash_{language}"]
+    return changed
@@ -0,0 +1,208 @@
+from collections import defaultdict
+from collections.abc import Iterable
+from dataclasses import dataclass
+from datetime import datetime
+from itertools import islice
+from logging import getLogger
+from time import perf_counter
+from zoneinfo import ZoneInfo
+
+from django.db import transaction
+from django.utils import timezone
+from django.utils.text import slugify
+
+# internal imports
+from jiri_one.dependencies import (
+    instance_dependency,
+    invalidate_dependencies,
+    list_dependency,
+)
+from jiri_one.excerpts import make_excerpt
+from jiri_one.models import Author, Post, Tag
+from jiri_one.pagination import bump_listing_version
+from jiri_one.rendering import render_post
+from jiri_one.search import update_search_vectors
+from jiri_one.tags import invalidate_tag_registry
+
+logger = getLogger("jiri_one")
+
+# Posts from RethinkDB (old blog) are imported in batches, every batch is one
+# transaction with a few queries: stored posts and their tags, INSERT ... ON CONFLICT
+# (title_cze) DO UPDATE of changed posts, search vectors and tags of posts. Unchanged
+# posts are not written, so their mod_time (Last-Modified, ETag) stays. Topics (tags)
+# are loaded only once. Bulk queries don't send signals, so caches are invalidated
+# at the end.
+RDB_TIME_FORMAT = "%Y-%m-%d %H:%M:%S"
+EUROPE_PRAGUE = ZoneInfo("Europe/Prague")
+UPDATED_FIELDS = [
+    "content_cze",
+    "url_cze",
+    "pub_time",
+    "mod_time",
+    "author",
+    "excerpt_cze",
+    "has_more_cze",
+    "rendered_html_cze",
+    "rendered_hash_cze",
+]
+
+
+@dataclass
+class ImportStats:
+    posts_created: int = 0
+    posts_updated: int = 0
+    posts_unchanged: int = 0
+    tags_created: int = 0
+    batches: int = 0
+    seconds: float = 0.0
+    # the newest `when` (publication time) of imported posts, it is --since for the
+    # next import, which imports posts at the watermark again (see the command)
+    watermark: str | None = None
+
+    @property
+    def posts(self) -> int:
+        """Nr of written posts."""
+        return self.posts_created + self.posts_updated
+
+    @property
+    def posts_per_second(self) -> float:
+        posts = self.posts + self.posts_unchanged
+        return posts / self.seconds if self.seconds else 0.0
+
+
+class RethinkDBImporter:
+    """Import of documents from RethinkDB tables posts and topics (any iterables)."""
+
+    def __init__(self, topics: Iterable[dict], batch_size: int = 500):
+        self.topics = {topic["topic"]["cze"]: topic for topic in topics}
+        self.batch_size = batch_size
+        self.tags: dict[str, Tag] = {}  # by name_cze
+        self.author: Author | None = None
+        self.stats = ImportStats()
+
+    def run(self, posts: Iterable[dict]) -> ImportStats:
+        start_time = perf_counter()
+        posts = iter(posts)  # cursor is read batch by batch
+        while batch := list(islice(posts, self.batch_size)):
+            with transaction.atomic():
+                saved = self.import_batch(batch)
+            # after commit, so old posts can't be cached again
+            invalidate_dependencies(*(instance_dependency(post) for post in saved))
+            self.stats.batches += 1
+        self.stats.seconds = perf_counter() - start_time
+        if self.stats.posts:
+            invalidate_dependencies(list_dependency(Post), list_dependency(Tag))
+            bump_listing_version()
+            invalidate_tag_registry()
+        return self.stats
+
+    def get_author(self) -> Author:
+        if self.author is None:
+            self.author, _ = Author.objects.get_or_create(
+                nick="Jiří",
+                defaults={"nick": "Jiří", "first_name": "Jiří", "last_name": "Němec"},
+            )
+        return self.author
+
+    def get_tags(self, names: set[str]) -> None:
+        """Load (or create) tags, which are not loaded yet."""
+        missing = names - self.tags.keys()
+        if not missing:
+            return
+        self.tags.update(
+            (tag.name_cze, tag) for tag in Tag.objects.filter(name_cze__in=missing)
+        )
+        new_tags = []
+        for name in missing - self.tags.keys():
+            topic = self.topics.get(name)
+            if topic is None:
+                logger.warning(f"Topic {name} does not exist in RethinkDB.")
+                continue
+            new_tags.append(
+                Tag(
+                    name_cze=name,
+                    url_cze=slugify(name),  # bulk_create doesn't call save()
+                    desc_cze=topic["description"]["cze"],
+                    order=topic["order"],
+                )
+            )
+        if new_tags:
+            # tags in conflict (the same URL) are not inserted and not counted
+            Tag.objects.bulk_create(new_tags, ignore_conflicts=True)
+            created = Tag.objects.filter(name_cze__in=[t.name_cze for t in new_tags])
+            for tag in created:
+                self.tags[tag.name_cze] = tag
+                self.stats.tags_created += 1
+
+    def post_from_document(self, document: dict) -> tuple[Post, list[str]]:
+        post = Post(
+            title_cze=document["header"]["cze"],
+            content_cze=document["content"]["cze"],
+            pub_time=datetime.strptime(document["when"], RDB_TIME_FORMAT).astimezone(
+                EUROPE_PRAGUE
+            ),
+            author=self.get_author(),
+        )
+        # bulk_create doesn't call save(), so fields computed there are computed here
+        post.url_cze = slugify(post.title_cze)
+        post.content_cze = post._meta.get_field("content_cze").pre_save(post, True)
+        render_post(post, ["cze"])
+        post.excerpt_cze, post.has_more_cze = make_excerpt(post.rendered_html_cze)
+        post.mod_time = timezone.now()
+        tag_names = [name for name in document["topics"]["cze"].split(";") if name]
+        return post, tag_names
+
+    def import_batch(self, documents: list[dict]) -> list[Post]:
+        posts: dict[str, tuple[Post, list[str]]] = {}
+        for document in documents:
+            post, tag_names = self.post_from_document(document)
+            posts[post.title_cze] = (post, tag_names)  # the last one of the same title
+            if self.stats.watermark is None or document["when"] > self.stats.watermark:
+                self.stats.watermark = document["when"]
+        self.get_tags({name for _, tag_names in posts.values() for name in tag_names})
+        stored = {
+            title: source
+            for title, *source in Post.objects.filter(title_cze__in=posts).values_list(
+                "title_cze", "content_cze", "pub_time", "author_id"
+            )
+        }
+        stored_tags = defaultdict[str, set[int]](set)
+        for title, tag_id in Post.tags.through.objects.filter(
+            post__title_cze__in=stored
+        ).values_list("post__title_cze", "tag_id"):
+            stored_tags[title].add(tag_id)
+        # posts with the same sources and without new tags are skipped
+        changed = {
+            title: (post, tag_names)
+            for title, (post, tag_names) in posts.items()
+            if stored.get(title) != [post.content_cze, post.pub_time, post.author_id]
+            or not stored_tags[title].issuperset(
+                self.tags[name].pk for name in tag_names if name in self.tags
+            )
+        }
+        self.stats.posts_unchanged += len(posts) - len(changed)
+        if not changed:
+            return []
+        Post.objects.bulk_create(
+            [post for post, _ in changed.values()],
+            update_conflicts=True,
+            unique_fields=["title_cze"],
+            update_fields=UPDATED_FIELDS,
+        )
+        # ids are given by database default (sequence), which is not returned by bulk_create
+        saved = list(Post.objects.filter(title_cze__in=changed).only("id", "title_cze"))
+        update_search_vectors(Post.objects.filter(pk__in=[post.pk for post in saved]))
+        # tags are only added like before (tags removed in RethinkDB stay)
+        Post.tags.through.objects.bulk_create(
+            [
+                Post.tags.through(post_id=post.pk, tag_id=self.tags[name].pk)
+                for post in saved
+                for name in changed[post.title_cze][1]
+                if name in self.tags
+            ],
+            ignore_conflicts=True,
+        )
+        updated = len(changed.keys() & stored.keys())
+        self.stats.posts_updated += updated
+        self.stats.posts_created += len(changed) - updated
+        return saved
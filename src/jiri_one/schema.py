@@ -4,14 +4,20 @@ from logging import getLogger
 
 import graphene
 from django.conf import settings
-from django.core.cache import cache
-from django.db.models import Count, Q
+from django.db.models import QuerySet
 from django.utils import timezone
+from graphene.utils.str_converters import to_camel_case
 from graphene_django import DjangoObjectType
-from graphql import GraphQLError
+from graphql import FieldNode, FragmentSpreadNode, GraphQLError, InlineFragmentNode
 
 # internal imports
+from jiri_one.client_ip import get_request_ip
+from jiri_one.excerpts import LISTING_DEFERRED_FIELDS
+from jiri_one.loaders import get_loaders
 from jiri_one.models import Comment, Post, Tag
+from jiri_one.rate_limit import aallow_comment, aallow_search
+from jiri_one.search import asearch_posts, render_snippet
+from jiri_one.tags import aget_tag_registry
 
 logger = getLogger("jiri_one")
 POSTS_ON_PAGE = settings.POSTS_ON_PAGE
@@ -25,26 +31,48 @@ def get_client_ip(info) -> str:
     """Extract client IP from GraphQL request info"""
     request = info.context
     if request and hasattr(request, "META"):
-        x_forwarded_for = request.META.get("HTTP_X_FORWARDED_FOR")
-        if x_forwarded_for:
-            return x_forwarded_for.split(",")[0].strip()
-        return request.META.get("REMOTE_ADDR", "unknown")
+        return get_request_ip(request)
 
     logger.error("We were not able to determine IP adres")
     return "NOT_AVAILABLE"
 
 
-def check_comment_rate_limit(ip_address: str) -> None:
-    """Check if IP has exceeded comment creation rate limit"""
-    cache_key = f"comment_rate_{ip_address}"
-    requests = cache.get(cache_key, 1)
-
-    if requests > 12:  # max 12 comments per hour
+async def check_comment_rate_limit(ip_address: str, nick: str, post_id: int) -> None:
+    """Check if IP, nick or post has exceeded comment creation rate limit"""
+    if not await aallow_comment(ip_address, nick, post_id):
         logger.warning(f"Comment rate limit exceeded for IP {ip_address}")
         raise GraphQLError("Too many comments. Please try again in an hour.")
 
-    # Increment counter with 1 hour expiry
-    cache.set(cache_key, requests + 1, 3600)
+
+def get_requested_fields(info) -> set[str]:
+    """Names of fields requested in selection of resolved field (fragments included)."""
+    names = set[str]()
+    selection_sets = [node.selection_set for node in info.field_nodes]
+    while selection_sets:
+        selection_set = selection_sets.pop()
+        if selection_set is None:
+            continue
+        for selection in selection_set.selections:
+            if isinstance(selection, FieldNode):
+                names.add(selection.name.value)
+            elif isinstance(selection, InlineFragmentNode):
+                selection_sets.append(selection.selection_set)
+            elif isinstance(selection, FragmentSpreadNode):
+                fragment = info.fragments.get(selection.name.value)
+                if fragment is not None:
+                    selection_sets.append(fragment.selection_set)
+    return names
+
+
+async def list_posts(queryset: QuerySet[Post], info) -> list[Post]:
+    """Big columns are loaded only if they are requested (lists use excerpts usually)."""
+    requested_fields = get_requested_fields(info)
+    deferred_fields = [
+        field
+        for field in LISTING_DEFERRED_FIELDS
+        if to_camel_case(field) not in requested_fields
+    ]
+    return [post async for post in queryset.defer(*deferred_fields)]
 
 
 def get_expected_signature(
@@ -65,21 +93,44 @@ def get_expected_signature(
 
 class PostType(DjangoObjectType):
     comments_count = graphene.Int()
+    # highlighted part of content, only for postsBySearch results
+    search_snippet = graphene.String()
 
     class Meta:
         model = Post
-        fields = ("id", "pub_time", "title_cze", "content_cze", "url_cze", "tags")
+        fields = (
+            "id",
+            "pub_time",
+            "title_cze",
+            "content_cze",
+            "rendered_html_cze",
+            "excerpt_cze",
+            "has_more_cze",
+            "url_cze",
+            "tags",
+        )
 
-    # Custom resolver for count field
+    # Custom resolver for count field, it is column of post
     def resolve_comments_count(post_instance, info):
-        return post_instance.comments.count()  # type: ignore
+        return post_instance.comment_count
+
+    async def resolve_tags(post_instance, info):
+        return await get_loaders(info).tags.load(post_instance.pk)
+
+    def resolve_search_snippet(post_instance, info):
+        return render_snippet(getattr(post_instance, "search_headline", None))
 
 
 class TagType(DjangoObjectType):
+    posts_count = graphene.Int()
+
     class Meta:
         model = Tag
         fields = ("name_cze", "desc_cze", "url_cze", "order")
 
+    async def resolve_posts_count(tag_instance, info):
+        return (await aget_tag_registry()).post_counts.get(tag_instance.pk, 0)
+
 
 class CommentType(DjangoObjectType):
     class Meta:
@@ -103,81 +154,71 @@ class Query(graphene.ObjectType):
     all_tags = graphene.List(TagType)
     # TODO: think about pagination (it can be handled in frontend, but to save DB connections it can be handled here too)
 
-    def resolve_post_by_id(root, info, id):
+    async def resolve_post_by_id(root, info, id):
         try:
-            return (
-                Post.objects.prefetch_related("tags")
-                .select_related("author")
-                .get(id=id)
-            )
+            return await Post.objects.select_related("author").aget(id=id)
         except Post.DoesNotExist:
             logger.error(f"Post with ID {id} does not exist.")
             return None
 
-    def resolve_post_by_url(root, info, url):
+    async def resolve_post_by_url(root, info, url):
         try:
-            return (
-                Post.objects.prefetch_related("tags")
-                .select_related("author")
-                .get(url_cze=url)
-            )
+            return await Post.objects.select_related("author").aget(url_cze=url)
         except Post.DoesNotExist:
             logger.error(f"Post with URL {url} does not exist.")
             return None
 
-    def resolve_all_posts(root, info, page=1):
+    async def resolve_all_posts(root, info, page=1):
         if page < 1:
             logger.info("Someone tried to put bad page number")
             page = 1
         offset = get_offset(page)
-        return (
-            Post.objects.prefetch_related("tags")
-            .select_related("author")
-            .annotate(comments_count=Count("comments"))
+        return await list_posts(
+            Post.objects.select_related("author")
             .order_by("-id")
-            .all()[offset : offset + POSTS_ON_PAGE]
+            .all()[offset : offset + POSTS_ON_PAGE],
+            info,
         )
 
-    def resolve_posts_by_tags_url(root, info, tag_urls, page=1):
+    async def resolve_posts_by_tags_url(root, info, tag_urls, page=1):
         if page < 1:
             logger.info("Someone tried to put bad page number")
             page = 1
-        # Fetch all Tag objects for the provided tag_urls
-        tags = Tag.objects.filter(url_cze__in=tag_urls)
-
-        # Log missing tags
-        found_tag_urls = {tag.url_cze for tag in tags}
+        # Get all Tag objects for the provided tag_urls from memory
+        tag_registry = await aget_tag_registry()
+        tags = list[Tag]()
         for tag_url in tag_urls:
-            if tag_url not in found_tag_urls:
+            tag = tag_registry.get(tag_url)
+            if tag is None:  # Log missing tags
                 logger.error(f"Tag with URL {tag_url} does not exist.")
+            else:
+                tags.append(tag)
 
         # Filter posts by the fetched tags
         offset = get_offset(page)
-        return (
-            Post.objects.prefetch_related("tags")
-            .select_related("author")
-            .annotate(comments_count=Count("comments"))
+        return await list_posts(
+            Post.objects.select_related("author")
             .order_by("-id")
             .filter(tags__in=tags)
-            .distinct()[offset : offset + POSTS_ON_PAGE]
+            .distinct()[offset : offset + POSTS_ON_PAGE],
+            info,
         )
 
-    def resolve_posts_by_search(root, info, text, page=1):
+    async def resolve_posts_by_search(root, info, text, page=1):
+        if not await aallow_search(get_client_ip(info)):
+            logger.warning(f"Search rate limit exceeded for IP {get_client_ip(info)}")
+            raise GraphQLError("Too many searches. Please try again later.")
         if page < 1:
             logger.info("Someone tried to put bad page number")
             page = 1
         offset = get_offset(page)
-        return (
-            Post.objects.prefetch_related("tags")
-            .select_related("author")
-            .annotate(comments_count=Count("comments"))
-            .order_by("-id")
-            .filter(Q(content_cze__icontains=text) | Q(title_cze__icontains=text))
-            .distinct()[offset : offset + POSTS_ON_PAGE]
-        )
+        queryset = Post.objects.select_related("author").order_by("-id")
+        # results are ordered by relevance
+        queryset = await asearch_posts(queryset, text)
+        return await list_posts(queryset[offset : offset + POSTS_ON_PAGE], info)
 
-    def resolve_all_tags(root, info):
-        return Tag.objects.order_by("order").all()
+    async def resolve_all_tags(root, info):
+        return (await aget_tag_registry()).tags
 
     # TODO: implement search in posts!
 
@@ -198,7 +239,7 @@ class CreateComment(graphene.Mutation):
     success = graphene.Boolean()
     message = graphene.String()
 
-    def mutate(
+    async def mutate(
         self, info, post_id, title, content, nick, api_key, timestamp, signature
     ):
         # Verify API key
@@ -223,8 +264,8 @@ class CreateComment(graphene.Mutation):
             logger.warning(f"Invalid signature from IP {get_client_ip(info)}")
             raise GraphQLError("Invalid request signature.")
 
-        # Rate limiting per IP
-        check_comment_rate_limit(get_client_ip(info))
+        # Rate limiting per IP, nick and post
+        await check_comment_rate_limit(get_client_ip(info), nick, post_id)
 
         # Validate inputs
         if not title.strip():
@@ -243,14 +284,14 @@ class CreateComment(graphene.Mutation):
             raise GraphQLError("Nick is too long.")
 
         try:
-            post = Post.objects.get(id=post_id)
+            post = await Post.objects.aget(id=post_id)
         except Post.DoesNotExist as exc:
             logger.error(
                 f"Failed to create comment for Post ID {post_id}, post doesn't exist."
             )
             raise GraphQLError("Failed to create comment. Please try again.") from exc
         try:
-            comment = Comment.objects.create(
+            comment = await Comment.objects.acreate(
                 post=post,
                 title=title.strip(),
                 content=content.strip(),
@@ -0,0 +1,102 @@
+from django.conf import settings
+from django.contrib.postgres.search import (
+    CombinedSearchVector,
+    SearchHeadline,
+    SearchQuery,
+    SearchRank,
+    SearchVector,
+)
+from django.db.models import F, FloatField, Q, QuerySet, TextField, Value
+from django.db.models.functions import Cast
+from django.utils.html import escape, strip_tags
+
+# text search configuration created in migration 0004 (simple + unaccent)
+SEARCH_CONFIG: str = settings.SEARCH_CONFIG
+# control characters are used like highlight markers, because post content is HTML
+# and we need to strip it before we put our own <mark> tags there
+HIGHLIGHT_START = "\x02"
+HIGHLIGHT_STOP = "\x03"
+# pages and page indexes of longer searches are not cached (titles have 100 chars)
+MAX_CACHED_SEARCH_LENGTH = 100
+
+
+# fields of Post.search_vector, it is recomputed only when some of them is saved
+SEARCHED_FIELDS = frozenset(("title_cze", "title_eng", "content_cze", "content_eng"))
+
+
+def post_search_vector() -> CombinedSearchVector:
+    """Expression for Post.search_vector - titles are weighted above content."""
+    return (
+        SearchVector("title_cze", weight="A", config=SEARCH_CONFIG)
+        + SearchVector("title_eng", weight="A", config=SEARCH_CONFIG)
+        + SearchVector("content_cze", weight="B", config=SEARCH_CONFIG)
+        + SearchVector("content_eng", weight="B", config=SEARCH_CONFIG)
+    )
+
+
+def normalize_search(text: str) -> str:
+    """Canonical form of searched text, searches are case insensitive."""
+    return " ".join(text.split()).lower()
+
+
+def update_search_vectors(queryset: QuerySet) -> int:
+    """Recompute search_vector for all posts in queryset, returns nr of updated rows."""
+    return queryset.update(search_vector=post_search_vector())
+
+
+def fulltext_search(queryset: QuerySet, text: str) -> QuerySet:
+    """Filter posts with full-text search, ordered by relevance and annotated with headline."""
+    query = SearchQuery(text, config=SEARCH_CONFIG, search_type="websearch")
+    return (
+        queryset.filter(search_vector=query)
+        .annotate(
+            # ts_rank is float4, which is loaded rounded (0.33098254), so it wouldn't
+            # be equal to itself in seek filter of the next page (see pagination.py),
+            # float8 is loaded exactly
+            search_rank=Cast(SearchRank(F("search_vector"), query), FloatField()),
+            search_headline=SearchHeadline(
+                "content_cze",
+                query,
+                config=SEARCH_CONFIG,
+                start_sel=HIGHLIGHT_START,
+                stop_sel=HIGHLIGHT_STOP,
+                max_fragments=2,
+                fragment_delimiter=" … ",
+            ),
+        )
+        .order_by("-search_rank", "-id")
+    )
+
+
+def substring_search(queryset: QuerySet, text: str) -> QuerySet:
+    """Old (slow) substring search, used only like fallback for parts of words."""
+    return queryset.filter(
+        Q(content_cze__icontains=text) | Q(title_cze__icontains=text)
+    ).annotate(search_headline=Value(None, output_field=TextField()))
+
+
+def search_posts(queryset: QuerySet, text: str) -> QuerySet:
+    """Full-text search with fallback to substring search, when nothing is found."""
+    found = fulltext_search(queryset, text)
+    if found.exists():
+        return found
+    return substring_search(queryset, text)
+
+
+async def asearch_posts(queryset: QuerySet, text: str) -> QuerySet:
+    """Async variant of search_posts."""
+    found = fulltext_search(queryset, text)
+    if await found.aexists():
+        return found
+    return substring_search(queryset, text)
+
+
+def render_snippet(headline: str | None) -> str | None:
+    """Make safe HTML snippet from ts_headline output (HTML stripped, matches in <mark>)."""
+    if not headline:
+        return None
+    return (
+        escape(strip_tags(headline))
+        .replace(HIGHLIGHT_START, "<mark>")
+        .replace(HIGHLIGHT_STOP, "</mark>")
+    )
@@ -0,0 +1,77 @@
+from django.db.models import F
+from django.db.models.signals import m2m_changed, post_delete, post_save
+from django.dispatch import receiver
+
+# internal imports
+from jiri_one.dependencies import (
+    comments_dependency,
+    instance_dependency,
+    invalidate_dependencies,
+    list_dependency,
+)
+from jiri_one.models import Comment, Post, Tag
+from jiri_one.pagination import bump_listing_version
+from jiri_one.tags import invalidate_tag_registry
+
+
+@receiver(post_save, sender=Post)
+@receiver(post_delete, sender=Post)
+@receiver(post_delete, sender=Tag)
+@receiver(m2m_changed, sender=Post.tags.through)
+def invalidate_post_listings(sender, **kwargs):
+    """Posts in listings (or their order) changed, so cached page indexes are old."""
+    bump_listing_version()
+
+
+@receiver(post_save, sender=Tag)
+@receiver(post_delete, sender=Tag)
+@receiver(post_delete, sender=Post)
+@receiver(m2m_changed, sender=Post.tags.through)
+def invalidate_tags(sender, **kwargs):
+    """Tag itself or nr of its posts changed."""
+    invalidate_tag_registry()
+
+
+@receiver(post_save, sender=Post)
+@receiver(post_delete, sender=Post)
+def invalidate_post_responses(sender, instance, created=False, **kwargs):
+    """Changed post can be in any list of posts (search), new or deleted post changes counts of tags."""
+    dependencies = [instance_dependency(instance), list_dependency(Post)]
+    if created or kwargs["signal"] is post_delete:
+        dependencies.append(list_dependency(Tag))
+    invalidate_dependencies(*dependencies)
+
+
+@receiver(post_save, sender=Tag)
+@receiver(post_delete, sender=Tag)
+def invalidate_tag_responses(sender, instance, **kwargs):
+    invalidate_dependencies(instance_dependency(instance), list_dependency(Tag))
+
+
+@receiver(m2m_changed, sender=Post.tags.through)
+def invalidate_post_tags_responses(sender, instance, action, model, pk_set, **kwargs):
+    """Tags of post (or posts of tag for reverse relation) changed."""
+    if not action.startswith("post_"):
+        return
+    dependencies = [instance_dependency(instance), list_dependency(Post)]
+    dependencies += [f"{model._meta.label_lower}:{pk}" for pk in pk_set or ()]
+    dependencies.append(list_dependency(Tag))
+    invalidate_dependencies(*dependencies)
+
+
+@receiver(post_save, sender=Comment)
+@receiver(post_delete, sender=Comment)
+def invalidate_comment_responses(sender, instance, **kwargs):
+    invalidate_dependencies(
+        instance_dependency(instance),
+        comments_dependency(instance.post_id),
+        list_dependency(Comment),  # counts in listings
+    )
+
+
+@receiver(post_delete, sender=Comment)
+def decrease_comment_count(sender, instance, **kwargs):
+    """It is in the transaction of delete (QuerySet.delete too), Comment.save increases it."""
+    Post.objects.filter(pk=instance.post_id).update(
+        comment_count=F("comment_count") - 1
+    )
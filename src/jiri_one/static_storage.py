@@ -0,0 +1,123 @@
+import gzip
+import posixpath
+import re
+from functools import lru_cache
+
+import brotli
+from django.conf import settings
+from django.contrib.staticfiles import finders
+from django.contrib.staticfiles.storage import (
+    HashedFilesMixin,
+    ManifestStaticFilesStorage,
+    staticfiles_storage,
+)
+from django.core.files.base import ContentFile
+
+# Static files get content hash in their names (styles.1a2b3c.css), so they never
+# change and can be cached by browsers forever. Hashed files of text types get
+# precompressed siblings (styles.1a2b3c.css.br and .gz) at collectstatic time. The
+# name says the content, so existing siblings are not compressed again (incremental
+# collectstatic after redeploy compresses only changed files).
+COMPRESSED_SUFFIXES = {"br": ".br", "gzip": ".gz"}
+COMPRESSIBLE_EXTENSIONS = (".css", ".js", ".svg", ".json", ".txt", ".xml", ".map")
+CSS_URL_RE = re.compile(r"""url\((['"]?)(?!data:|https?:|/|#)([^'")]+)\1\)""")
+
+
+def compress_static(content: bytes, encoding: str) -> bytes:
+    """The best (slow) compression, files are compressed only once."""
+    if encoding == "br":
+        return brotli.compress(content, quality=11)
+    return gzip.compress(content, compresslevel=9, mtime=0)
+
+
+class PrecompressedManifestStaticFilesStorage(ManifestStaticFilesStorage):
+    """ManifestStaticFilesStorage which saves .br and .gz siblings of hashed files."""
+
+    keep_intermediate_files = False
+
+    def post_process(self, paths, dry_run=False, **options):
+        hashed_names = {}
+        for name, hashed_name, processed in super().post_process(
+            paths, dry_run, **options
+        ):
+            if hashed_name and not isinstance(processed, Exception):
+                hashed_names[hashed_name] = name  # CSS files come from every pass
+            yield name, hashed_name, processed
+        if dry_run:
+            return
+        for hashed_name in hashed_names:
+            # tiny files are not compressed (like responses, see compression.py)
+            if (
+                hashed_name.endswith(COMPRESSIBLE_EXTENSIONS)
+                and self.size(hashed_name) >= settings.COMPRESSION_MIN_SIZE
+            ):
+                yield from self.compress_file(hashed_name)
+
+    def compress_file(self, hashed_name: str):
+        content = None
+        for encoding, suffix in COMPRESSED_SUFFIXES.items():
+            compressed_name = f"{hashed_name}{suffix}"
+            if self.exists(compressed_name):  # the same hashed name, the same content
+                continue
+            if content is None:
+                with self.open(hashed_name) as file:
+                    content = file.read()
+            compressed = compress_static(content, encoding)
+            if len(compressed) >= len(content):
+                continue  # client gets the original
+            self._save(compressed_name, ContentFile(compressed))
+            yield hashed_name, compressed_name, True
+
+
+def is_hashed_storage() -> bool:
+    return isinstance(staticfiles_storage, HashedFilesMixin)
+
+
+@lru_cache
+def get_hashed_names() -> frozenset[str]:
+    """Names of hashed files from manifest (it is loaded, when workers start)."""
+    return frozenset(getattr(staticfiles_storage, "hashed_files", {}).values())
+
+
+def read_css(path: str) -> str | None:
+    """Content of CSS file with absolute URLs (relative ones would be wrong inline)."""
+    if not is_hashed_storage():  # files from apps, collectstatic is not run
+        name = path
+        full_path = finders.find(path)
+    else:
+        try:
+            name = staticfiles_storage.stored_name(path)
+        except ValueError:  # file is not in manifest
+            return None
+        full_path = staticfiles_storage.path(name)
+    if full_path is None:
+        return None
+    with open(full_path, encoding="utf-8") as file:
+        css = file.read()
+    directory = posixpath.dirname(name)
+    return CSS_URL_RE.sub(
+        lambda match: (
+            f"url({match[1]}{staticfiles_storage.base_url}"
+            f"{posixpath.normpath(posixpath.join(directory, match[2]))}{match[1]})"
+        ),
+        css,
+    )
+
+
+@lru_cache
+def read_cached_css(path: str) -> str | None:
+    """Hashed static files are the same until the next deploy (restart of workers)."""
+    return read_css(path)
+
+
+def get_inline_css(paths: tuple[str, ...]) -> str | None:
+    """CSS of files for <style>, if they are smaller than STATIC_INLINE_CSS_MAX_SIZE."""
+    contents = [
+        (read_cached_css if is_hashed_storage() else read_css)(path) for path in paths
+    ]
+    if None in contents:
+        return None
+    css = "\n".join(contents)  # type: ignore[arg-type]
+    if len(css.encode()) > settings.STATIC_INLINE_CSS_MAX_SIZE:
+        return None
+    return css
@@ -0,0 +1,81 @@
+from dataclasses import dataclass, field
+from time import time_ns
+
+from django.core.cache import cache
+from django.db.models import Count
+
+# internal imports
+from jiri_one.models import Tag
+
+# the registry is in memory of every process, this shared version tells the process to rebuild it
+TAGS_VERSION_KEY = "tag_registry_version"
+
+
+@dataclass(frozen=True)
+class TagRegistry:
+    """All tags in memory - they change maybe once a month, but they are on every page."""
+
+    version: int
+    tags: list[Tag]  # ordered like Tag.Meta.ordering
+    by_url: dict[str, Tag]  # czech and english URLs
+    post_counts: dict[int, int]  # tag pk -> nr of posts
+    html: str = field(repr=False)  # pre-rendered navigation
+
+    def get(self, url: str) -> Tag | None:
+        return self.by_url.get(url)
+
+
+_registry: TagRegistry | None = None
+
+
+def render_tags_html(tags: list[Tag]) -> str:
+    """HTML with links to all tags for navigation in base.html"""
+    links = [
+        f'<a style="border-bottom: 1px solid #3c67be;" href="/tag/{tag.url_cze}">{tag.name_cze}</a>'
+        for tag in tags[:-1]
+    ]
+    links += [f'<a href="/tag/{tag.url_cze}">{tag.name_cze}</a>' for tag in tags[-1:]]
+    return "".join(links)
+
+
+def build_registry(version: int, tags: list[Tag]) -> TagRegistry:
+    by_url = {tag.url_eng: tag for tag in tags if tag.url_eng}
+    by_url.update({tag.url_cze: tag for tag in tags})  # czech URL has priority
+    return TagRegistry(
+        version=version,
+        tags=tags,
+        by_url=by_url,
+        post_counts={tag.pk: tag.posts_count for tag in tags},  # type: ignore[attr-defined]
+        html=render_tags_html(tags),
+    )
+
+
+def tags_queryset():
+    return Tag.objects.annotate(posts_count=Count("post")).order_by("order")
+
+
+def get_tag_registry() -> TagRegistry:
+    global _registry
+    version = cache.get_or_set(TAGS_VERSION_KEY, time_ns, None)
+    if _registry is None or _registry.version != version:
+        _registry = build_registry(version, list(tags_queryset()))
+    return _registry
+
+
+async def aget_tags_version() -> int:
+    return await cache.aget_or_set(TAGS_VERSION_KEY, time_ns, None)
+
+
+async def aget_tag_registry() -> TagRegistry:
+    global _registry
+    version = await aget_tags_version()
+    if _registry is None or _registry.version != version:
+        _registry = build_registry(version, [tag async for tag in tags_queryset()])
+    return _registry
+
+
+def invalidate_tag_registry() -> None:
+    """Tags (or posts in them) changed, all processes will rebuild the registry."""
+    global _registry
+    _registry = None
+    cache.set(TAGS_VERSION_KEY, time_ns(), None)
@@ -0,0 +1,20 @@
+from django.template import Library
+from django.templatetags.static import static
+from django.utils.html import format_html, format_html_join
+from django.utils.safestring import mark_safe
+
+# internal imports
+from jiri_one.static_storage import get_inline_css
+
+register = Library()
+
+
+@register.simple_tag
+def critical_css(*paths: str) -> str:
+    """Small CSS inline in <style> (page is rendered without waiting), big in <link>."""
+    css = get_inline_css(paths)
+    if css is not None:
+        return format_html("<style>{}</style>", mark_safe(css))
+    return format_html_join(
+        "\n", '<link rel="stylesheet" href="{}">', ((static(path),) for path in paths)
+    )
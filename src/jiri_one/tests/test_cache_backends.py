@@ -0,0 +1,154 @@
+from multiprocessing import get_context
+from time import sleep
+from unittest.mock import patch
+
+from django.core.cache import caches
+from django.core.management import call_command
+from django.test import TestCase
+
+# internal imports
+from jiri_one import cache_backends
+from jiri_one.cache_backends import L1Cache, TwoTierCache, value_size
+
+
+def other_process_cache() -> TwoTierCache:
+    """Cache with the same L2 like default cache, but with its own L1 (other worker)."""
+    default = caches["default"]
+    cache = TwoTierCache(default.l2_alias, {})
+    cache.l1 = L1Cache(max_size=1024 * 1024, timeout=60, check_interval=0)
+    return cache
+
+
+def incr_many(key: str, nr: int) -> None:
+    """Target of other process, the shared counter is incremented nr times."""
+    cache = other_process_cache()
+    for _ in range(nr):
+        cache.incr(key)
+
+
+class TwoTierCacheTests(TestCase):
+    def setUp(self):
+        self.cache = caches["default"]
+        self.cache.clear()
+        self.cache.reset_stats()
+
+    def test_value_is_served_from_l1(self):
+        self.cache.set("page", {"html": "<p>Ahoj</p>"})
+        self.assertEqual(self.cache.get("page"), {"html": "<p>Ahoj</p>"})
+        self.assertEqual(self.cache.get("missing", "default"), "default")
+        stats = self.cache.get_stats()
+        self.assertEqual(stats["l1_hits"], 1)
+        self.assertEqual(stats["l1_misses"], 1)
+        self.assertEqual(stats["l2_misses"], 1)
+        self.assertEqual(stats["l1_hit_ratio"], 0.5)
+
+    def test_value_from_l2_is_kept_in_l1(self):
+        other = other_process_cache()
+        other.set("page", "from other worker")
+        self.assertEqual(self.cache.get("page"), "from other worker")
+        self.assertEqual(self.cache.get("page"), "from other worker")
+        stats = self.cache.get_stats()
+        self.assertEqual(stats["l2_hits"], 1)
+        self.assertEqual(stats["l1_hits"], 1)
+
+    def test_l1_doesnt_outlive_change_in_l2(self):
+        other = other_process_cache()
+        with patch.object(self.cache.l1, "check_interval", 0):  # stamp of every hit
+            self.cache.set("page", "old")
+            self.assertEqual(self.cache.get("page"), "old")
+            other.set("page", "new")
+            self.assertEqual(self.cache.get("page"), "new")
+            other.delete("page")
+            self.assertIsNone(self.cache.get("page"))
+            self.cache.set_many({"a": 1, "b": 2})
+            other.delete_many(["a"])
+            self.assertEqual(self.cache.get_many(["a", "b"]), {"b": 2})
+
+    def test_read_is_one_round_trip_to_l2(self):
+        self.cache.set("page", "in L1")
+        other_process_cache().set("other", "only in L2")
+        with patch.object(
+            type(self.cache.l2), "get_many", wraps=self.cache.l2.get_many
+        ) as get_many:
+            self.assertEqual(
+                self.cache.get_many(["page", "other"]),
+                {"page": "in L1", "other": "only in L2"},
+            )
+        get_many.assert_called_once()
+
+    def test_stamps_are_checked_once_per_interval(self):
+        other = other_process_cache()
+        with patch.object(self.cache.l1, "check_interval", 0.2):
+            self.cache.set("page", "old")
+            other.set("page", "new")
+            # L2 is not read at all, so change of other process is not seen yet
+            with patch.object(
+                type(self.cache.l2), "get_many", side_effect=AssertionError
+            ):
+                self.assertEqual(self.cache.get("page"), "old")
+            sleep(0.25)
+            self.assertEqual(self.cache.get("page"), "new")
+        # own changes are seen at once
+        self.cache.set("page", "own")
+        self.assertEqual(self.cache.get("page"), "own")
+
+    def test_counters_are_shared(self):
+        other = other_process_cache()
+        self.assertTrue(self.cache.add("counter", 1, None))
+        self.assertFalse(other.add("counter", 5, None))
+        self.assertEqual(self.cache.get("counter"), 1)  # without stamp, so not in L1
+        self.assertEqual(other.incr("counter"), 2)
+        self.assertEqual(self.cache.get("counter"), 2)
+        self.assertEqual(self.cache.decr("counter"), 1)
+        self.assertEqual(other.get("counter"), 1)
+
+    def test_incr_is_atomic_across_processes(self):
+        self.cache.add("version", 0, None)
+        processes = [
+            get_context("fork").Process(target=incr_many, args=("version", 200))
+            for _ in range(2)
+        ]
+        for process in processes:
+            process.start()
+        for process in processes:
+            process.join()
+        self.assertEqual([process.exitcode for process in processes], [0, 0])
+        self.assertEqual(self.cache.get("version"), 400)
+
+    def test_l2_is_culled_once_per_interval(self):
+        l2 = self.cache.l2
+        cache_backends._culled.pop(l2._dir, None)
+        with patch.object(
+            type(l2), "_list_cache_files", wraps=l2._list_cache_files
+        ) as list_cache_files:
+            for nr in range(3):
+                l2.set(f"key{nr}", nr)
+        list_cache_files.assert_called_once()
+
+    def test_lru_eviction_by_size_and_timeout(self):
+        value = "x" * 100
+        l1 = L1Cache(max_size=2 * value_size(value) + 10, timeout=60, check_interval=1)
+        l1.set("a", value, "stamp", None)
+        l1.set("b", value, "stamp", None)
+        l1.get("a")  # b is the least recently used now
+        l1.set("c", value, "stamp", None)
+        self.assertEqual(list(l1.entries), ["a", "c"])
+        self.assertEqual(l1.size, 2 * value_size(value))
+        l1.set("big", "x" * 1000, "stamp", None)  # bigger than whole L1
+        self.assertEqual(list(l1.entries), ["a", "c"])
+        l1.set("d", 4, "stamp", 0)  # expired immediately
+        self.assertIsNone(l1.get("d"))
+        l1.delete("a")
+        self.assertEqual(l1.size, value_size(value))
+
+    def test_value_size(self):
+        page = {"content": "x" * 10_000, "dependencies": ["post:1"], "created": 1}
+        self.assertGreater(value_size(page), 10_000)
+        self.assertLess(value_size(page), 11_000)
+
+    def test_shared_stats(self):
+        self.cache.get("missing")
+        call_command("cache_stats")
+        self.assertEqual(self.cache.get_shared_stats()["l1_misses"], 1)
+        call_command("cache_stats", "--reset")
+        self.assertEqual(self.cache.get_shared_stats()["l1_misses"], 0)
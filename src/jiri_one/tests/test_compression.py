@@ -0,0 +1,101 @@
+import gzip
+import json
+from io import StringIO
+
+import brotli
+from django.core.cache import cache
+from django.core.management import call_command
+from django.test import TestCase, override_settings
+
+# internal imports
+from jiri_one import compression
+from jiri_one.compression import GzipTemplate, accepted_encodings
+from jiri_one.tests.test_views import create_post
+
+POSTS_QUERY = json.dumps({"query": "{ allPosts { id titleCze contentCze } }"})
+
+
+class CompressionTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        compression.reset_stats()
+        self.post = create_post("Komprimovaný příspěvek", "<p>Slovo</p>" * 200)
+
+    def get_page(self, encoding: str):
+        return self.client.get(
+            f"/{self.post.url_cze}/", headers={"accept-encoding": encoding}
+        )
+
+    def test_accepted_encodings(self):
+        self.assertEqual(accepted_encodings("gzip, deflate, br"), ["br", "gzip"])
+        self.assertEqual(accepted_encodings("br;q=0.5, gzip"), ["gzip", "br"])
+        self.assertEqual(accepted_encodings("gzip;q=0, *"), ["br"])
+        self.assertEqual(accepted_encodings("identity"), [])
+        self.assertEqual(accepted_encodings(""), [])
+
+    def test_gzip_template(self):
+        text = "<p>a</p>TOKEN<p>b</p>" * 50 + "TOKEN"
+        template = GzipTemplate.from_text(text, "TOKEN")
+        body = text.replace("TOKEN", "secret").encode()
+        self.assertEqual(gzip.decompress(template.render("secret", body)), body)
+
+    def test_cached_page_is_precompressed(self):
+        plain = self.get_page("identity")
+        self.assertNotIn("Content-Encoding", plain)
+        self.assertIn("Accept-Encoding", plain["Vary"])
+        for _ in range(2):  # MISS and HIT (from page cache)
+            response = self.get_page("gzip, br")
+            self.assertEqual(response["Content-Encoding"], "gzip")
+            body = gzip.decompress(response.content)
+            self.assertIn(b"Slovo", body)
+            # CSRF token of the visitor (masked, so only its length is the same)
+            self.assertEqual(len(body), len(plain.content))
+            self.assertNotIn(b"__CSRF_TOKEN_PLACEHOLDER__", body)
+            self.assertTrue(response["ETag"].startswith("W/"))
+        stats = compression.get_shared_stats()
+        self.assertEqual((stats["responses"], stats["precompressed"]), (0, 0))
+        compression.flush_stats()
+        stats = compression.get_shared_stats()
+        self.assertEqual((stats["responses"], stats["precompressed"]), (2, 2))
+        self.assertEqual(stats["cache_misses"], 0)
+        self.assertLess(stats["ratio"], 0.5)
+
+    def test_not_modified_with_weak_etag(self):
+        etag = self.get_page("gzip")["ETag"]
+        response = self.client.get(
+            f"/{self.post.url_cze}/",
+            headers={"accept-encoding": "gzip", "if-none-match": etag},
+        )
+        self.assertEqual(response.status_code, 304)
+
+    def test_same_body_is_compressed_once(self):
+        for _ in range(2):
+            response = self.client.post(
+                "/graphql",
+                POSTS_QUERY,
+                content_type="application/json",
+                headers={"accept-encoding": "br"},
+            )
+            self.assertEqual(response["Content-Encoding"], "br")
+            data = json.loads(brotli.decompress(response.content))
+            self.assertEqual(
+                data["data"]["allPosts"][0]["titleCze"], self.post.title_cze
+            )
+        compression.flush_stats()
+        stats = compression.get_shared_stats()
+        self.assertEqual((stats["cache_misses"], stats["cache_hits"]), (1, 1))
+
+    @override_settings(COMPRESSION_MIN_SIZE=10**6)
+    def test_small_bodies_are_not_compressed(self):
+        response = self.get_page("gzip")
+        self.assertNotIn("Content-Encoding", response)
+        self.assertIn(b"Slovo", response.content)
+
+    def test_compression_stats_command(self):
+        self.get_page("gzip")
+        stdout = StringIO()
+        call_command("compression_stats", "--reset", stdout=stdout)
+        self.assertIn(
+            "Compressed responses: 1 (1 precompressed pages)", stdout.getvalue()
+        )
+        self.assertEqual(compression.get_shared_stats()["responses"], 0)
@@ -0,0 +1,75 @@
+from io import StringIO
+
+from django.core.cache import cache
+from django.core.management import call_command
+from django.test import TestCase
+
+# internal imports
+from jiri_one.content_rewrite import RULE_SETS, ContentRewriter
+from jiri_one.models import Post
+from jiri_one.tests.test_views import create_post
+
+OLD_CONTENT = (
+    '<p><a href="http://jiri.one/soubory/clanek.pdf">PDF</a> '
+    '<img src="../soubory/obrazek.png"></p><p>soubory/text</p>'
+)
+
+
+class ContentRewriteTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.old = create_post("Starý příspěvek", OLD_CONTENT)
+        self.new = create_post("Nový příspěvek", "<p>Bez starých souborů.</p>")
+        self.old.refresh_from_db()
+        self.new.refresh_from_db()
+
+    def rewrite(self, *args) -> str:
+        stdout = StringIO()
+        call_command("rewrite_content", "files_urls", *args, stdout=stdout)
+        return stdout.getvalue()
+
+    def test_files_urls_rules(self):
+        rule_set = RULE_SETS["files_urls"]
+        content = rule_set.rewrite(OLD_CONTENT)
+        self.assertIn('href="/files/clanek.pdf"', content)
+        self.assertIn('src="/files/obrazek.png"', content)
+        self.assertIn("files/text", content)
+        self.assertNotIn("soubory", content)
+        # content without needle is not parsed (and not reformatted)
+        self.assertEqual(rule_set.rewrite("<br>"), "<br>")
+        self.assertIsNone(rule_set.rewrite(None))
+
+    def test_dry_run_saves_nothing(self):
+        output = self.rewrite("--dry-run", "--workers", "1")
+        self.assertIn(f"Post {self.old.pk}: content_cze:", output)
+        self.assertNotIn(f"Post {self.new.pk}", output)
+        self.assertIn("1 posts would change", output)
+        self.assertEqual(
+            Post.objects.get(pk=self.old.pk).content_cze, self.old.content_cze
+        )
+
+    def test_only_changed_posts_are_saved(self):
+        output = self.rewrite("--workers", "1", "--batch-size", "1")
+        self.assertIn("Read 2 posts in 2 batches", output)
+        old = Post.objects.get(pk=self.old.pk)
+        self.assertNotIn("soubory", old.content_cze)
+        self.assertEqual(old.mod_time, self.old.mod_time)
+        self.assertNotIn("soubory", old.excerpt_cze)
+        new = Post.objects.get(pk=self.new.pk)
+        self.assertEqual(
+            (new.content_cze, new.mod_time), (self.new.content_cze, self.new.mod_time)
+        )
+        self.assertIn("0 posts changed", self.rewrite("--workers", "1"))
+
+    def test_process_pool(self):
+        rows = [(nr, OLD_CONTENT if nr % 2 else "<p>x</p>", None) for nr in range(20)]
+        written = []
+        stats = ContentRewriter("files_urls", workers=2, batch_size=3).run(
+            rows, write=written.extend
+        )
+        self.assertEqual(stats.batches, 7)
+        self.assertEqual([row[0] for row in written], list(range(1, 20, 2)))
+        self.assertEqual(
+            [post_id for post_id, _ in stats.changes], list(range(1, 20, 2))
+        )
+        self.assertNotIn("soubory", written[0][1])
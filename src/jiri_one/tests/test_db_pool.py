@@ -0,0 +1,85 @@
+from io import StringIO
+
+from asgiref.sync import async_to_sync
+from django.core.cache import cache
+from django.core.management import call_command
+from django.db import connection, connections
+from django.http import HttpResponse
+from django.test import RequestFactory, TransactionTestCase, override_settings
+
+# internal imports
+from jiri_one import db_pool
+from jiri_one.conditional import aget_post_validators
+from jiri_one.models import Comment
+from jiri_one.rate_limit import SEARCH_LIMIT
+from jiri_one.tests.test_views import create_post
+
+
+class DbPoolTests(TransactionTestCase):
+    def setUp(self):
+        cache.clear()
+        self.post = create_post("Příspěvek z poolu", "<p>Obsah</p>")
+        connections.close_all()  # returned to pool
+        db_pool.reset_stats()
+
+    def test_connections_are_from_pool(self):
+        self.assertIsNotNone(connection.pool)
+        response = self.client.get(f"/{self.post.url_cze}/")
+        self.assertEqual(response.status_code, 200)
+        self.assertRegex(
+            response["Server-Timing"], r'db-checkout;dur=[\d.]+;desc="1 checkouts"'
+        )
+        db_pool.flush_stats()
+        stats = db_pool.get_shared_stats()
+        self.assertEqual((stats["requests"], stats["checkouts"]), (1, 1))
+        self.assertGreater(stats["checkout_avg_ms"], 0)
+        stdout = StringIO()
+        call_command("db_pool_stats", "--reset", stdout=stdout)
+        self.assertIn("Requests: 1 (1 with checkout), checkouts: 1", stdout.getvalue())
+        self.assertEqual(db_pool.get_shared_stats()["requests"], 0)
+
+    def test_request_without_checkout(self):
+        middleware = db_pool.db_checkout_middleware(lambda request: HttpResponse())
+        response = middleware(RequestFactory().get("/"))
+        self.assertFalse(response.has_header("Server-Timing"))
+        db_pool.record_checkout(1_000_000)  # outside of request only counted
+        db_pool.flush_stats()
+        stats = db_pool.get_shared_stats()
+        self.assertEqual(
+            (stats["requests"], stats["requests_with_checkout"], stats["checkouts"]),
+            (1, 0, 1),
+        )
+
+    def test_async_queries(self):
+        Comment.objects.create(
+            post=self.post, title="Header", nick="Nick", content="Content"
+        )
+        request = RequestFactory().get(f"/{self.post.url_cze}/")
+
+        async def get_validators():
+            try:
+                with override_settings(DB_ASYNC_QUERIES=True):
+                    validators = await aget_post_validators(request, self.post.url_cze)
+                    missing = await aget_post_validators(request, "neexistuje")
+            finally:
+                await db_pool.aclose_async_pool()
+            return validators, missing
+
+        validators, missing = async_to_sync(get_validators)()
+        self.assertEqual(
+            validators,
+            async_to_sync(aget_post_validators)(request, self.post.url_cze),
+        )
+        self.assertIsNone(missing)
+        db_pool.flush_stats()
+        self.assertEqual(db_pool.get_shared_stats()["async_checkouts"], 2)
+
+    @override_settings(SEARCH_RATE_LIMIT=(2, 60 * 60), DB_ASYNC_QUERIES=True)
+    def test_async_rate_limit(self):
+        async def take_tokens() -> list[bool]:
+            try:
+                return [await SEARCH_LIMIT.aallow(ip="10.0.0.1") for _ in range(3)]
+            finally:
+                await db_pool.aclose_async_pool()
+
+        self.assertEqual(async_to_sync(take_tokens)(), [True, True, False])
@@ -0,0 +1,296 @@
+import hmac
+import json
+from hashlib import sha256
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from ipaddress import ip_address, ip_network
+from pathlib import Path
+from subprocess import run
+from tempfile import TemporaryDirectory
+from threading import Thread
+from time import time
+from unittest.mock import patch
+
+from asgiref.sync import async_to_sync
+from django.test import TestCase, override_settings
+from django.utils import timezone
+
+# internal imports
+from jiri_one import github_hooks
+from jiri_one.github_hooks import HookNetworks, PrefixTrie, aget_hook_networks
+from jiri_one.models import DeployJob
+from jiri_one.releases import (
+    DeployError,
+    enqueue_deploy,
+    run_deploy_queue,
+    start_deploy_worker,
+)
+
+HOOKS = ["192.30.252.0/22", "185.199.108.0/22", "2a0a:a440::/29"]
+
+
+def send_hook(
+    client,
+    ip: str,
+    event: str = "ping",
+    key: str = "secret",
+    remote_addr: str = "127.0.0.1",  # the proxy
+    **data,
+):
+    body = json.dumps(data or {"zen": "Keep it logically awesome."})
+    signature = hmac.new(key.encode(), body.encode(), sha256).hexdigest()
+    return client.post(
+        "/deploy_api/",
+        body,
+        content_type="application/json",
+        REMOTE_ADDR=remote_addr,
+        HTTP_X_FORWARDED_FOR=ip,
+        HTTP_X_HUB_SIGNATURE_256=f"sha256={signature}",
+        HTTP_X_GITHUB_EVENT=event,
+    )
+
+
+class MetaHandler(BaseHTTPRequestHandler):
+    """Stand-in for api.github.com/meta with ETag support."""
+
+    etag = '"v1"'
+
+    def do_GET(self):  # noqa: N802
+        self.server.requests += 1
+        if self.headers.get("If-None-Match") == self.etag:
+            self.send_response(304)
+            self.end_headers()
+            return
+        body = json.dumps({"hooks": self.server.hooks}).encode()
+        self.send_response(200)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("ETag", self.etag)
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, *args):
+        pass
+
+
+class GithubHookNetworksTests(TestCase):
+    def setUp(self):
+        self.server = ThreadingHTTPServer(("127.0.0.1", 0), MetaHandler)
+        self.server.requests = 0
+        self.server.hooks = HOOKS
+        Thread(target=self.server.serve_forever, daemon=True).start()
+        self.tmp_dir = TemporaryDirectory()
+        settings_override = override_settings(
+            GITHUB_META_URL=f"http://127.0.0.1:{self.server.server_port}/meta",
+            GITHUB_META_FILE=f"{self.tmp_dir.name}/github_meta.json",
+            SECRET_GITHUB_KEY="secret",
+        )
+        settings_override.enable()
+        self.addCleanup(settings_override.disable)
+        github_hooks._hook_networks = None
+
+    def tearDown(self):
+        self.server.shutdown()
+        self.server.server_close()
+        self.tmp_dir.cleanup()
+        github_hooks._hook_networks = None
+
+    def get_networks(self) -> HookNetworks | None:
+        return async_to_sync(aget_hook_networks)()
+
+    def send_hook(self, ip: str, event: str = "ping", key: str = "secret", **kwargs):
+        return send_hook(self.client, ip, event, key, **kwargs)
+
+    def test_prefix_trie(self):
+        trie = PrefixTrie(ip_network(network) for network in HOOKS)
+        self.assertIn(ip_address("192.30.252.1"), trie)
+        self.assertIn(ip_address("192.30.255.255"), trie)
+        self.assertNotIn(ip_address("192.30.251.255"), trie)
+        self.assertIn(ip_address("2a0a:a440::1"), trie)
+        self.assertNotIn(ip_address("2a0a:a450::1"), trie)
+        self.assertNotIn(ip_address("10.0.0.1"), trie)
+        self.assertIn(ip_address("8.8.8.8"), PrefixTrie([ip_network("0.0.0.0/0")]))
+
+    def test_networks_are_fetched_once_and_persisted(self):
+        self.assertEqual(self.get_networks().networks, HOOKS)
+        self.assertEqual(self.get_networks().networks, HOOKS)
+        self.assertEqual(self.server.requests, 1)
+        github_hooks._hook_networks = None  # restart of process
+        self.assertEqual(self.get_networks().networks, HOOKS)
+        self.assertEqual(self.server.requests, 1)
+
+    def test_stale_networks_are_refreshed_in_background(self):
+        HookNetworks(["10.0.0.0/8"], time() - 60 * 60 * 48, '"v0"').save()
+        with patch("jiri_one.github_hooks.Thread") as thread:
+            networks = self.get_networks()
+        self.assertEqual(networks.networks, ["10.0.0.0/8"])  # webhook doesn't wait
+        thread.assert_called_once_with(
+            target=github_hooks.refresh_hook_networks, daemon=True
+        )
+        github_hooks.refresh_hook_networks()  # the same like background thread
+        self.assertEqual(github_hooks._hook_networks.networks, HOOKS)
+        self.assertTrue(HookNetworks.load().is_fresh())
+        # unchanged ranges (304) only prolong freshness
+        github_hooks._hook_networks.fetched -= 60 * 60 * 48
+        github_hooks._hook_networks.save()
+        github_hooks.refresh_hook_networks()
+        self.assertEqual(github_hooks._hook_networks.networks, HOOKS)
+        self.assertTrue(github_hooks._hook_networks.is_fresh())
+
+    def test_unavailable_meta_endpoint(self):
+        self.server.hooks = None  # broken response
+        self.assertIsNone(self.get_networks())
+        self.assertEqual(self.send_hook("192.30.252.1").status_code, 503)
+
+    def test_webhook_ip_and_signature_are_checked(self):
+        self.assertEqual(self.send_hook("192.30.252.1").content, b"pong")
+        self.assertEqual(self.send_hook("2a0a:a440::1").content, b"pong")
+        self.assertEqual(self.send_hook("10.0.0.1").status_code, 403)
+        self.assertEqual(self.send_hook("192.30.252.1", key="other").status_code, 403)
+        self.assertEqual(self.server.requests, 1)
+
+    def test_spoofed_forwarded_for_is_rejected(self):
+        # the first entry is from the client, the proxy appended the real address
+        self.assertEqual(self.send_hook("192.30.252.1, 10.0.0.1").status_code, 403)
+        self.assertEqual(self.send_hook("10.0.0.1, 192.30.252.1").content, b"pong")
+        # X-Forwarded-For from other than our proxy is not trusted at all
+        response = self.send_hook("192.30.252.1", remote_addr="10.0.0.2")
+        self.assertEqual(response.status_code, 403)
+
+
+def git(repository: Path, *args: str) -> str:
+    return run(
+        ["git", "-c", "user.name=Test", "-c", "user.email=test@jiri.one", *args],
+        cwd=repository,
+        check=True,
+        capture_output=True,
+        text=True,
+    ).stdout.strip()
+
+
+class DeployTests(TestCase):
+    def setUp(self):
+        self.tmp_dir = TemporaryDirectory()
+        self.root = Path(self.tmp_dir.name)
+        self.repository = self.root / "repository"
+        (self.repository / "src").mkdir(parents=True)
+        git(self.repository, "init", "-q")
+        settings_override = override_settings(
+            DEPLOY_ROOT=self.root,
+            DEPLOY_REPOSITORY=self.repository,
+            DEPLOY_REMOTE=".",
+            DEPLOY_SHARED_FILES=["secret_key.txt"],
+            DEPLOY_BUILD_COMMANDS=["cp version.txt built.txt"],
+            # DEPLOY_ROOT/releases/<commit>/src is the working directory
+            DEPLOY_MIGRATE_COMMANDS=["cat version.txt >> ../../../migrated.txt"],
+            DEPLOY_RELOAD_COMMAND="touch reloaded.txt",
+            DEPLOY_POST_RELOAD_COMMANDS=["cat version.txt >> ../../../rendered.txt"],
+            DEPLOY_KEEP_RELEASES=1,
+            SECRET_GITHUB_KEY="secret",
+        )
+        settings_override.enable()
+        self.addCleanup(settings_override.disable)
+        (self.root / "shared").mkdir()
+        (self.root / "shared" / "secret_key.txt").write_text("key")
+
+    def tearDown(self):
+        self.tmp_dir.cleanup()
+        github_hooks._hook_networks = None
+
+    def commit(self, version: str) -> str:
+        (self.repository / "src" / "version.txt").write_text(version)
+        git(self.repository, "add", ".")
+        git(self.repository, "commit", "-q", "-m", version)
+        return git(self.repository, "rev-parse", "HEAD")
+
+    def deploy(self, commit: str) -> DeployJob:
+        enqueue_deploy(commit)
+        (job,) = run_deploy_queue(log=lambda message: None)
+        return job
+
+    def current_version(self) -> str:
+        return (self.root / "current" / "src" / "built.txt").read_text()
+
+    def test_release_is_built_and_switched(self):
+        first, second = self.commit("1"), self.commit("2")
+        job = self.deploy(first)
+        self.assertEqual(job.status, DeployJob.Status.SUCCEEDED)
+        self.assertEqual(self.current_version(), "1")
+        self.assertEqual((self.root / "current" / "secret_key.txt").read_text(), "key")
+        self.assertTrue((self.root / "reloaded.txt").exists())
+        # database is migrated after the build, right before the switch
+        self.assertLess(
+            job.log.index("cp version.txt built.txt"), job.log.index("migrated.txt")
+        )
+        self.assertLess(job.log.index("migrated.txt"), job.log.index("is current."))
+        self.assertLess(job.log.index("reloaded.txt"), job.log.index("rendered.txt"))
+        self.assertEqual(self.deploy(second).status, DeployJob.Status.SUCCEEDED)
+        self.assertEqual(self.current_version(), "2")
+        # only one release is kept (and the current one is never deleted)
+        self.assertEqual(
+            [path.name for path in (self.root / "releases").iterdir()], [second]
+        )
+
+    def test_failed_build_keeps_current_release(self):
+        first = self.commit("1")
+        self.deploy(first)
+        (self.repository / "src" / "version.txt").rename(
+            self.repository / "src" / "other.txt"
+        )
+        git(self.repository, "add", "-A")
+        git(self.repository, "commit", "-q", "-m", "broken")
+        broken = git(self.repository, "rev-parse", "HEAD")
+        job = self.deploy(broken)
+        self.assertEqual(job.status, DeployJob.Status.FAILED)
+        self.assertIn("cp version.txt built.txt", job.log)
+        self.assertEqual(self.current_version(), "1")
+        # the shared database was not migrated by the failed build
+        self.assertEqual((self.root / "migrated.txt").read_text(), "1")
+
+    def test_deploy_requests_are_coalesced(self):
+        first, second, third = self.commit("1"), self.commit("2"), self.commit("3")
+        job = enqueue_deploy(first)
+        self.assertEqual(enqueue_deploy(second).pk, job.pk)
+        job = enqueue_deploy(third)
+        self.assertEqual((job.commit, job.requests), (third, 3))
+        jobs = run_deploy_queue(log=lambda message: None)
+        self.assertEqual([job.commit for job in jobs], [third])
+        self.assertEqual(self.current_version(), "3")
+        with self.assertRaises(DeployError):
+            enqueue_deploy("master; rm -rf /")
+
+    def test_interrupted_job_is_failed(self):
+        first, second = self.commit("1"), self.commit("2")
+        # its worker was killed during the deploy (it doesn't hold the lock)
+        interrupted = DeployJob.objects.create(
+            commit=first, status=DeployJob.Status.RUNNING, started=timezone.now()
+        )
+        self.assertEqual(self.deploy(second).status, DeployJob.Status.SUCCEEDED)
+        interrupted.refresh_from_db()
+        self.assertEqual(interrupted.status, DeployJob.Status.FAILED)
+        self.assertIsNotNone(interrupted.finished)
+        self.assertIn("was interrupted", interrupted.log)
+
+    def test_deploy_worker_is_reaped(self):
+        with (
+            patch("jiri_one.releases.Popen") as popen,
+            patch("jiri_one.releases.Thread") as thread,
+        ):
+            start_deploy_worker()
+        thread.assert_called_once_with(target=popen.return_value.wait, daemon=True)
+        thread.return_value.start.assert_called_once_with()
+
+    def test_webhook_queues_job_with_status(self):
+        github_hooks._hook_networks = HookNetworks(["192.30.252.0/22"], time())
+        commit = self.commit("1")
+        with patch("jiri_one.views.start_deploy_worker") as start_worker:
+            response = send_hook(
+                self.client, "192.30.252.1", "push", ref="refs/tags/v1", after=commit
+            )
+        start_worker.assert_called_once()
+        self.assertEqual(response.status_code, 202)
+        data = response.json()
+        self.assertEqual((data["commit"], data["status"]), (commit, "queued"))
+        run_deploy_queue(log=lambda message: None)
+        status = self.client.get(data["status_url"]).json()
+        self.assertEqual(status["status"], "succeeded")
+        self.assertIsNotNone(status["finished"])
+        self.assertEqual(self.client.get("/deploy_api/jobs/999999/").status_code, 404)
@@ -1,3 +1,4 @@
+import json
 import logging
 import random
 import string
@@ -8,13 +9,19 @@ from typing import Any
 import pytest
 from django.conf import settings
 from django.core.cache import cache
+from django.db import connection
 from django.db.models import Count, QuerySet
+from django.test.utils import CaptureQueriesContext
 from graphene_django.utils.testing import graphql_query
+from graphql import get_introspection_query
 
 # internal imports
 from test_views import create_post
 
+from jiri_one.graphql_cache import get_stats
+from jiri_one.graphql_view import AsyncGraphQLView, get_validated_document
 from jiri_one.models import Comment, Post, Tag
+from jiri_one.persisted_queries import get_allow_list, query_hash
 from jiri_one.schema import get_expected_signature as get_signature
 
 
@@ -362,7 +369,9 @@ def test_add_comment_with_graphql(
 ):
     # Use the first post from the fixture
     posts, _ = create_random_posts
-    first_post = posts.last()  # first like with id 1, like the oldest
+    first_post = posts.last()  # first like the oldest
+    cmd.post_id = first_post.id
+    cmd.refresh_signature()
     comment_count = first_post.comments_count
     assert Comment.objects.filter(post=first_post).count() == comment_count
 
@@ -489,7 +498,9 @@ def test_add_comment_with_graphql_many_comments_error(
     caplog,
 ):
     posts, _ = create_random_posts
-    first_post = posts.last()  # first like with id 1, like the oldest
+    first_post = posts.last()  # first like the oldest
+    cmd.post_id = first_post.id
+    cmd.refresh_signature()
     comment_count = first_post.comments_count
 
     for i in range(1, 14):
@@ -521,3 +532,448 @@ def test_add_comment_with_graphql_many_comments_error(
                     f"Comment created successfully for Post ID {cmd.post_id} by {cmd.nick}."
                     in caplog.text
                 )
+
+
+@pytest.mark.django_db
+def test_search_posts_fulltext_ranking_and_snippet(client_query):
+    in_content = create_post("Nějaký titulek", "<p>Dnes píšu o jazyku Python.</p>")
+    in_title = create_post("Python a Django", "<p>Nic dalšího tu není.</p>")
+    create_post("Jiný příspěvek", "<p>Tady nic.</p>")
+
+    response_content = client_query(
+        """
+        query postsBySearch($text: String!) {
+            postsBySearch(text: $text) {
+                id
+                searchSnippet
+            }
+        }
+        """,
+        variables={"text": "python"},
+    ).json()
+
+    assert response_content is not None and "data" in response_content
+    graphql_posts = response_content["data"]["postsBySearch"]
+    # match in title is weighted above match in content
+    assert [post["id"] for post in graphql_posts] == [in_title.id, in_content.id]
+    assert graphql_posts[1]["searchSnippet"] == "Dnes píšu o jazyku <mark>Python</mark>"
+
+
+@pytest.mark.django_db
+def test_all_tags_posts_count_graphql_query(client_query, create_random_posts):
+    _, tags = create_random_posts
+    expected = {tag.url_cze: Post.objects.filter(tags=tag).count() for tag in tags}
+    response_content = client_query(
+        """
+        query AllTags {
+            allTags {
+                urlCze
+                postsCount
+            }
+        }
+        """
+    ).json()
+
+    assert response_content is not None and "data" in response_content
+    graphql_tags = response_content["data"]["allTags"]
+    assert {tag["urlCze"]: tag["postsCount"] for tag in graphql_tags} == expected
+
+
+@pytest.mark.django_db
+@pytest.mark.parametrize("nr_of_posts", [1, 3, 10])
+@pytest.mark.parametrize(
+    "query_name, variables",
+    [
+        ("allPosts", ""),
+        ("postsBySearch", '(text: "content")'),
+        ("postsByTagsUrl", '(tagUrls: ["tag-1", "tag-2"])'),
+    ],
+)
+def test_posts_graphql_query_count(
+    client_query, django_assert_num_queries, nr_of_posts, query_name, variables
+):
+    tags = [
+        Tag.objects.create(name_cze=f"Tag {nr}", desc_cze="Desc", order=nr)
+        for nr in range(1, 4)
+    ]
+    for nr in range(nr_of_posts):
+        post = create_post(f"Post {nr}", "Some content")
+        post.tags.add(*tags)
+        for _ in range(nr):
+            create_random_comment(post)
+    query = f"""
+    query {{
+        {query_name}{variables} {{
+            id
+            titleCze
+            commentsCount
+            tags {{
+                nameCze
+                urlCze
+            }}
+        }}
+    }}
+    """
+    # tag registry is built in first query (other one, the same would be cached)
+    client_query("query { allTags { nameCze } }")
+
+    # posts (with comments counts) and tags (one query for each, whatever nr of posts)
+    # full-text exists() and rate limit of search
+    extra_queries = 2 if query_name == "postsBySearch" else 0
+    with django_assert_num_queries(2 + extra_queries):
+        response_content = client_query(query).json()
+
+    graphql_posts = response_content["data"][query_name]
+    assert len(graphql_posts) == nr_of_posts
+    for graphql_post in graphql_posts:
+        assert [tag["nameCze"] for tag in graphql_post["tags"]] == [
+            tag.name_cze for tag in tags
+        ]
+    assert sorted(post["commentsCount"] for post in graphql_posts) == list(
+        range(nr_of_posts)
+    )
+
+
+def test_graphql_view_is_async():
+    assert AsyncGraphQLView.view_is_async
+
+
+@pytest.mark.django_db
+def test_more_root_fields_in_one_query(client_query, create_random_posts):
+    posts, tags = create_random_posts
+    response_content = client_query(
+        """
+        query ($id: Int!) {
+            allPosts { id commentsCount }
+            allTags { urlCze }
+            postById(id: $id) { titleCze tags { urlCze } }
+        }
+        """,
+        variables={"id": posts.last().id},
+    ).json()
+
+    assert "errors" not in response_content
+    data = response_content["data"]
+    assert len(data["allPosts"]) == posts.count()
+    assert [tag["urlCze"] for tag in data["allTags"]] == [tag.url_cze for tag in tags]
+    assert data["postById"]["titleCze"] == posts.last().title_cze
+
+
+@pytest.mark.django_db
+def test_graphql_get_request(client, create_random_posts):
+    response = client.get("/graphql", {"query": "{ allTags { urlCze } }"})
+    assert response.status_code == 200
+    assert len(response.json()["data"]["allTags"]) == 10
+
+    # GraphiQL is still rendered for browsers
+    response = client.get("/graphql", HTTP_ACCEPT="text/html")
+    assert response.status_code == 200
+    assert b"graphiql" in response.content.lower()
+
+
+@pytest.mark.django_db
+def test_graphql_mutation_is_not_allowed_with_get(client, cmd):
+    response = client.get(
+        "/graphql", {"query": "mutation { createComment { success } }"}
+    )
+    assert response.status_code == 405
+
+
+ALL_TAGS_QUERY = "query AllTags { allTags { urlCze } }"
+
+
+def persisted_query_extensions(query: str) -> str:
+    return json.dumps(
+        {"persistedQuery": {"version": 1, "sha256Hash": query_hash(query)}}
+    )
+
+
+@pytest.fixture
+def allow_list(monkeypatch, tmp_path):
+    """Allow list file with ALL_TAGS_QUERY."""
+    path = tmp_path / "persisted_queries.json"
+    path.write_text(json.dumps({query_hash(ALL_TAGS_QUERY): ALL_TAGS_QUERY}))
+    monkeypatch.setattr(settings, "GRAPHQL_PERSISTED_QUERIES_FILE", path)
+    get_allow_list.cache_clear()
+    yield path
+    get_allow_list.cache_clear()
+
+
+@pytest.mark.django_db
+def test_persisted_query_is_registered_and_cacheable(client, create_random_tags):
+    extensions = persisted_query_extensions(ALL_TAGS_QUERY)
+    # unknown hash, client has to send the query too
+    response = client.get("/graphql", {"extensions": extensions})
+    assert response.status_code == 200
+    assert response.json()["errors"][0]["extensions"]["code"] == (
+        "PERSISTED_QUERY_NOT_FOUND"
+    )
+
+    response = client.post(
+        "/graphql",
+        {"query": ALL_TAGS_QUERY, "extensions": json.loads(extensions)},
+        content_type="application/json",
+    )
+    assert len(response.json()["data"]["allTags"]) == 10
+
+    # now the hash is enough and GET response can be cached by HTTP cache
+    response = client.get("/graphql", {"extensions": extensions})
+    assert len(response.json()["data"]["allTags"]) == 10
+    assert "public" in response["Cache-Control"]
+    assert f"max-age={settings.GRAPHQL_GET_MAX_AGE}" in response["Cache-Control"]
+
+
+@pytest.mark.django_db
+def test_persisted_query_with_wrong_hash(client):
+    response = client.get(
+        "/graphql",
+        {
+            "query": "{ allTags { nameCze } }",
+            "extensions": persisted_query_extensions(ALL_TAGS_QUERY),
+        },
+    )
+    assert response.status_code == 400
+    assert response.json()["errors"][0]["extensions"]["code"] == "INVALID_SHA256_HASH"
+
+
+@pytest.mark.django_db
+def test_allow_list_only(client, monkeypatch, allow_list, create_random_tags):
+    monkeypatch.setattr(settings, "GRAPHQL_ALLOW_LIST_ONLY", True)
+    response = client.get(
+        "/graphql", {"extensions": persisted_query_extensions(ALL_TAGS_QUERY)}
+    )
+    assert len(response.json()["data"]["allTags"]) == 10
+
+    response = client.get("/graphql", {"query": ALL_TAGS_QUERY})
+    assert len(response.json()["data"]["allTags"]) == 10
+
+    for query in ["{ allTags { nameCze } }", "{ allPosts { id } }"]:
+        response = client.get("/graphql", {"query": query})
+        assert response.status_code == 400
+        assert response.json()["errors"][0]["extensions"]["code"] == (
+            "QUERY_NOT_ALLOWED"
+        )
+        response = client.get(
+            "/graphql",
+            {"query": query, "extensions": persisted_query_extensions(query)},
+        )
+        assert response.json()["errors"][0]["extensions"]["code"] == (
+            "QUERY_NOT_ALLOWED"
+        )
+
+
+@pytest.mark.django_db
+def test_parsed_documents_are_cached(client_query):
+    query = "query CachedDocument { allTags { nameCze } }"
+    client_query(query)
+    hits = get_validated_document.cache_info().hits
+    client_query(query)
+    assert get_validated_document.cache_info().hits == hits + 1
+
+
+POST_BY_ID_QUERY = """
+    query PostById($id: Int!) {
+        postById(id: $id) { titleCze commentsCount tags { nameCze } }
+    }
+"""
+
+
+@pytest.mark.django_db
+def test_query_response_is_cached(
+    client_query, create_random_posts, django_assert_num_queries
+):
+    query = "query AllPosts { allPosts { titleCze commentsCount tags { nameCze } } }"
+    response = client_query(query)
+    assert response["X-GraphQL-Cache"] == "MISS"
+    with django_assert_num_queries(0):
+        cached_response = client_query(
+            "query AllPosts {\n  allPosts {titleCze, commentsCount, tags {nameCze}}\n}"
+        )
+    assert cached_response["X-GraphQL-Cache"] == "HIT"
+    assert cached_response.json() == response.json()
+    assert get_stats() == {"hits": 1, "misses": 1, "hit_ratio": 0.5}
+
+    # new post changes the list
+    create_post("New post", "New content")
+    response = client_query(query)
+    assert response["X-GraphQL-Cache"] == "MISS"
+    assert response.json()["data"]["allPosts"][0]["titleCze"] == "New post"
+
+
+@pytest.mark.django_db
+def test_cached_response_is_invalidated_only_by_its_objects(
+    client_query, create_random_posts
+):
+    posts, tags = create_random_posts
+    post = posts.last()
+    # the fixture can create only one post, so the other one is created here
+    other_post = create_post("Other post", "Other content")
+    variables = {"id": post.id}
+
+    def query_post():
+        return client_query(POST_BY_ID_QUERY, variables=variables)
+
+    assert query_post()["X-GraphQL-Cache"] == "MISS"
+    other_post.title_cze = "Other title"
+    other_post.save()
+    create_random_comment(other_post)
+    assert query_post()["X-GraphQL-Cache"] == "HIT"
+
+    create_random_comment(post)
+    response = query_post()
+    assert response["X-GraphQL-Cache"] == "MISS"
+    assert response.json()["data"]["postById"]["commentsCount"] == (
+        post.comments.count()
+    )
+
+    tag = post.tags.first()
+    tag.name_cze = "Renamed"
+    tag.save()
+    response = query_post()
+    assert response["X-GraphQL-Cache"] == "MISS"
+    assert "Renamed" in [
+        tag["nameCze"] for tag in response.json()["data"]["postById"]["tags"]
+    ]
+
+    post.tags.clear()
+    response = query_post()
+    assert response["X-GraphQL-Cache"] == "MISS"
+    assert response.json()["data"]["postById"]["tags"] == []
+
+    post.title_cze = "New title"
+    post.save()
+    response = query_post()
+    assert response["X-GraphQL-Cache"] == "MISS"
+    assert response.json()["data"]["postById"]["titleCze"] == "New title"
+
+
+@pytest.mark.django_db
+def test_all_tags_response_is_invalidated_by_posts_count(
+    client_query, create_random_tags
+):
+    query = "query AllTags { allTags { nameCze postsCount } }"
+    client_query(query)
+    post = create_post("Tagged post", "Content")
+    post.tags.add(create_random_tags.first())
+    response = client_query(query)
+    assert response["X-GraphQL-Cache"] == "MISS"
+    assert response.json()["data"]["allTags"][0]["postsCount"] == 1
+
+
+@pytest.mark.django_db
+def test_missing_post_response_is_invalidated_by_new_post(client_query):
+    variables = {"id": Post.get_next_id()}  # the id is allocated here
+    response = client_query(POST_BY_ID_QUERY, variables=variables)
+    assert response.json()["data"]["postById"] is None
+    post = create_post("New post", "Content")
+    Post.objects.filter(pk=post.pk).update(id=variables["id"])  # no signals
+    response = client_query(POST_BY_ID_QUERY, variables=variables)
+    assert response.json()["data"]["postById"]["titleCze"] == "New post"
+
+
+@pytest.mark.django_db
+def test_mutation_response_is_not_cached(client_query, cmd, create_random_posts):
+    posts, _ = create_random_posts
+    cmd.post_id = posts.first().id
+    cmd.refresh_signature()
+    comments_count = Comment.objects.count()
+    for _ in range(2):
+        response = client_query(
+            cmd.query_text, operation_name="CreateComment", variables=asdict(cmd)
+        )
+        assert response.json()["data"]["createComment"]["success"]
+        assert "X-GraphQL-Cache" not in response
+    assert Comment.objects.count() == comments_count + 2
+    # denormalised count is increased by mutation too
+    post = Post.objects.get(id=cmd.post_id)
+    assert post.comment_count == post.comments.count()
+
+
+EXPENSIVE_POSTS_QUERY = """
+    fragment PostFields on PostType { titleCze commentsCount tags { nameCze } }
+    query ManyPages { %s }
+"""
+
+
+@pytest.mark.django_db
+def test_too_expensive_query_is_rejected(client_query, django_assert_num_queries):
+    # one page of posts costs 1 + 10 * (commentsCount 1 + tags 1) = 21
+    pages = " ".join(
+        f"page{nr}: allPosts(page: {nr}) {{ ...PostFields }}" for nr in range(1, 24)
+    )
+    response = client_query(EXPENSIVE_POSTS_QUERY % pages)
+    assert response.status_code == 200
+    with django_assert_num_queries(0):
+        pages += " page24: allPosts(page: 24) { ...PostFields }"
+        response = client_query(EXPENSIVE_POSTS_QUERY % pages)
+    assert response.status_code == 400
+    error = response.json()["errors"][0]
+    assert error["extensions"] == {
+        "code": "QUERY_TOO_EXPENSIVE",
+        "cost": 504,
+        "maxCost": settings.GRAPHQL_MAX_COST,
+    }
+    assert "too expensive" in error["message"]
+
+
+@pytest.mark.django_db
+def test_too_deep_query_is_rejected(client_query, monkeypatch):
+    monkeypatch.setattr(settings, "GRAPHQL_MAX_DEPTH", 2)
+    get_validated_document.cache_clear()  # limits are checked only for new documents
+    response = client_query("query DeepQuery { allPosts { tags { nameCze } } }")
+    get_validated_document.cache_clear()
+    assert response.status_code == 400
+    assert response.json()["errors"][0]["extensions"] == {
+        "code": "QUERY_TOO_DEEP",
+        "depth": 3,
+        "maxDepth": 2,
+    }
+
+
+@pytest.mark.django_db
+def test_introspection_query_is_not_limited(client_query):
+    response = client_query(get_introspection_query())
+    assert response.status_code == 200
+    assert "errors" not in response.json()
+
+
+@pytest.mark.django_db
+def test_graphql_get_request_not_modified(client, create_random_tags):
+    query = {"query": "query AllTags { allTags { nameCze } }"}
+    response = client.get("/graphql", query)
+    etag = response["ETag"]
+    assert response["Last-Modified"]
+    response = client.get("/graphql", query, headers={"if-none-match": etag})
+    assert response.status_code == 304
+    assert response["ETag"] == etag
+
+    tag = create_random_tags.first()
+    tag.name_cze = "Renamed"
+    tag.save()
+    response = client.get("/graphql", query, headers={"if-none-match": etag})
+    assert response.status_code == 200
+    assert response.json()["data"]["allTags"][0]["nameCze"] == "Renamed"
+    # POST requests are not conditional
+    response = client.post(
+        "/graphql",
+        query,
+        content_type="application/json",
+        headers={"if-none-match": etag},
+    )
+    assert "ETag" not in response
+
+
+@pytest.mark.django_db
+def test_posts_list_loads_content_only_if_requested(client_query):
+    post = create_post("Post", "<p>" + "word " * 200 + "</p>")
+    queries_query = "query AllPosts { allPosts { excerptCze hasMoreCze } }"
+    with CaptureQueriesContext(connection) as queries:
+        response = client_query(queries_query)
+    graphql_post = response.json()["data"]["allPosts"][0]
+    assert graphql_post == {"excerptCze": post.excerpt_cze, "hasMoreCze": True}
+    assert not any("content_cze" in query["sql"] for query in queries)
+
+    response = client_query(
+        "fragment Content on PostType { contentCze } query { allPosts { ...Content } }"
+    )
+    assert response.json()["data"]["allPosts"][0]["contentCze"] == post.content_cze
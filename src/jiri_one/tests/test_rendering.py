@@ -0,0 +1,150 @@
+from io import StringIO
+from unittest import mock
+
+from django.core.cache import cache
+from django.core.management import call_command
+from django.db import connection
+from django.db.migrations.executor import MigrationExecutor
+from django.test import TestCase, TransactionTestCase, override_settings
+
+# internal imports
+from jiri_one import rendering
+from jiri_one.excerpts import make_excerpt
+from jiri_one.models import Post
+from jiri_one.rendering import (
+    lazy_load_media,
+    markdown_to_html,
+    minify_whitespace,
+    render_post,
+    rewrite_links,
+)
+from jiri_one.tests.test_views import create_post
+
+CONTENT = (
+    '<p>Odkaz  na <a href="https://jiri.one/clanek/?a=1#b">článek</a>\n'
+    'a <a href="https://example.com/x">jinam</a>.</p>\n\n'
+    '<img src="../soubory/obrazek.png" alt="x">\n'
+    "<pre>  kód\n    odsazený</pre>"
+)
+
+
+class RenderingStagesTests(TestCase):
+    def test_rewrite_links(self):
+        content = rewrite_links(CONTENT)
+        self.assertIn('href="/clanek/?a=1#b"', content)
+        self.assertIn('href="https://example.com/x"', content)
+        self.assertIn('src="/files/obrazek.png"', content)
+        # content without old and own URLs is not parsed (and not reformatted)
+        self.assertEqual(rewrite_links("<p>a<br/></p>"), "<p>a<br/></p>")
+
+    def test_lazy_load_media(self):
+        content = lazy_load_media('<img src="/files/a.png" alt="a"><p>b</p>')
+        self.assertIn('loading="lazy"', content)
+        self.assertIn('decoding="async"', content)
+        self.assertEqual(lazy_load_media("<p>b</p>"), "<p>b</p>")
+
+    def test_image_size_hints(self):
+        with (
+            mock.patch.object(rendering, "PIL", object()),
+            mock.patch.object(
+                rendering, "get_image_dimensions", return_value=(640, 480)
+            ) as dimensions,
+        ):
+            content = lazy_load_media(
+                '<img src="/files/a.png"><img src="https://example.com/b.png">'
+            )
+        self.assertIn(
+            'height="480" loading="lazy" src="/files/a.png" width="640"', content
+        )
+        dimensions.assert_called_once()  # only local images are measured
+
+    def test_minify_whitespace(self):
+        self.assertEqual(
+            minify_whitespace(
+                " <p>a \n\t b</p>\n<pre>  x\n  y</pre>  <PRE>z  z</PRE> "
+            ),
+            "<p>a b</p> <pre>  x\n  y</pre> <PRE>z  z</PRE>",
+        )
+
+    def test_markdown_is_sanitized(self):
+        content = markdown_to_html("# Nadpis\n\n*text* <script>x</script>")
+        self.assertIn("<h1>Nadpis</h1>", content)
+        self.assertIn("<em>text</em>", content)
+        self.assertNotIn("<script>", content)
+
+
+class PostRenderingTests(TestCase):
+    def setUp(self):
+        cache.clear()
+
+    def test_post_is_rendered_on_save(self):
+        post = create_post("Vykreslený příspěvek", CONTENT)
+        post.refresh_from_db()
+        self.assertIn('href="/clanek/?a=1#b"', post.rendered_html_cze)
+        self.assertIn('loading="lazy"', post.rendered_html_cze)
+        self.assertNotIn("\n\n", post.rendered_html_cze)
+        self.assertIn('loading="lazy"', post.excerpt_cze)
+        self.assertIsNone(post.rendered_html_eng)
+        response = self.client.get(f"/{post.url_cze}/")
+        self.assertContains(response, 'href="/clanek/?a=1#b"')
+
+    def test_unchanged_content_is_not_rendered_again(self):
+        post = create_post("Vykreslený příspěvek", CONTENT)
+        with mock.patch.object(
+            rendering, "render_content", wraps=rendering.render_content
+        ) as render_content:
+            post.title_cze = "Nový titulek"
+            post.save()
+            post.save(update_fields=["content_cze"])
+            self.assertEqual(render_content.call_count, 0)
+            post.content_cze = "<p>Nový obsah</p>"
+            post.save(update_fields=["content_cze"])
+            self.assertEqual(render_content.call_count, 1)
+        post.refresh_from_db()
+        self.assertEqual(post.rendered_html_cze, "<p>Nový obsah</p>")
+        self.assertEqual(post.excerpt_cze, "<p>Nový obsah</p>")
+
+    def test_render_posts_after_change_of_stages(self):
+        post = create_post("Vykreslený příspěvek", CONTENT)
+        self.assertIn("Successfully rendered 0 posts", self.render_posts())
+        stages = ["jiri_one.rendering.minify_whitespace"]
+        with override_settings(CONTENT_RENDER_STAGES=stages):
+            self.assertIn("Successfully rendered 1 posts", self.render_posts())
+        post = Post.objects.get(pk=post.pk)
+        self.assertIn('href="https://jiri.one/clanek/?a=1#b"', post.rendered_html_cze)
+        # back to default stages
+        self.assertIn("Successfully rendered 1 posts", self.render_posts())
+
+    @staticmethod
+    def render_posts() -> str:
+        stdout = StringIO()
+        call_command("render_posts", stdout=stdout)
+        return stdout.getvalue()
+
+
+class RenderingMigrationTests(TransactionTestCase):
+    def test_existing_posts_are_rendered(self):
+        call_command("migrate", "jiri_one", "0009", verbosity=0)
+        try:
+            apps = (
+                MigrationExecutor(connection)
+                .loader.project_state(("jiri_one", "0009_deployjob"))
+                .apps
+            )
+            author = apps.get_model("jiri_one", "Author").objects.create(
+                nick="Test", first_name="Test", last_name="Test"
+            )
+            apps.get_model("jiri_one", "Post").objects.create(
+                title_cze="Starý příspěvek",
+                url_cze="stary-prispevek",
+                content_cze=CONTENT,
+                author=author,
+            )
+        finally:
+            call_command("migrate", "jiri_one", verbosity=0)
+        post = Post.objects.get(url_cze="stary-prispevek")
+        self.assertIn('href="/clanek/?a=1#b"', post.rendered_html_cze)
+        self.assertEqual(
+            (post.excerpt_cze, post.has_more_cze), make_excerpt(post.rendered_html_cze)
+        )
+        self.assertEqual(render_post(post), [])  # render_posts has nothing to do
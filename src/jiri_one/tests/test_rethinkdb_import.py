@@ -0,0 +1,139 @@
+from django.core.cache import cache
+from django.db import connection
+from django.test import TestCase
+from django.test.utils import CaptureQueriesContext
+
+# internal imports
+from jiri_one.models import Post, Tag
+from jiri_one.rethinkdb_import import RethinkDBImporter
+
+TOPICS = [
+    {"topic": {"cze": "Linux"}, "description": {"cze": "Tučňák"}, "order": 1},
+    {"topic": {"cze": "Python"}, "description": {"cze": "Had"}, "order": 2},
+]
+
+
+def rdb_post(nr: int, topics: str = "Linux;Python;", when: str = "") -> dict:
+    return {
+        "header": {"cze": f"Příspěvek {nr}"},
+        "content": {"cze": f"<p>Obsah příspěvku {nr}</p><script>alert(1)</script>"},
+        "topics": {"cze": topics},
+        "when": when or f"2015-01-{nr:02d} 10:00:00",
+    }
+
+
+class FakeCursor:
+    """RethinkDB cursor stand-in, it counts read documents."""
+
+    def __init__(self, documents: list[dict]):
+        self.documents = documents
+        self.read = 0
+
+    def __iter__(self):
+        for document in self.documents:
+            self.read += 1
+            yield document
+
+
+class RethinkDBImportTests(TestCase):
+    def setUp(self):
+        cache.clear()
+
+    def run_import(self, documents: list[dict], batch_size: int = 500):
+        return RethinkDBImporter(TOPICS, batch_size=batch_size).run(
+            FakeCursor(documents)
+        )
+
+    def test_posts_and_tags_are_imported(self):
+        stats = self.run_import([rdb_post(nr) for nr in range(1, 8)], batch_size=3)
+        self.assertEqual((stats.posts_created, stats.posts_updated), (7, 0))
+        self.assertEqual((stats.tags_created, stats.batches), (2, 3))
+        self.assertEqual(stats.watermark, "2015-01-07 10:00:00")
+        post = Post.objects.get(title_cze="Příspěvek 3")
+        self.assertEqual(post.url_cze, "prispevek-3")
+        self.assertNotIn("<script>", post.content_cze)  # sanitized like in save()
+        self.assertEqual(post.excerpt_cze, post.content_cze)
+        self.assertEqual(
+            set(post.tags.values_list("url_cze", flat=True)), {"linux", "python"}
+        )
+        self.assertTrue(Post.objects.filter(search_vector="obsah").exists())
+        self.assertEqual(Tag.objects.get(name_cze="Python").desc_cze, "Had")
+
+    def test_reimport_updates_posts(self):
+        self.run_import([rdb_post(1), rdb_post(2, topics="Linux;")])
+        ids = set(Post.objects.values_list("id", flat=True))
+        changed = rdb_post(2, topics="Python;")
+        changed["content"]["cze"] = "<p>Nový obsah</p>"
+        stats = self.run_import([changed, rdb_post(3)])
+        self.assertEqual((stats.posts_created, stats.posts_updated), (1, 1))
+        post = Post.objects.get(title_cze="Příspěvek 2")
+        self.assertIn(post.id, ids)
+        self.assertEqual(post.content_cze, "<p>Nový obsah</p>")
+        self.assertEqual(post.tags.count(), 2)  # tags are only added
+        self.assertEqual(Post.objects.count(), 3)
+
+    def test_reimport_from_watermark(self):
+        when = "2015-01-05 10:00:00"
+        stats = self.run_import([rdb_post(1), rdb_post(2, when=when)])
+        # --since filters `when` >= watermark, post 3 was published in the same second
+        stats = self.run_import(
+            [rdb_post(2, when=stats.watermark), rdb_post(3, when=when)]
+        )
+        self.assertEqual((stats.posts_created, stats.posts_unchanged), (1, 1))
+        self.assertEqual(stats.watermark, when)
+        self.assertEqual(Post.objects.count(), 3)
+
+    def test_unchanged_posts_are_not_written(self):
+        self.run_import([rdb_post(1), rdb_post(2, topics="Linux;")])
+        mod_times = dict(Post.objects.values_list("title_cze", "mod_time"))
+        stats = self.run_import([rdb_post(1), rdb_post(2, topics="Linux;")])
+        self.assertEqual(
+            (stats.posts_created, stats.posts_updated, stats.posts_unchanged),
+            (0, 0, 2),
+        )
+        self.assertEqual(stats.tags_created, 0)
+        self.assertEqual(
+            dict(Post.objects.values_list("title_cze", "mod_time")), mod_times
+        )
+        # new topic is a change
+        stats = self.run_import([rdb_post(1), rdb_post(2)])
+        self.assertEqual((stats.posts_updated, stats.posts_unchanged), (1, 1))
+        self.assertEqual(Post.objects.get(title_cze="Příspěvek 2").tags.count(), 2)
+
+    def test_only_inserted_tags_are_counted(self):
+        Tag.objects.create(name_cze="LINUX", desc_cze="Jiný", order=3)  # url linux
+        stats = self.run_import([rdb_post(1)])
+        self.assertEqual(stats.tags_created, 1)
+        self.assertEqual(
+            list(Post.objects.get().tags.values_list("name_cze", flat=True)), ["Python"]
+        )
+
+    def test_queries_dont_depend_on_nr_of_posts(self):
+        self.run_import([rdb_post(1)])  # author and tags exist now
+        with CaptureQueriesContext(connection) as few:
+            self.run_import([rdb_post(nr) for nr in range(2, 4)])
+        with CaptureQueriesContext(connection) as many:
+            self.run_import([rdb_post(nr) for nr in range(4, 30)])
+        self.assertEqual(len(few), len(many))
+
+    def test_posts_are_streamed(self):
+        cursor = FakeCursor([rdb_post(nr) for nr in range(1, 6)])
+        importer = RethinkDBImporter(TOPICS, batch_size=2)
+        original_import_batch = importer.import_batch
+        read_before_batch = []
+
+        def import_batch(documents):
+            read_before_batch.append(cursor.read)
+            return original_import_batch(documents)
+
+        importer.import_batch = import_batch
+        importer.run(cursor)
+        self.assertEqual(read_before_batch, [2, 4, 5])
+
+    def test_unknown_topic_is_skipped(self):
+        with self.assertLogs("jiri_one", "WARNING"):
+            stats = self.run_import([rdb_post(1, topics="Linux;Neznámé;")])
+        self.assertEqual(stats.tags_created, 1)
+        self.assertEqual(
+            list(Post.objects.get().tags.values_list("name_cze", flat=True)), ["Linux"]
+        )
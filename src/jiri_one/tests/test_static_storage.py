@@ -0,0 +1,110 @@
+import gzip
+import json
+import tempfile
+from io import StringIO
+from pathlib import Path
+from unittest import mock
+
+import brotli
+from django.conf import settings
+from django.core.management import call_command
+from django.test import TestCase, override_settings
+
+# internal imports
+from jiri_one import static_storage
+from jiri_one.static_storage import get_hashed_names, read_cached_css
+
+STORAGE = "jiri_one.static_storage.PrecompressedManifestStaticFilesStorage"
+CSS = "body { background: url('../img/dot.svg'); }\n" + "p { margin: 0; }\n" * 100
+
+
+class StaticStorageTests(TestCase):
+    def setUp(self):
+        tmp_dir = tempfile.TemporaryDirectory()
+        self.addCleanup(tmp_dir.cleanup)
+        self.source = Path(tmp_dir.name) / "source"
+        self.root = Path(tmp_dir.name) / "root"
+        (self.source / "css").mkdir(parents=True)
+        (self.source / "img").mkdir()
+        (self.source / "css" / "extra.css").write_text(CSS)
+        (self.source / "img" / "dot.svg").write_text("<svg></svg>")
+        settings_override = override_settings(
+            STATIC_ROOT=self.root,
+            STATICFILES_DIRS=[self.source, settings.BASE_DIR / "src/jiri_one/static"],
+            STATICFILES_FINDERS=["django.contrib.staticfiles.finders.FileSystemFinder"],
+            STORAGES={
+                **settings.STORAGES,
+                "staticfiles": {"BACKEND": STORAGE},
+            },
+        )
+        settings_override.enable()
+        self.addCleanup(settings_override.disable)
+        for cached in (get_hashed_names, read_cached_css):
+            cached.cache_clear()
+            self.addCleanup(cached.cache_clear)
+
+    def collectstatic(self) -> list[str]:
+        call_command("collectstatic", interactive=False, verbosity=0, stdout=StringIO())
+        return json.loads((self.root / "staticfiles.json").read_text())["paths"]
+
+    def test_hashed_files_have_compressed_siblings(self):
+        paths = self.collectstatic()
+        hashed = self.root / paths["css/extra.css"]
+        self.assertNotEqual(paths["css/extra.css"], "css/extra.css")
+        # url() points to hashed file
+        self.assertIn(paths["img/dot.svg"].removeprefix("img/"), hashed.read_text())
+        self.assertEqual(
+            brotli.decompress(
+                (self.root / f"{paths['css/extra.css']}.br").read_bytes()
+            ),
+            hashed.read_bytes(),
+        )
+        self.assertEqual(
+            gzip.decompress((self.root / f"{paths['css/extra.css']}.gz").read_bytes()),
+            hashed.read_bytes(),
+        )
+        # tiny files are not compressed
+        self.assertFalse((self.root / f"{paths['img/dot.svg']}.br").exists())
+
+    def test_only_changed_files_are_compressed_again(self):
+        self.collectstatic()
+        with mock.patch.object(
+            static_storage, "compress_static", wraps=static_storage.compress_static
+        ) as compress:
+            self.collectstatic()
+            compress.assert_not_called()
+            (self.source / "css" / "extra.css").write_text(CSS + "a { color: red; }")
+            paths = self.collectstatic()
+        self.assertEqual(
+            {call.args[1] for call in compress.call_args_list}, {"br", "gzip"}
+        )
+        self.assertEqual(compress.call_count, 2)  # br and gzip of the changed file
+        self.assertTrue((self.root / f"{paths['css/extra.css']}.br").exists())
+
+    def test_hashed_file_is_immutable(self):
+        paths = self.collectstatic()
+        response = self.client.get(
+            f"/static/{paths['css/extra.css']}", headers={"accept-encoding": "br, gzip"}
+        )
+        self.assertEqual(response["Content-Encoding"], "br")
+        self.assertIn("immutable", response["Cache-Control"])
+        self.assertIn("text/css", response["Content-Type"])
+        self.assertEqual(
+            brotli.decompress(response.content),
+            (self.root / paths["css/extra.css"]).read_bytes(),
+        )
+        response = self.client.get("/static/css/extra.css")
+        self.assertNotIn("Content-Encoding", response)
+        self.assertNotIn("immutable", response["Cache-Control"])
+        self.assertEqual(self.client.get("/static/../settings.py").status_code, 404)
+        self.assertEqual(self.client.get("/static/css/none.css").status_code, 404)
+
+    @override_settings(PAGE_CACHE_TIMEOUT=0)
+    def test_critical_css_is_inlined(self):
+        paths = self.collectstatic()
+        response = self.client.get("/")
+        self.assertContains(response, "<style>")
+        self.assertNotContains(response, 'rel="stylesheet"')
+        with override_settings(STATIC_INLINE_CSS_MAX_SIZE=100):
+            response = self.client.get("/")
+        self.assertContains(response, f'href="/static/{paths["css/styles.css"]}"')
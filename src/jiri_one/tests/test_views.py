@@ -1,7 +1,24 @@
-from django.test import TestCase
+from concurrent.futures import ThreadPoolExecutor
+from datetime import timedelta
+from importlib import import_module
+from threading import Barrier
+from time import sleep
+from unittest import mock
+
+from django.conf import settings
+from django.core.cache import cache, caches
+from django.core.cache.utils import make_template_fragment_key
+from django.core.management import call_command
+from django.db import DatabaseError, connection, connections
+from django.test import TestCase, TransactionTestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from django.utils import timezone
 
 # from django.db.models.query import QuerySet
-from jiri_one.models import Author, Post
+from jiri_one import rate_limit
+from jiri_one.models import Author, Comment, Post, RateLimitBucket, Tag
+from jiri_one.rate_limit import SEARCH_LIMIT
+from jiri_one.tags import get_tag_registry, invalidate_tag_registry
 
 
 def create_post(title_cze: str, content_cze: str) -> Post:
@@ -16,6 +33,9 @@ def create_post(title_cze: str, content_cze: str) -> Post:
 
 
 class PostModelTests(TestCase):
+    def setUp(self):
+        cache.clear()
+
     def test_post_is_displayed(self):
         """Post is displayed on the index page."""
         post = create_post(title_cze="Test", content_cze="Test content.")
@@ -25,3 +45,628 @@ class PostModelTests(TestCase):
             response.context["posts"],
             [post],
         )
+
+    def test_search_is_displayed_with_snippet(self):
+        """Search results contain only matching posts with highlighted snippet."""
+        post = create_post(title_cze="Linux", content_cze="<p>Používám Arch Linux.</p>")
+        create_post(title_cze="Knihy", content_cze="<p>Čtu knihy.</p>")
+        response = self.client.get("/hledej/linux/")
+        self.assertQuerySetEqual(response.context["posts"], [post])
+        self.assertContains(response, "Používám Arch <mark>Linux</mark>")
+
+    def test_search_vector_is_updated_with_searched_fields(self):
+        post = create_post(title_cze="Linux", content_cze="<p>Obsah</p>")
+        with CaptureQueriesContext(connection) as queries:
+            post.save(update_fields=["pub_time"])
+        self.assertFalse(any("search_vector" in q["sql"] for q in queries))
+        post.title_cze = "Kernel"
+        post.save(update_fields=["title_cze"])
+        self.assertTrue(Post.objects.filter(search_vector="kernel").exists())
+
+    def test_search_vector_is_saved_with_post(self):
+        post = create_post(title_cze="Linux", content_cze="<p>Obsah</p>")
+        post.title_cze = "Kernel"
+        with (
+            mock.patch("jiri_one.models.post_search_vector", side_effect=DatabaseError),
+            self.assertRaises(DatabaseError),
+        ):
+            post.save()
+        self.assertEqual(Post.objects.get(pk=post.pk).title_cze, "Linux")
+
+    def test_migration_fills_search_vectors(self):
+        """Vectors of existing posts from migration are the same like from save."""
+        migration = import_module("jiri_one.migrations.0004_post_search_vector")
+        create_post(title_cze="Linux", content_cze="<p>Používám Arch Linux.</p>")
+        vector = Post.objects.values_list("search_vector", flat=True).get()
+        Post.objects.update(search_vector=None)
+        with connection.cursor() as cursor:
+            cursor.execute(migration.FILL_SEARCH_VECTORS)
+        self.assertEqual(
+            Post.objects.values_list("search_vector", flat=True).get(), vector
+        )
+
+
+# queries of rendered pages are counted, not of cached ones
+@override_settings(PAGE_CACHE_TIMEOUT=0)
+class IndexPaginationTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.posts = [
+            create_post(title_cze=f"Post {nr}", content_cze=f"Content {nr}")
+            for nr in range(1, 3 * settings.POSTS_ON_PAGE + 3)
+        ]
+
+    def test_pages_are_seeked_by_id(self):
+        """Every page shows next POSTS_ON_PAGE posts ordered from the newest."""
+        newest_first = self.posts[::-1]
+        for page in range(1, 5):
+            response = self.client.get(f"/strana/{page}/")
+            start = (page - 1) * settings.POSTS_ON_PAGE
+            self.assertEqual(
+                response.context["posts"],
+                newest_first[start : start + settings.POSTS_ON_PAGE],
+            )
+            self.assertEqual(response.context["page_obj"].number, page)
+            self.assertEqual(response.context["page_obj"].paginator.num_pages, 4)
+            self.assertEqual(response.context["page_obj"].has_next(), page < 4)
+
+    def test_page_out_of_range_is_last_page(self):
+        response = self.client.get("/page/999/")
+        self.assertEqual(response.context["page_obj"].number, 4)
+        self.assertEqual(response.context["posts"], self.posts[1::-1])
+
+    def test_deep_page_costs_same_as_first_page(self):
+        self.client.get("/")  # page index is cached now
+        with CaptureQueriesContext(connection) as first_page_queries:
+            self.client.get("/")
+        with CaptureQueriesContext(connection) as deep_page_queries:
+            self.client.get("/strana/3/")
+        self.assertEqual(len(first_page_queries), len(deep_page_queries))
+        # page is seeked, there is no OFFSET and no list of all ids
+        sqls = [query["sql"] for query in deep_page_queries]
+        self.assertTrue(any("LIMIT 11" in sql for sql in sqls))
+        self.assertFalse(any("OFFSET" in sql for sql in sqls))
+
+    def test_new_post_invalidates_page_index(self):
+        self.client.get("/strana/2/")
+        new_post = create_post(title_cze="Newest", content_cze="Newest content")
+        response = self.client.get("/strana/1/")
+        self.assertEqual(response.context["posts"][0], new_post)
+        response = self.client.get("/strana/4/")
+        self.assertEqual(response.context["posts"], self.posts[2::-1])
+
+    def test_tag_listing(self):
+        tag = Tag.objects.create(name_cze="Linux", desc_cze="Linux", order=1)
+        tagged = self.posts[5:20]
+        for post in tagged:
+            post.tags.add(tag)
+        response = self.client.get("/tag/linux/page/2/")
+        self.assertEqual(response.context["posts"], tagged[4::-1])
+        self.assertEqual(response.context["page_obj"].paginator.num_pages, 2)
+
+    def test_search_pages_are_seeked_by_rank(self):
+        """All search results can be reached, ranks (float4) are exact cursors."""
+        found = [
+            # different and same ranks (ties are ordered by id)
+            create_post(title_cze=f"Found {nr}", content_cze="linux " * (nr % 7 + 1))
+            for nr in range(25)
+        ]
+        seen = []
+        for page in range(1, 4):
+            response = self.client.get(f"/hledej/linux/strana/{page}/")
+            self.assertEqual(response.context["page_obj"].paginator.num_pages, 3)
+            seen += response.context["posts"]
+        self.assertEqual(len(seen), len(found))
+        self.assertEqual(set(seen), set(found))
+        ranks = [post.search_rank for post in seen]
+        self.assertEqual(ranks, sorted(ranks, reverse=True))
+
+
+# queries of rendered pages are counted, not of cached ones
+@override_settings(PAGE_CACHE_TIMEOUT=0)
+class IndexQueriesTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.tags = [
+            Tag.objects.create(name_cze=f"Tag {nr}", desc_cze="Desc", order=nr)
+            for nr in range(1, 4)
+        ]
+
+    def create_tagged_posts(self, count: int):
+        for _ in range(count):
+            nr = Post.objects.count()
+            post = create_post(title_cze=f"Post {nr}", content_cze="Content")
+            post.tags.add(*self.tags)
+
+    def count_index_queries(self) -> int:
+        self.client.get("/")  # warm up cached page index
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.get("/")
+        self.assertContains(response, '<a href="/tag/tag-1">Tag 1</a>')
+        return len(queries)
+
+    def test_index_queries_do_not_depend_on_page_size(self):
+        """Tags of all posts on page are loaded at once, not per post."""
+        self.create_tagged_posts(1)
+        one_post_queries = self.count_index_queries()
+        self.create_tagged_posts(settings.POSTS_ON_PAGE - 1)
+        self.assertEqual(self.count_index_queries(), one_post_queries)
+        with self.settings(POSTS_ON_PAGE=3):
+            self.assertEqual(self.count_index_queries(), one_post_queries)
+
+
+# queries of rendered pages are counted, not of cached ones
+@override_settings(PAGE_CACHE_TIMEOUT=0)
+class TagRegistryTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.tag = Tag.objects.create(
+            name_cze="Knihy", name_eng="Books", desc_cze="Knihy", order=1
+        )
+        self.post = create_post(title_cze="Post", content_cze="Content")
+        self.post.tags.add(self.tag)
+
+    def test_tags_are_served_from_memory(self):
+        self.client.get("/tag/books/")  # registry and page index are built
+        # only posts on page and their tags, no query for navigation or tag lookup
+        with self.assertNumQueries(2):
+            response = self.client.get("/tag/books/")
+        self.assertEqual(response.context["tag"], self.tag)
+        self.assertEqual(response.context["posts"], [self.post])
+
+    def test_registry_is_invalidated(self):
+        self.client.get("/")
+        self.tag.name_cze = "Romány"
+        self.tag.save()
+        Tag.objects.create(name_cze="Linux", desc_cze="Linux", order=2)
+        response = self.client.get("/")
+        self.assertContains(response, "/tag/romany")
+        self.assertContains(response, '<a href="/tag/linux">Linux</a>')
+
+        other_post = create_post(title_cze="Other", content_cze="Content")
+        other_post.tags.add(self.tag)
+        registry = get_tag_registry()
+        self.assertEqual(registry.post_counts[self.tag.pk], 2)
+
+    def test_navigation_fragment_is_versioned(self):
+        self.client.get("/")
+        fragments = caches["template_fragments"]
+        old_key = make_template_fragment_key("nav_tags", [get_tag_registry().version])
+        self.assertIn("/tag/knihy", fragments.get(old_key))
+        Tag.objects.bulk_create(  # no signals
+            [Tag(name_cze="Linux", url_cze="linux", desc_cze="Linux", order=2)]
+        )
+        self.assertNotContains(self.client.get("/"), "/tag/linux")
+        invalidate_tag_registry()
+        self.assertContains(self.client.get("/"), "/tag/linux")
+        new_key = make_template_fragment_key("nav_tags", [get_tag_registry().version])
+        self.assertNotEqual(new_key, old_key)
+        self.assertIn("/tag/linux", fragments.get(new_key))
+
+
+class PageCacheTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.posts = [
+            create_post(title_cze=f"Post {nr}", content_cze=f"Content {nr}")
+            for nr in range(1, 2 * settings.POSTS_ON_PAGE + 1)
+        ]
+
+    def get_cached(self, path: str, status: str):
+        """Get page and check if it is from cache (HIT) or rendered (MISS)."""
+        response = self.client.get(path)
+        self.assertEqual(response["X-Page-Cache"], status)
+        return response
+
+    def test_pages_are_cached(self):
+        for path in ["/", "/strana/2/", "/hledej/post/"]:
+            self.get_cached(path, "MISS")
+            with self.assertNumQueries(0):
+                self.get_cached(path, "HIT")
+        # only validators (ETag) of post are loaded
+        self.get_cached(f"/{self.posts[0].url_cze}/", "MISS")
+        with self.assertNumQueries(1):
+            self.get_cached(f"/{self.posts[0].url_cze}/", "HIT")
+
+    def test_query_string_is_not_in_key(self):
+        """Unknown query parameters can't fill the cache with copies of page."""
+        self.get_cached("/", "MISS")
+        for query in ["?x=1", "?x=2", "?lang=eng"]:
+            self.get_cached(f"/{query}", "HIT")
+
+    def test_made_up_paths_are_not_cached(self):
+        """Random searches, tags and page numbers can't evict valid pages."""
+        self.get_cached("/", "MISS")
+        self.get_cached("/hledej/post/", "MISS")
+        shared = caches["shared"]
+        entries = len(shared._list_cache_files())
+        for path in [
+            "/hledej/nic/",  # without results
+            "/hledej/Post/",  # not normalized
+            f"/hledej/{'post' * 30}/",  # too long
+            "/tag/neexistuje/",
+            "/strana/99/",  # the last page
+        ]:
+            self.get_cached(path, "MISS")
+            self.get_cached(path, "MISS")
+        response = self.client.get("/neexistujici-prispevek/")
+        self.assertEqual(response.status_code, 404)
+        self.assertFalse(response.has_header("X-Page-Cache"))
+        self.assertEqual(len(shared._list_cache_files()), entries)
+
+    def test_csrf_token_is_valid_in_cached_page(self):
+        post = self.posts[0]
+        path = f"/{post.url_cze}/"
+        self.client.get(path)
+        client = self.client_class(enforce_csrf_checks=True)
+        response = client.get(path)
+        self.assertEqual(response["X-Page-Cache"], "HIT")
+        self.assertNotContains(response, "CSRF_TOKEN_PLACEHOLDER")
+        token = response.content.decode().split('name="csrfmiddlewaretoken" value="')[1]
+        token = token.split('"')[0]
+        response = client.post(
+            path,
+            {
+                "csrfmiddlewaretoken": token,
+                "antispam": "5",
+                "comment_header": "Header",
+                "comment_nick": "Nick",
+                "comment_content": "Content",
+            },
+        )
+        self.assertEqual(response.status_code, 302)
+        self.assertEqual(post.comments.count(), 1)
+        # comment is shown immediately
+        response = self.get_cached(path, "MISS")
+        self.assertContains(response, "Nick")
+
+    def test_comment_invalidates_only_pages_with_post(self):
+        paths = [
+            "/",
+            "/strana/2/",
+            f"/{self.posts[0].url_cze}/",
+            f"/{self.posts[-1].url_cze}/",
+        ]
+        for path in paths:
+            self.client.get(path)
+        Comment.objects.create(
+            post=self.posts[-1], title="Title", nick="Nick", content="Content"
+        )
+        # the newest post is on the first page
+        self.get_cached("/", "MISS")
+        self.get_cached(f"/{self.posts[-1].url_cze}/", "MISS")
+        self.get_cached("/strana/2/", "HIT")
+        self.get_cached(f"/{self.posts[0].url_cze}/", "HIT")
+
+    def test_post_and_tag_changes_invalidate_pages(self):
+        post = self.posts[0]
+        self.client.get(f"/{post.url_cze}/")
+        self.client.get("/strana/2/")
+        other_post = self.posts[1]
+        other_post.content_cze = "Changed content"
+        other_post.save()
+        # any post can move to other page (or to search results)
+        self.get_cached("/strana/2/", "MISS")
+        self.get_cached(f"/{post.url_cze}/", "HIT")
+
+        tag = Tag.objects.create(name_cze="Linux", desc_cze="Linux", order=1)
+        response = self.get_cached(f"/{post.url_cze}/", "MISS")
+        self.assertContains(response, '<a href="/tag/linux">Linux</a>')
+        post.tags.add(tag)
+        response = self.get_cached(f"/{post.url_cze}/", "MISS")
+        self.assertContains(response, "Tagy: <a")
+
+
+class ConditionalGetTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.post = create_post(title_cze="Post", content_cze="Content")
+
+    def test_index_not_modified(self):
+        response = self.client.get("/")
+        etag = response["ETag"]
+        self.assertIn("no-cache", response["Cache-Control"])
+        with self.assertNumQueries(0):
+            response = self.client.get("/", headers={"if-none-match": etag})
+        self.assertEqual(response.status_code, 304)
+        self.assertEqual(response["ETag"], etag)
+        # other page has other ETag
+        response = self.client.get("/strana/2/", headers={"if-none-match": etag})
+        self.assertEqual(response.status_code, 200)
+
+        Comment.objects.create(
+            post=self.post, title="Title", nick="Nick", content="Content"
+        )
+        response = self.client.get("/", headers={"if-none-match": etag})
+        self.assertEqual(response.status_code, 200)
+        self.assertNotEqual(response["ETag"], etag)
+
+    def test_post_not_modified(self):
+        path = f"/{self.post.url_cze}/"
+        response = self.client.get(path)
+        etag, last_modified = response["ETag"], response["Last-Modified"]
+        # validators are computed in one query, the page is not rendered
+        with self.assertNumQueries(1):
+            response = self.client.get(path, headers={"if-none-match": etag})
+        self.assertEqual(response.status_code, 304)
+        response = self.client.get(path, headers={"if-modified-since": last_modified})
+        self.assertEqual(response.status_code, 304)
+
+        Comment.objects.create(
+            post=self.post, title="Title", nick="Nick", content="Content"
+        )
+        response = self.client.get(path, headers={"if-none-match": etag})
+        self.assertEqual(response.status_code, 200)
+        etag = response["ETag"]
+
+        Tag.objects.create(name_cze="Linux", desc_cze="Linux", order=1)
+        response = self.client.get(path, headers={"if-none-match": etag})
+        self.assertEqual(response.status_code, 200)
+        etag = response["ETag"]
+
+        self.post.content_cze = "New content"
+        self.post.save()
+        response = self.client.get(path, headers={"if-none-match": etag})
+        self.assertEqual(response.status_code, 200)
+        self.assertContains(response, "New content")
+
+
+@override_settings(PAGE_CACHE_TIMEOUT=0)
+class ExcerptTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        words = " ".join(f"word{nr}" for nr in range(settings.EXCERPT_WORDS * 2))
+        self.long_post = create_post(
+            title_cze="Long",
+            content_cze=f"<p><strong>Start</strong> <em>{words}</em> end</p>",
+        )
+        self.short_post = create_post(title_cze="Short", content_cze="<p>Short.</p>")
+
+    def test_excerpt_is_computed_on_save(self):
+        self.assertTrue(self.long_post.has_more_cze)
+        self.assertTrue(
+            self.long_post.excerpt_cze.startswith("<p><strong>Start</strong> <em>")
+        )
+        # tags are closed
+        self.assertTrue(self.long_post.excerpt_cze.endswith("…</em></p>"))
+        self.assertNotIn("end", self.long_post.excerpt_cze)
+        self.assertFalse(self.short_post.has_more_cze)
+        self.assertEqual(self.short_post.excerpt_cze, "<p>Short.</p>")
+
+        # excerpt is made from sanitized content
+        self.short_post.content_cze = "<p>Changed.</p><script>alert(1)</script>"
+        self.short_post.save(update_fields=["content_cze"])
+        self.short_post.refresh_from_db()
+        self.assertEqual(
+            self.short_post.excerpt_cze,
+            "<p>Changed.</p>&lt;script&gt;alert(1)&lt;/script&gt;",
+        )
+
+    def test_listing_shows_excerpts_without_contents(self):
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.get("/")
+        self.assertContains(
+            response, f'<a href="/{self.long_post.url_cze}">Číst dál</a>'
+        )
+        self.assertNotContains(
+            response, f'<a href="/{self.short_post.url_cze}">Číst dál</a>'
+        )
+        self.assertNotContains(response, "end</em>")
+        self.assertFalse(any("content_cze" in query["sql"] for query in queries))
+
+    def test_backfill_command(self):
+        Post.objects.update(excerpt_cze="", has_more_cze=False)
+        call_command("build_excerpts", batch_size=1)
+        self.long_post.refresh_from_db()
+        self.assertTrue(self.long_post.has_more_cze)
+        self.assertTrue(
+            self.long_post.excerpt_cze.startswith("<p><strong>Start</strong>")
+        )
+
+
+@override_settings(PAGE_CACHE_TIMEOUT=0)
+class CommentCountTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.post = create_post(title_cze="Post", content_cze="Content")
+
+    def create_comment(self) -> Comment:
+        return Comment.objects.create(
+            post=self.post, title="Title", nick="Nick", content="Content"
+        )
+
+    def assert_comment_count(self, count: int):
+        self.assertEqual(
+            Post.objects.values_list("comment_count", flat=True).get(pk=self.post.pk),
+            count,
+        )
+
+    def test_count_is_maintained(self):
+        comment = self.create_comment()
+        self.create_comment()
+        self.create_comment()
+        self.assert_comment_count(3)
+        # saved post has old count in memory, but it doesn't overwrite the column
+        self.post.title_cze = "New title"
+        self.post.save()
+        self.assert_comment_count(3)
+        comment.delete()
+        self.assert_comment_count(2)
+        Comment.objects.filter(post=self.post).delete()
+        self.assert_comment_count(0)
+
+    def test_comment_from_form_is_counted(self):
+        self.client.post(
+            f"/{self.post.url_cze}/",
+            {
+                "antispam": "5",
+                "comment_header": "Header",
+                "comment_nick": "Nick",
+                "comment_content": "Content",
+            },
+        )
+        self.assert_comment_count(1)
+
+    def test_listing_reads_column(self):
+        self.create_comment()
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.get("/")
+        self.assertContains(response, "Počet komentářů: 1")
+        self.assertFalse(any("jiri_one_comment" in query["sql"] for query in queries))
+
+    def test_reconcile_command(self):
+        self.create_comment()
+        Post.objects.update(comment_count=5)
+        call_command("reconcile_comment_counts", dry_run=True)
+        self.assert_comment_count(5)
+        call_command("reconcile_comment_counts")
+        self.assert_comment_count(1)
+
+
+class PostIdTests(TransactionTestCase):
+    def test_concurrent_posts_get_unique_ids(self):
+        """Posts created at once from many threads (connections) get different ids."""
+        threads, posts_in_thread = 8, 5
+        barrier = Barrier(threads)
+        create_post("Author is created", "Content").delete()
+
+        def create_posts(thread_nr: int) -> list[int]:
+            try:
+                barrier.wait()
+                return [
+                    create_post(f"Post {thread_nr}-{nr}", "Content").id
+                    for nr in range(posts_in_thread)
+                ]
+            finally:
+                connections.close_all()
+
+        with ThreadPoolExecutor(threads) as executor:
+            ids = [
+                id for ids in executor.map(create_posts, range(threads)) for id in ids
+            ]
+        self.assertEqual(len(set(ids)), threads * posts_in_thread)
+        self.assertEqual(Post.objects.count(), threads * posts_in_thread)
+
+    def test_deleted_id_is_not_reused(self):
+        first, second = (
+            create_post("First", "Content"),
+            create_post("Second", "Content"),
+        )
+        last_id = second.id
+        second.delete()
+        first.delete()
+        self.assertGreater(create_post("Third", "Content").id, last_id)
+
+
+class RateLimitTests(TransactionTestCase):
+    def setUp(self):
+        cache.clear()
+        self.post = create_post("Limitovaný příspěvek", "<p>Obsah</p>")
+
+    def send_comment(self, nick: str = "Nick", ip: str = "10.0.0.1"):
+        return self.client.post(
+            f"/{self.post.url_cze}/",
+            {
+                "antispam": "5",
+                "comment_header": "Header",
+                "comment_nick": nick,
+                "comment_content": "Content",
+            },
+            HTTP_X_FORWARDED_FOR=ip,
+        )
+
+    @override_settings(SEARCH_RATE_LIMIT=(5, 60 * 60))
+    def test_concurrent_burst_takes_only_capacity(self):
+        """Requests at once from many threads (connections) can't take more tokens."""
+        threads = 20
+        barrier = Barrier(threads)
+        key = SEARCH_LIMIT.bucket_key("ip", "10.0.0.1")
+
+        def take_token(_nr: int) -> bool:
+            try:
+                barrier.wait()
+                return SEARCH_LIMIT.take_tokens([key])
+            finally:
+                connections.close_all()
+
+        with ThreadPoolExecutor(threads) as executor:
+            allowed = list(executor.map(take_token, range(threads)))
+        self.assertEqual(allowed.count(True), 5)
+        self.assertLess(RateLimitBucket.objects.get(key=key).tokens, 1)
+
+    @override_settings(SEARCH_RATE_LIMIT=(2, 1))
+    def test_bucket_is_refilled(self):
+        key = SEARCH_LIMIT.bucket_key("ip", "10.0.0.2")
+        self.assertTrue(SEARCH_LIMIT.take_tokens([key]))
+        self.assertTrue(SEARCH_LIMIT.take_tokens([key]))
+        self.assertFalse(SEARCH_LIMIT.take_tokens([key]))
+        sleep(0.6)  # 2 tokens per second
+        self.assertTrue(SEARCH_LIMIT.take_tokens([key]))
+        self.assertFalse(SEARCH_LIMIT.take_tokens([key]))
+
+    @override_settings(SEARCH_RATE_LIMIT=(1, 60 * 60))
+    def test_spoofed_forwarded_for_doesnt_reset_bucket(self):
+        statuses = [
+            self.client.get(
+                f"/hledej/linux{nr}/",  # not from page cache
+                HTTP_X_FORWARDED_FOR=f"10.0.0.{nr}",
+                REMOTE_ADDR="10.1.1.1",  # not trusted proxy
+            ).status_code
+            for nr in range(5)
+        ]
+        self.assertEqual(statuses, [200, 429, 429, 429, 429])
+        self.assertEqual(
+            list(
+                RateLimitBucket.objects.filter(key__startswith="search:").values_list(
+                    "key", flat=True
+                )
+            ),
+            [SEARCH_LIMIT.bucket_key("ip", "10.1.1.1")],
+        )
+        # from trusted proxy only the entry appended by the proxy is used
+        response = self.client.get(
+            "/hledej/python/", HTTP_X_FORWARDED_FOR="10.1.1.1, 10.0.0.7"
+        )
+        self.assertEqual(response.status_code, 200)
+
+    @override_settings(SEARCH_RATE_LIMIT=(1, 60))
+    def test_full_buckets_are_pruned(self):
+        stale_key = SEARCH_LIMIT.bucket_key("ip", "10.0.0.3")
+        key = SEARCH_LIMIT.bucket_key("ip", "10.0.0.4")
+
+        def create_stale_bucket():
+            RateLimitBucket.objects.create(
+                key=stale_key, tokens=0, updated=timezone.now() - timedelta(hours=1)
+            )
+
+        create_stale_bucket()
+        rate_limit._pruned.clear()  # the first check of the process prunes
+        self.assertTrue(SEARCH_LIMIT.take_tokens([key]))
+        self.assertFalse(RateLimitBucket.objects.filter(key=stale_key).exists())
+        create_stale_bucket()  # the next pruning is after PRUNE_INTERVAL
+        self.assertFalse(SEARCH_LIMIT.take_tokens([key]))
+        self.assertTrue(RateLimitBucket.objects.filter(key=stale_key).exists())
+        self.assertTrue(RateLimitBucket.objects.filter(key=key).exists())
+
+    @override_settings(COMMENT_RATE_LIMIT=(2, 60 * 60))
+    def test_comments_from_form_are_limited_per_ip_and_nick(self):
+        self.assertEqual(self.send_comment().status_code, 302)
+        self.assertEqual(self.send_comment(nick="Other").status_code, 302)
+        self.assertEqual(self.send_comment(nick="Third").status_code, 429)
+        # the same nick from other IP
+        self.assertEqual(self.send_comment(ip="10.0.0.9").status_code, 302)
+        self.assertEqual(self.send_comment(ip="10.0.0.10").status_code, 429)
+        self.assertEqual(Comment.objects.filter(post=self.post).count(), 3)
+
+    @override_settings(POST_COMMENT_RATE_LIMIT=(1, 60 * 60))
+    def test_comments_of_post_are_limited(self):
+        self.assertEqual(self.send_comment().status_code, 302)
+        self.assertEqual(
+            self.send_comment(nick="Other", ip="10.0.0.2").status_code, 429
+        )
+
+    @override_settings(SEARCH_RATE_LIMIT=(1, 60 * 60), PAGE_CACHE_TIMEOUT=0)
+    def test_search_is_limited(self):
+        self.assertEqual(self.client.get("/hledej/obsah/").status_code, 200)
+        self.assertEqual(self.client.get("/search/obsah/").status_code, 429)
+        self.assertEqual(self.client.get("/").status_code, 200)
@@ -1,8 +1,8 @@
 from django.urls import path
 from django.views.decorators.csrf import csrf_exempt
-from graphene_django.views import GraphQLView
 
 from . import views
+from .graphql_view import AsyncGraphQLView
 
 app_name = "jiri_one"
 urlpatterns = [
@@ -19,6 +19,7 @@ urlpatterns = [
     path("hledej/<str:hledej>/strana/<int:strana>/", views.IndexView.as_view()),
     path("hledej/<str:hledej>/page/<int:page>/", views.IndexView.as_view()),
     path("deploy_api/", views.DeployApiView.as_view()),
+    path("deploy_api/jobs/<int:job_id>/", views.DeployJobView.as_view()),
     path("<slug:url_cze>/", views.PostView.as_view()),
-    path("graphql", csrf_exempt(GraphQLView.as_view(graphiql=True))),
+    path("graphql", csrf_exempt(AsyncGraphQLView.as_view(graphiql=True))),
 ]
@@ -1,51 +1,71 @@
 import hmac
 import json
+import mimetypes
+from collections.abc import Iterable
 from hashlib import sha256
-from ipaddress import ip_address, ip_network
-from subprocess import Popen
+from ipaddress import ip_address
+from logging import getLogger
+from pathlib import Path
+from time import time_ns
 
-import httpx
+from asgiref.sync import sync_to_async
 from django.conf import settings
-from django.core.paginator import Paginator
-from django.db.models import Count, Q, QuerySet
+from django.contrib.staticfiles.storage import staticfiles_storage
+from django.core.exceptions import SuspiciousFileOperation
+from django.db.models import QuerySet
 from django.http import (
+    Http404,
     HttpRequest,
     HttpResponse,
+    HttpResponseBadRequest,
     HttpResponseForbidden,
     HttpResponseServerError,
+    JsonResponse,
 )
-from django.shortcuts import redirect, render
+from django.shortcuts import redirect
+from django.utils.cache import patch_cache_control, patch_vary_headers
 from django.utils.decorators import method_decorator
 from django.utils.encoding import force_bytes
 from django.views import View
 from django.views.decorators.csrf import csrf_exempt
 
 # internal imports
-from jiri_one.models import Comment, Post, Tag
-
-# helper variables
-TagDoesNotExist = Tag.DoesNotExist
-
+from jiri_one.client_ip import get_request_ip
+from jiri_one.compression import accepted_encodings
+from jiri_one.conditional import (
+    aget_listing_validators,
+    aget_post_validators,
+    set_page_validators,
+)
+from jiri_one.dependencies import (
+    comments_dependency,
+    instance_dependency,
+    list_dependency,
+)
+from jiri_one.excerpts import LISTING_DEFERRED_FIELDS
+from jiri_one.github_hooks import aget_hook_networks
+from jiri_one.models import Comment, DeployJob, Post, Tag
+from jiri_one.page_cache import aget_cached_page, arender_cached_page
+from jiri_one.pagination import KeysetPaginator
+from jiri_one.rate_limit import aallow_comment, aallow_search
+from jiri_one.releases import DeployError, enqueue_deploy, start_deploy_worker
+from jiri_one.search import (
+    MAX_CACHED_SEARCH_LENGTH,
+    asearch_posts,
+    normalize_search,
+    render_snippet,
+)
+from jiri_one.static_storage import COMPRESSED_SUFFIXES, get_hashed_names
+from jiri_one.tags import aget_tag_registry
 
-async def get_post_html_tags(post_tags: QuerySet[Tag]):
-    """From tags of post create HTML"""
-    tags_links = []
-    async for tag in post_tags.values():
-        tags_links.append(f"""<a href="/tag/{tag["url_cze"]}">{tag["name_cze"]}</a>""")
-    return ", ".join(tags_links)
+logger = getLogger("jiri_one")
 
 
-async def get_all_html_tags():
-    nr_of_tags: int = await Tag.objects.acount()
-    html_tags: str = ""
-    index = 0
-    async for tag in Tag.objects.all():
-        if index == nr_of_tags - 1:
-            html_tags += f'<a href="/tag/{tag.url_cze}">{tag.name_cze}</a>'
-        else:
-            html_tags += f'<a style="border-bottom: 1px solid #3c67be;" href="/tag/{tag.url_cze}">{tag.name_cze}</a>'
-        index += 1
-    return html_tags
+def get_post_html_tags(post_tags: Iterable[Tag]) -> str:
+    """From tags of post create HTML (tags should be prefetched, so there is no query)"""
+    return ", ".join(
+        f"""<a href="/tag/{tag.url_cze}">{tag.name_cze}</a>""" for tag in post_tags
+    )
 
 
 class PostView(View):
@@ -55,18 +75,45 @@ class PostView(View):
 
     async def get(self, request, url_cze, *args, **kwargs):
         """GET method to show one Post."""
+        validators = await aget_post_validators(request, url_cze)
+        if validators is not None:
+            if not_modified := validators.not_modified_response(request):
+                return not_modified
+            if cached_page := await aget_cached_page(request):
+                return set_page_validators(cached_page, validators)
+        created = time_ns()
         try:
-            post = await Post.objects.select_related("author").aget(url_cze=url_cze)
+            post = (
+                await Post.objects.select_related("author")
+                .prefetch_related("tags")
+                .aget(url_cze=url_cze)
+            )
         except Post.DoesNotExist:
             return HttpResponseServerError("This post does not exist.", status=404)
-        all_tags_html = await get_all_html_tags()
-        post.html_tags = await get_post_html_tags(Tag.objects.filter(post=post))
+        tag_registry = await aget_tag_registry()
+        post.html_tags = get_post_html_tags(post.tags.all())
         comments = [comment async for comment in Comment.objects.filter(post=post)]
-        return render(
+        # page depends on the post (with its tags), its comments and tags in navigation
+        dependencies = {
+            instance_dependency(post),
+            comments_dependency(post.pk),
+            list_dependency(Tag),
+        }
+        response = await arender_cached_page(
             request,
             self.template_name,
-            {"post": post, "comments": comments, "all_tags": all_tags_html},
+            {
+                "post": post,
+                "comments": comments,
+                "all_tags": tag_registry.html,
+                "tags_version": tag_registry.version,  # key of navigation fragment
+            },
+            dependencies,
+            created,
         )
+        if validators is None:  # post was created meanwhile
+            return response
+        return set_page_validators(response, validators)
 
     async def post(self, request, url_cze, *args, **kwargs):
         """POST method for save comment."""
@@ -88,6 +135,13 @@ class PostView(View):
         header = request.POST.get("comment_header")
         nick = request.POST.get("comment_nick")
         content = request.POST.get("comment_content")
+        if not await aallow_comment(get_request_ip(request), nick or "", post.pk):
+            logger.warning(
+                f"Comment rate limit exceeded for IP {get_request_ip(request)}"
+            )
+            return HttpResponse(
+                "Příliš mnoho komentářů, zkuste to prosím později.", status=429
+            )
         await Comment.objects.acreate(
             post=post, title=header, nick=nick, content=content
         )
@@ -100,61 +154,101 @@ class IndexView(View):
     template_name = "index.html"
 
     async def get(self, request: HttpRequest, *args, **kwargs):
-        queryset: QuerySet = (
-            Post.objects.select_related("author")
-            .annotate(Count("comments"))
-            .order_by("-id")
-        )  # lazy object - will not access DB
-        all_tags_html = await get_all_html_tags()
+        validators = await aget_listing_validators(request)
+        if not_modified := validators.not_modified_response(request):
+            return not_modified
+        if cached_page := await aget_cached_page(request):
+            return set_page_validators(cached_page, validators)
+        created = time_ns()
+        # only filters and ordering here, because from this queryset is computed page index too
+        # lazy object - will not access DB
+        queryset: QuerySet = Post.objects.order_by("-id")
+        # which posts are listed, it is part of page index cache key (None isn't cached)
+        listing: str | None = "all"
+        # only canonical paths of existing pages are cached, see arender_cached_page
+        cacheable = True
+        tag_registry = await aget_tag_registry()
 
         # get tag
         tag: None | Tag = None
         if "tag" in kwargs:
-            try:  # try to find Tag in czech url
-                tag = await Tag.objects.aget(url_cze=kwargs["tag"])
-            except TagDoesNotExist:
-                # we didn't find Tag by czech, we will try english
-                try:
-                    tag = await Tag.objects.aget(url_eng=kwargs["tag"])
-                except TagDoesNotExist:
-                    assert tag is None
-                    # TODO: some log here
+            # czech url has priority, then english
+            tag = tag_registry.get(kwargs["tag"])
+            # TODO: some log here, if tag is None
             if tag is not None:
                 queryset = queryset.filter(tags=tag)
+                listing = f"tag:{tag.pk}"
                 # TODO: now we are handle only one tag, in the future, we should handle combinations
+            else:
+                cacheable = False
 
         # get search
+        search: str | None = None
         if "search" in kwargs or "hledej" in kwargs:
             search_cze: str | None = kwargs.get("hledej")
             search_eng: str | None = kwargs.get("search")
             default_search = None
-            search: str | None = search_cze or search_eng or default_search
+            search = search_cze or search_eng or default_search
             if search is not None:
-                queryset = queryset.filter(
-                    Q(content_cze__icontains=search) | Q(title_cze__icontains=search)
-                )
+                if not await aallow_search(get_request_ip(request)):
+                    logger.warning(
+                        f"Search rate limit exceeded for IP {get_request_ip(request)}"
+                    )
+                    return HttpResponse(
+                        "Příliš mnoho hledání, zkuste to prosím později.", status=429
+                    )
+                # ordered by relevance, not by id
+                queryset = await asearch_posts(queryset, search)
+                normalized_search = normalize_search(search)
+                if len(normalized_search) > MAX_CACHED_SEARCH_LENGTH:
+                    listing = None
+                    cacheable = False
+                else:
+                    listing = f"{listing}:search:{normalized_search}"
+                    cacheable = cacheable and search == normalized_search
         # get the page number
         page_cze: int | None = kwargs.get("strana")
         page_eng: int | None = kwargs.get("page")
         default_page: int = 1
         current_page = page_cze or page_eng or default_page
 
-        # get posts from current_page
-        post_id_list = [id async for id in queryset.values_list("id", flat=True)]
-        paginator = Paginator(post_id_list, settings.POSTS_ON_PAGE)
-        page_obj = paginator.get_page(current_page)
-        post_ids_on_current_page = page_obj.object_list
-        queryset = queryset.filter(id__in=post_ids_on_current_page)
+        # get posts from current_page (only POSTS_ON_PAGE + 1 rows are fetched)
+        paginator = KeysetPaginator(queryset, listing)
+        page_obj = await paginator.aget_page(
+            current_page,
+            # tags of all posts on page are loaded in one query
+            queryset.select_related("author")
+            .prefetch_related("tags")
+            .defer(*LISTING_DEFERRED_FIELDS),  # excerpts are shown
+        )
         posts = list[Post]()
-        async for post in queryset.all():
-            post.html_tags = await get_post_html_tags(post.tags)
+        for post in page_obj:
+            post.html_tags = get_post_html_tags(post.tags.all())
+            if search is not None:
+                post.search_snippet = render_snippet(post.search_headline)
             posts.append(post)
 
-        return render(
+        # any change of posts can change the listing (new post, search), tags are in
+        # navigation and comments only of posts on page (nr of comments)
+        dependencies = {list_dependency(Post), list_dependency(Tag)}
+        dependencies.update(comments_dependency(post.pk) for post in posts)
+        response = await arender_cached_page(
             request,
             self.template_name,
-            {"page_obj": page_obj, "posts": posts, "all_tags": all_tags_html},
+            {
+                "page_obj": page_obj,
+                "posts": posts,
+                "all_tags": tag_registry.html,
+                "tags_version": tag_registry.version,  # key of navigation fragment
+                "tag": tag,
+                "searched_word": search,
+            },
+            dependencies,
+            created,
+            # pages without posts and clamped page numbers (/strana/999/) aren't cached
+            cacheable=cacheable and bool(posts) and page_obj.number == current_page,
         )
+        return set_page_validators(response, validators)
 
     async def post(self, request: HttpRequest, *args, **kwargs):
         searched_word = request.POST.get("search")
@@ -166,20 +260,22 @@ class IndexView(View):
 class DeployApiView(View):
     """Class for automatic deployment new code from GitHub repository."""
 
-    def post(self, request: HttpRequest, *args, **kwargs):
+    async def post(self, request: HttpRequest, *args, **kwargs):
         # if I don't have SECRET_GITHUB_KEY, I can't compare anything
         if not hasattr(settings, "SECRET_GITHUB_KEY"):
             return HttpResponseServerError("Problem on server side!", status=501)
         # Verify if request came from GitHub
-        forwarded_for = request.META.get("HTTP_X_FORWARDED_FOR")
-        assert forwarded_for is not None
-        req_ip_address = ip_address(forwarded_for)  # get real IP adress
-        whitelist = httpx.get("https://api.github.com/meta").json()["hooks"]
+        try:
+            req_ip_address = ip_address(get_request_ip(request))  # get real IP adress
+        except ValueError:
+            return HttpResponseForbidden("Bad IP address! Permission denied.")
+        hook_networks = await aget_hook_networks()
+        if hook_networks is None:
+            return HttpResponseServerError(
+                "GitHub IP ranges are not available!", status=503
+            )
         # check if req_ip_address is in ip network range
-        for valid_ip in whitelist:
-            if req_ip_address in ip_network(valid_ip):
-                break
-        else:
+        if req_ip_address not in hook_networks.trie:
             return HttpResponseForbidden("Bad IP address! Permission denied.")
         # check if request is signed with GITHUB_WEBHOOK_KEY
         header_signature = request.META.get("HTTP_X_HUB_SIGNATURE_256")
@@ -205,12 +301,83 @@ class DeployApiView(View):
             request_body = json.loads(request.body)
             if "tags" in request_body["ref"]:
                 commit_with_tag = request_body["after"]
-                Popen(
-                    f"poetry run python manage.py redeploy {commit_with_tag}",
-                    shell=True,
-                )
-                return HttpResponse("redeploy called")
+                try:
+                    job = await sync_to_async(enqueue_deploy)(commit_with_tag)
+                except DeployError as e:
+                    return HttpResponseBadRequest(str(e))
+                start_deploy_worker()
+                return JsonResponse(deploy_job_data(job), status=202)
             else:
                 return HttpResponse("Noticed, but it is not new tag to redeploy code.")
         # In case we receive an event that's not ping or push
         return HttpResponse(status=204)
+
+
+def deploy_job_data(job: DeployJob) -> dict:
+    return {
+        "job": job.pk,
+        "commit": job.commit,
+        "status": job.status,
+        "requests": job.requests,
+        "created": job.created.isoformat(),
+        "started": job.started and job.started.isoformat(),
+        "finished": job.finished and job.finished.isoformat(),
+        "status_url": f"/deploy_api/jobs/{job.pk}/",
+    }
+
+
+class DeployJobView(View):
+    """Status of deploy job (its log is only in admin)."""
+
+    async def get(self, request: HttpRequest, job_id: int, *args, **kwargs):
+        try:
+            job = await DeployJob.objects.aget(pk=job_id)
+        except DeployJob.DoesNotExist:
+            return JsonResponse({"error": "Deploy job does not exist."}, status=404)
+        return JsonResponse(deploy_job_data(job))
+
+
+class StaticFileView(View):
+    """Static files (without web server in front), hashed ones are cached forever."""
+
+    def get(self, request: HttpRequest, path: str, *args, **kwargs):
+        storage = staticfiles_storage
+        try:
+            full_path = Path(storage.path(path))
+        except SuspiciousFileOperation:
+            raise Http404("Static file does not exist.") from None
+        if not full_path.is_file():
+            raise Http404("Static file does not exist.")
+        content_type, _ = mimetypes.guess_type(path)
+        encodings = accepted_encodings(request.headers.get("Accept-Encoding", ""))
+        encoding = next(
+            (
+                encoding
+                for encoding in encodings
+                if full_path.with_name(
+                    full_path.name + COMPRESSED_SUFFIXES[encoding]
+                ).is_file()
+            ),
+            None,
+        )
+        if encoding is not None:  # precompressed by collectstatic
+            full_path = full_path.with_name(
+                full_path.name + COMPRESSED_SUFFIXES[encoding]
+            )
+        response = HttpResponse(
+            full_path.read_bytes(),
+            content_type=content_type or "application/octet-stream",
+        )
+        if encoding is not None:
+            response["Content-Encoding"] = encoding
+        patch_vary_headers(response, ("Accept-Encoding",))
+        if path in get_hashed_names():
+            patch_cache_control(
+                response,
+                public=True,
+                max_age=settings.STATIC_IMMUTABLE_MAX_AGE,
+                immutable=True,
+            )
+        else:  # names without hash can change with deploy
+            patch_cache_control(response, public=True, max_age=settings.STATIC_MAX_AGE)
+        return response